@@ -2,12 +2,14 @@
 
 import streamlit as st
 import pandas as pd
+from datetime import date, time
 from pathlib import Path
 import sys, os
+import uuid
 
 # 讓 utils 可匯入
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from utils.data_manager import DataManager
+from utils.data_manager import DataManager, get_data_manager
 
 # ---------- 頁面基本設定 ----------
 st.set_page_config(
@@ -23,12 +25,16 @@ if css_path.exists():
     st.markdown(f"<style>{css_path.read_text(encoding='utf-8')}</style>", unsafe_allow_html=True)
 
 # ---------- Session 初始化 ----------
-if "data_manager" not in st.session_state:
-    st.session_state["data_manager"] = DataManager()
+# 每次執行都重新取得，資料更新後於下次執行切換版本
+st.session_state["data_manager"] = get_data_manager()
 
 if "favorites" not in st.session_state:
     st.session_state["favorites"] = {}   # {id: {name, address, ...}}
 
+# 匿名使用者識別：收藏等行為以此記錄，供協同過濾推薦
+if "user_key" not in st.session_state:
+    st.session_state["user_key"] = uuid.uuid4().hex
+
 # 採用「方案 A」：widget key 與自家 key 分離
 if "venue_search" not in st.session_state:
     st.session_state["venue_search"] = ""
@@ -113,6 +119,8 @@ if all_df is not None and not all_df.empty:
                             "lat": r.get("lat") or r.get("latitude"),
                             "lon": r.get("lon") or r.get("longitude"),
                         }
+                        if pd.notna(r.get("id", None)):
+                            dm.record_interaction(st.session_state["user_key"], r["id"], "favorite")
                         st.toast("已加入收藏", icon="✅")
 else:
     st.info("尚無資料，請稍後再試。")
@@ -125,17 +133,37 @@ query = st.session_state["venue_search"].strip()
 if not query:
     st.caption("輸入關鍵字後顯示結果。")
 else:
-    filtered = dm.get_filtered_venues(search_query=query)
-    if filtered is None or filtered.empty:
+    # 只取得列位置，實際資料僅取出目前這一頁
+    rows = dm.get_filtered_venue_rows(search_query=query)
+
+    # 依空檔時段篩選（一次查詢所有結果場地的當日預訂）
+    with st.expander("🕒 只顯示指定時段可預訂的場地"):
+        use_slot = st.checkbox("啟用時段篩選", key="slot_filter_on")
+        sc1, sc2, sc3 = st.columns(3)
+        slot_date = sc1.date_input("日期", min_value=date.today(), key="slot_date")
+        slot_start = sc2.time_input("開始時間", value=time(18, 0), key="slot_start")
+        slot_end = sc3.time_input("結束時間", value=time(20, 0), key="slot_end")
+    if use_slot and len(rows) > 0:
+        if slot_start >= slot_end:
+            st.error("結束時間必須晚於開始時間！")
+        else:
+            available = dm.filter_rows_by_availability(rows, slot_date, slot_start, slot_end)
+            if available is None:
+                st.error("目前無法查詢場地空檔，請稍後再試！")
+                rows = rows[:0]
+            else:
+                rows = available
+
+    if len(rows) == 0:
         st.warning("找不到符合條件的場地，換個關鍵字試試看！")
     else:
         # 分頁（每頁 9 筆）
         per_page = 9
-        total = len(filtered)
+        total = len(rows)
         pages = (total + per_page - 1) // per_page
-        page = st.segmented_control("頁碼", options=list(range(1, pages+1))) if pages > 1 else 1
+        page = (st.segmented_control("頁碼", options=list(range(1, pages+1))) or 1) if pages > 1 else 1
         start, end = (page-1)*per_page, (page-1)*per_page + per_page
-        page_df = filtered.iloc[start:end]
+        page_df = dm.get_venues_by_rows(rows[start:end])
 
         # 顯示卡片
         for i in range(0, len(page_df), 3):
@@ -174,6 +202,8 @@ else:
                                 "lat": row.get("lat") or row.get("latitude"),
                                 "lon": row.get("lon") or row.get("longitude"),
                             }
+                            if pd.notna(row.get("id", None)):
+                                dm.record_interaction(st.session_state["user_key"], row["id"], "favorite")
                             st.toast("已加入收藏", icon="❤️")
 
 # ---------- 側邊欄（簡化版資訊） ----------
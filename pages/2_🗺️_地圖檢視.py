@@ -2,7 +2,7 @@ import streamlit as st
 import folium
 from streamlit_folium import st_folium
 import pandas as pd
-from utils.data_manager import DataManager
+from utils.data_manager import get_data_manager
 from utils.map_utils import MapUtils
 
 st.set_page_config(
@@ -13,9 +13,8 @@ st.set_page_config(
 
 # 认证守卫已移除
 
-# 確保 session state 已初始化
-if 'data_manager' not in st.session_state:
-    st.session_state.data_manager = DataManager()
+# 確保 session state 已初始化（每次執行都重新取得，資料更新後於下次執行切換版本）
+st.session_state.data_manager = get_data_manager()
 
 if 'map_utils' not in st.session_state:
     st.session_state.map_utils = MapUtils()
@@ -191,7 +190,8 @@ with col1:
             
             # 尋找最近的場地
             nearest_venue = st.session_state.map_utils.find_nearest_venue(
-                filtered_venues, clicked_lat, clicked_lng
+                filtered_venues, clicked_lat, clicked_lng,
+                spatial_index=st.session_state.data_manager.spatial_index
             )
             
             if nearest_venue is not None:
@@ -219,11 +219,19 @@ with col1:
 with col2:
     st.subheader("📊 地圖統計")
     
-    if filtered_venues is not None and not filtered_venues.empty:
+    # 分面統計直接由索引計算（與地圖使用相同篩選條件）
+    facet_counts = st.session_state.data_manager.get_facet_counts(
+        sport_types=show_sports,
+        districts=show_districts,
+        price_range=price_range,
+        min_rating=min_rating
+    )
+    
+    if facet_counts["total"] > 0:
         # 顯示統計資訊
-        total_venues = len(filtered_venues)
-        avg_rating = filtered_venues['rating'].mean() if 'rating' in filtered_venues.columns else 0
-        avg_price = filtered_venues['price_per_hour'].mean() if 'price_per_hour' in filtered_venues.columns else 0
+        total_venues = facet_counts["total"]
+        avg_rating = facet_counts["avg_rating"] or 0
+        avg_price = facet_counts["avg_price_per_hour"] or 0
         
         st.metric("顯示場地數", total_venues)
         if avg_rating > 0:
@@ -232,19 +240,17 @@ with col2:
             st.metric("平均價格", f"NT${avg_price:.0f}/hr")
         
         # 按區域統計
-        if 'district' in filtered_venues.columns:
-            district_counts = filtered_venues['district'].value_counts()
-            
+        district_counts = facet_counts.get("district", {})
+        if district_counts:
             st.markdown("**📍 各區域場地數量:**")
-            for district, count in district_counts.head(10).items():
+            for district, count in list(district_counts.items())[:10]:
                 st.markdown(f"• {district}: {count} 個場地")
         
         # 按運動類型統計
-        if 'sport_type' in filtered_venues.columns:
-            sport_counts = filtered_venues['sport_type'].value_counts()
-            
+        sport_counts = facet_counts.get("sport_type", {})
+        if sport_counts:
             st.markdown("**🏃‍♂️ 運動類型分布:**")
-            for sport, count in sport_counts.head(10).items():
+            for sport, count in list(sport_counts.items())[:10]:
                 st.markdown(f"• {sport}: {count} 個場地")
     
     else:
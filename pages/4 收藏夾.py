@@ -4,7 +4,7 @@ from pathlib import Path
 import sys, os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from utils.data_manager import DataManager
+from utils.data_manager import get_data_manager
 
 st.set_page_config(page_title="收藏夾", layout="wide")
 
@@ -14,14 +14,25 @@ st.title("❤️ 收藏夾")
 if "favorites" not in st.session_state:
     st.session_state["favorites"] = {}   # {id: {name, address, sport_type, rating, price_level, lat, lon}}
 
-# --- 讀資料（依你的 DataManager 來） ---
+# --- 讀資料：一次批次取回所有收藏場地的最新資料 ---
 dm = None
 try:
-    dm = DataManager()
-    df = dm.load_data() if hasattr(dm, "load_data") else pd.DataFrame()
+    dm = get_data_manager()
+    df = dm.get_venues_by_ids(list(st.session_state["favorites"].keys()))
 except Exception:
     df = pd.DataFrame()
 
+# 以最新資料更新收藏中的評分與價格
+if not df.empty:
+    latest = df.set_index(df["id"].astype(str))
+    for vid, fav in st.session_state["favorites"].items():
+        if vid in latest.index:
+            row = latest.loc[vid]
+            if pd.notna(row.get("rating")):
+                fav["rating"] = row.get("rating")
+            if pd.notna(row.get("price_per_hour")):
+                fav["price_level"] = row.get("price_per_hour")
+
 # --- 工具函式 ---
 def remove_fav(vid: str):
     st.session_state["favorites"].pop(vid, None)
@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
-from utils.data_manager import DataManager
+from utils.data_manager import get_data_manager
+from utils.recommendation_engine import RecommendationEngine
 from datetime import datetime, timedelta, date, time
+import uuid
 
 st.set_page_config(
     page_title="場地詳情 - 台北運動場地搜尋引擎",
@@ -11,9 +13,15 @@ st.set_page_config(
 
 # 統一響應式設計 - 已在app.py中載入
 
-# 確保 session state 已初始化
-if 'data_manager' not in st.session_state:
-    st.session_state.data_manager = DataManager()
+# 確保 session state 已初始化（每次執行都重新取得，資料更新後於下次執行切換版本）
+st.session_state.data_manager = get_data_manager()
+if 'recommendation_engine' not in st.session_state:
+    st.session_state.recommendation_engine = RecommendationEngine()
+# 匿名使用者識別：瀏覽、收藏與預訂以此記錄，供協同過濾推薦
+if 'user_key' not in st.session_state:
+    st.session_state.user_key = uuid.uuid4().hex
+if 'viewed_venues' not in st.session_state:
+    st.session_state.viewed_venues = set()
 
 st.title("🏢 場地詳細資訊")
 
@@ -27,10 +35,8 @@ if venue_id is None:
     if all_venues is not None and not all_venues.empty:
         st.subheader("請選擇要查看的場地")
         
-        venue_options = {}
-        for _, venue in all_venues.iterrows():
-            label = f"{venue['name']} - {venue['district']}"
-            venue_options[label] = venue['id']
+        labels = all_venues['name'].astype(str) + " - " + all_venues['district'].astype(str)
+        venue_options = dict(zip(labels, all_venues['id']))
         
         selected_venue = st.selectbox("選擇場地", list(venue_options.keys()))
         
@@ -40,6 +46,7 @@ if venue_id is None:
         st.error("沒有可用的場地資料")
         st.stop()
 
+venue_info = None
 if venue_id:
     try:
         venue_id = int(venue_id)
@@ -50,6 +57,17 @@ if venue_id:
         if venue_info is None:
             st.error("找不到指定的場地")
             st.stop()
+
+        # 評論統計來自資料庫（索引聚合查詢）
+        review_summary = st.session_state.data_manager.get_review_summary(venue_id)
+        venue_info['review_count'] = review_summary['review_count']
+        if review_summary['avg_rating'] is not None:
+            venue_info['avg_rating'] = review_summary['avg_rating']
+        
+        # 每個 session 每個場地只記錄一次瀏覽（重新執行頁面不重複計算）
+        if venue_id not in st.session_state.viewed_venues:
+            st.session_state.viewed_venues.add(venue_id)
+            st.session_state.data_manager.record_interaction(st.session_state.user_key, venue_id, "view")
         
         # 場地基本資訊
         col1, col2 = st.columns([2, 1])
@@ -66,7 +84,8 @@ if venue_id:
         
         with col2:
             # 價格和評分資訊
-            st.metric("時租價格", f"NT${venue_info['price_per_hour']:.0f}/小時")
+            price = venue_info['price_per_hour']
+            st.metric("時租價格", f"NT${price:.0f}/小時" if price is not None else "—")
             
             # 使用計算後的平均評分
             avg_rating = venue_info.get('avg_rating', venue_info.get('rating', 0))
@@ -195,6 +214,9 @@ if venue_id:
                                 )
                                 
                                 if booking_id:
+                                    st.session_state.data_manager.record_interaction(
+                                        st.session_state.user_key, venue_id, "booking"
+                                    )
                                     st.success(f"預訂成功！預訂編號：{booking_id}")
                                     st.info("我們將透過電子郵件確認您的預訂詳情。")
                                 else:
@@ -225,6 +247,21 @@ if venue_id:
             else:
                 st.warning("該場地暫無地理位置資訊")
         
+        # 相似場地（內容向量索引）
+        similar_venues = st.session_state.recommendation_engine.get_similar_venues(venue_id, 4)
+        if similar_venues is not None and not similar_venues.empty:
+            st.subheader("🔗 相似場地")
+            similar_cols = st.columns(len(similar_venues))
+            for col, (_, similar) in zip(similar_cols, similar_venues.iterrows()):
+                with col:
+                    st.markdown(f"**{similar['name']}**")
+                    st.caption(f"📍 {similar['district']}")
+                    if pd.notna(similar.get('rating')):
+                        st.write(f"⭐ {similar['rating']:.1f}")
+                    if st.button("查看", key=f"similar_{similar['id']}", use_container_width=True):
+                        st.query_params.id = int(similar['id'])
+                        st.rerun()
+        
     except ValueError:
         st.error("無效的場地ID")
     except Exception as e:
@@ -235,18 +272,21 @@ else:
 if "favorites" not in st.session_state:
     st.session_state["favorites"] = {}
 
-vid = str(venue.get("id", venue.get("name")))
-info = {
-    "id": vid,
-    "name": venue.get("name"),
-    "address": venue.get("address"),
-    "sport_type": venue.get("sport_type"),
-    "rating": venue.get("rating"),
-    "price_level": venue.get("price_level"),
-    "lat": venue.get("lat") or venue.get("latitude"),
-    "lon": venue.get("lon") or venue.get("longitude"),
-}
-already = vid in st.session_state["favorites"]
-if st.button(("✓ 已收藏" if already else "加入收藏"), disabled=already):
-    st.session_state["favorites"][vid] = info
-    st.toast("已加入收藏", icon="❤️")
+if venue_info is not None:
+    venue = venue_info
+    vid = str(venue.get("id", venue.get("name")))
+    info = {
+        "id": vid,
+        "name": venue.get("name"),
+        "address": venue.get("address"),
+        "sport_type": venue.get("sport_type"),
+        "rating": venue.get("rating"),
+        "price_level": venue.get("price_per_hour"),
+        "lat": venue.get("lat") or venue.get("latitude"),
+        "lon": venue.get("lon") or venue.get("longitude"),
+    }
+    already = vid in st.session_state["favorites"]
+    if st.button(("✓ 已收藏" if already else "加入收藏"), disabled=already):
+        st.session_state["favorites"][vid] = info
+        st.session_state.data_manager.record_interaction(st.session_state.user_key, venue_info["id"], "favorite")
+        st.toast("已加入收藏", icon="❤️")
@@ -0,0 +1,316 @@
+# utils/booking_calendar.py
+"""
+場地預訂時段索引
+
+每個場地每一天各保存一組互不重疊、依開始時間排序的預訂區間（以當日分鐘數表示）。
+因為區間互不重疊，開始與結束時間兩個陣列都是遞增的，
+衝突檢查只需兩次二分搜尋（O(log n)），不必逐筆比對。
+
+資料庫仍是預訂的唯一來源：索引在第一次查詢時由資料庫載入並短暫快取，
+預訂時先在同一場地同一天的鎖內檢查索引，再由資料庫交易確認並寫入。
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import date, datetime, time
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import time as _time
+
+from utils.database import VenueStorage, get_storage
+
+# 未指定營業時間時，空檔查詢使用的時段（分鐘）
+DAY_START_MINUTE = 6 * 60
+DAY_END_MINUTE = 22 * 60
+# 由資料庫載入的單日索引保留秒數；其他行程寫入的預訂最晚在此時間後可見
+CACHE_TTL = 30.0
+# 單日索引快取筆數上限（超過時丟棄最久未使用的）
+CACHE_SIZE = 4096
+# 分段鎖數量（同一場地同一天一定落在同一把鎖）
+_LOCK_STRIPES = 64
+
+
+def to_minutes(value) -> int:
+    """時間（time、datetime 或 'HH:MM[:SS]'）轉為當日分鐘數"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        value = value.time()
+    if not isinstance(value, time):
+        value = time.fromisoformat(str(value))
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes: int) -> time:
+    """當日分鐘數轉為 time；24:00 以 23:59 表示"""
+    minutes = min(int(minutes), 24 * 60 - 1)
+    return time(minutes // 60, minutes % 60)
+
+
+def _to_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+class DayIntervals:
+    """
+    單一場地單日的預訂區間（半開區間 [start, end)，互不重疊）
+    """
+
+    __slots__ = ("starts", "ends", "ids")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.ids: List[int] = []
+
+    @classmethod
+    def from_bookings(cls, bookings: Iterable[dict]) -> "DayIntervals":
+        """由資料庫的預訂列建立（需已依開始時間排序）"""
+        day = cls()
+        for b in bookings:
+            day.starts.append(to_minutes(b["start_time"]))
+            day.ends.append(to_minutes(b["end_time"]))
+            day.ids.append(b["id"])
+        return day
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _overlap_range(self, start: int, end: int) -> Tuple[int, int]:
+        # 與 [start, end) 重疊的區間：結束時間 > start 且開始時間 < end
+        lo = bisect_right(self.ends, start)
+        hi = bisect_left(self.starts, end)
+        return lo, hi
+
+    def is_free(self, start: int, end: int) -> bool:
+        """時段是否沒有任何預訂"""
+        lo, hi = self._overlap_range(start, end)
+        return lo >= hi
+
+    def conflicts(self, start: int, end: int) -> List[int]:
+        """與時段重疊的預訂ID"""
+        lo, hi = self._overlap_range(start, end)
+        return self.ids[lo:hi]
+
+    def add(self, start: int, end: int, booking_id: int):
+        """加入預訂（呼叫端需先確認時段空閒）"""
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, booking_id)
+
+    def free_slots(self, window_start: int = DAY_START_MINUTE, window_end: int = DAY_END_MINUTE,
+                   min_minutes: int = 0) -> List[Tuple[int, int]]:
+        """
+        時段內的空檔
+
+        Args:
+            window_start: 起始分鐘
+            window_end: 結束分鐘
+            min_minutes: 空檔最短長度
+
+        Returns:
+            [(開始分鐘, 結束分鐘), ...]
+        """
+        lo, hi = self._overlap_range(window_start, window_end)
+        slots = []
+        cursor = window_start
+        for i in range(lo, hi):
+            if self.starts[i] - cursor >= max(min_minutes, 1):
+                slots.append((cursor, self.starts[i]))
+            cursor = max(cursor, self.ends[i])
+        if window_end - cursor >= max(min_minutes, 1):
+            slots.append((cursor, window_end))
+        return slots
+
+
+class BookingCalendar:
+    """
+    行程共用的預訂時段索引
+    """
+
+    def __init__(self, storage: Optional[VenueStorage] = None, ttl: float = CACHE_TTL,
+                 cache_size: int = CACHE_SIZE):
+        """
+        Args:
+            storage: SQL 儲存層，預設使用共用實例
+            ttl: 單日索引快取秒數
+            cache_size: 單日索引快取筆數上限
+        """
+        self._storage = storage
+        self.ttl = ttl
+        self.cache_size = cache_size
+        # {(場地ID, 日期): (區間索引, 載入時間)}，依最近使用排序
+        self._days: "OrderedDict[Tuple[int, date], Tuple[DayIntervals, float]]" = OrderedDict()
+        self._days_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    @property
+    def storage(self) -> VenueStorage:
+        return self._storage or get_storage()
+
+    def _lock_for(self, key: Tuple[int, date]) -> threading.Lock:
+        return self._locks[hash(key) % _LOCK_STRIPES]
+
+    def _cached(self, key: Tuple[int, date]) -> Optional[DayIntervals]:
+        with self._days_lock:
+            entry = self._days.get(key)
+            if entry is None:
+                return None
+            if _time.monotonic() - entry[1] >= self.ttl:
+                # 過期的索引直接丟棄
+                del self._days[key]
+                return None
+            self._days.move_to_end(key)
+            return entry[0]
+
+    def _store(self, key: Tuple[int, date], day: DayIntervals, loaded_at: float):
+        with self._days_lock:
+            self._days[key] = (day, loaded_at)
+            self._days.move_to_end(key)
+            while len(self._days) > self.cache_size:
+                self._days.popitem(last=False)
+
+    def _day(self, venue_id: int, booking_date: date) -> DayIntervals:
+        key = (venue_id, booking_date)
+        day = self._cached(key)
+        if day is None:
+            day = DayIntervals.from_bookings(self.storage.get_bookings(venue_id, booking_date))
+            self._store(key, day, _time.monotonic())
+        return day
+
+    def invalidate(self, venue_id: int, booking_date):
+        """丟棄單日索引，下次查詢時重新由資料庫載入"""
+        with self._days_lock:
+            self._days.pop((int(venue_id), _to_date(booking_date)), None)
+
+    def is_available(self, venue_id, booking_date, start_time, end_time) -> bool:
+        """
+        檢查時段是否可預訂
+
+        Args:
+            venue_id: 場地ID
+            booking_date: 日期
+            start_time: 開始時間
+            end_time: 結束時間
+
+        Returns:
+            是否可預訂
+        """
+        start, end = to_minutes(start_time), to_minutes(end_time)
+        if start >= end:
+            return False
+        return self._day(int(venue_id), _to_date(booking_date)).is_free(start, end)
+
+    def conflicts(self, venue_id, booking_date, start_time, end_time) -> List[int]:
+        """與時段重疊的預訂ID"""
+        return self._day(int(venue_id), _to_date(booking_date)).conflicts(
+            to_minutes(start_time), to_minutes(end_time)
+        )
+
+    def reserve(self, venue_id, user_name: str, user_email: str, user_phone: str,
+                booking_date, start_time, end_time, special_requests: str = "") -> Optional[int]:
+        """
+        檢查並預訂（不可分割）
+
+        同一場地同一天的預訂在同一把鎖內依序執行；跨行程則由 create_booking 的交易負責：
+        交易在重疊檢查前就取得寫入鎖（SQLite 為 BEGIN IMMEDIATE、PostgreSQL 鎖定場地列），
+        因此其他行程同時預訂同一時段時只有一方會成功。
+
+        Returns:
+            預訂ID；時段衝突時回傳 None
+        """
+        venue_id, booking_date = int(venue_id), _to_date(booking_date)
+        start, end = to_minutes(start_time), to_minutes(end_time)
+        if start >= end:
+            return None
+
+        key = (venue_id, booking_date)
+        with self._lock_for(key):
+            day = self._day(venue_id, booking_date)
+            if not day.is_free(start, end):
+                return None
+            booking_id = self.storage.create_booking(
+                venue_id, user_name, user_email, user_phone,
+                booking_date, from_minutes(start), from_minutes(end), special_requests,
+            )
+            if booking_id is None:
+                # 其他行程已先預訂；重新載入以反映資料庫狀態
+                self.invalidate(venue_id, booking_date)
+                return None
+            day.add(start, end, booking_id)
+            return booking_id
+
+    def free_slots(self, venue_ids: Iterable, booking_date,
+                   window: Tuple = (DAY_START_MINUTE, DAY_END_MINUTE),
+                   min_minutes: int = 60) -> Dict[int, List[Tuple[time, time]]]:
+        """
+        批次查詢多個場地某日的空檔
+
+        快取中沒有的場地以單一查詢一次載入。
+
+        Args:
+            venue_ids: 場地ID列表
+            booking_date: 日期
+            window: 查詢時段（開始, 結束），可為分鐘數或時間
+            min_minutes: 空檔最短長度（分鐘）
+
+        Returns:
+            {場地ID: [(開始時間, 結束時間), ...]}；沒有空檔的場地對應空列表
+        """
+        booking_date = _to_date(booking_date)
+        ids = [int(v) for v in venue_ids]
+        window_start, window_end = to_minutes(window[0]), to_minutes(window[1])
+
+        days: Dict[int, DayIntervals] = {}
+        missing = []
+        for vid in ids:
+            day = self._cached((vid, booking_date))
+            if day is None:
+                missing.append(vid)
+            else:
+                days[vid] = day
+
+        if missing:
+            loaded = self.storage.get_bookings_for_date(missing, booking_date)
+            now = _time.monotonic()
+            for vid in missing:
+                day = DayIntervals.from_bookings(loaded.get(vid, []))
+                self._store((vid, booking_date), day, now)
+                days[vid] = day
+
+        return {
+            vid: [(from_minutes(s), from_minutes(e))
+                  for s, e in days[vid].free_slots(window_start, window_end, min_minutes)]
+            for vid in ids
+        }
+
+    def available_venues(self, venue_ids: Iterable, booking_date, start_time, end_time) -> List[int]:
+        """
+        篩選出指定時段完全空閒的場地
+
+        Returns:
+            可預訂的場地ID（保持傳入順序）
+        """
+        start, end = to_minutes(start_time), to_minutes(end_time)
+        if start >= end:
+            return []
+        slots = self.free_slots(venue_ids, booking_date, window=(start, end), min_minutes=end - start)
+        return [vid for vid, free in slots.items() if free]
+
+
+_shared_calendar = None
+_shared_calendar_lock = threading.Lock()
+
+
+def get_booking_calendar() -> BookingCalendar:
+    """取得行程共用的 BookingCalendar"""
+    global _shared_calendar
+    if _shared_calendar is None:
+        with _shared_calendar_lock:
+            if _shared_calendar is None:
+                _shared_calendar = BookingCalendar()
+    return _shared_calendar
@@ -0,0 +1,440 @@
+# utils/collaborative_filter.py
+"""
+以真實使用行為訓練的協同過濾（item-item）
+
+收藏、喜歡、瀏覽詳情與預訂都記錄在資料庫的 interactions 資料表。
+模型把紀錄累加成稀疏的 使用者 × 場地 CSR 矩陣（依行為類型加權，再取 log1p 作為信心值），
+以場地欄向量的餘弦相似度為每個場地預先計算前 N 個相似場地。
+
+訓練是增量的：每次只讀取上次之後的新紀錄，並只重新計算可能受影響的場地
+（與變動場地有共同使用者的場地）的相似清單。
+推薦時只需把使用者看過的場地的相似清單加權加總，與使用者人數無關，結果固定且可快取。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+from utils.database import VenueStorage, get_storage
+
+# 各行為的權重；不喜歡會抵銷先前的正向行為
+EVENT_WEIGHTS = {
+    "view": 1.0,
+    "like": 3.0,
+    "favorite": 4.0,
+    "booking": 5.0,
+    "dislike": -3.0,
+}
+# 每個場地保留的相似場地數
+NEIGHBOURS = 50
+# 兩次向資料庫讀取新紀錄的最短間隔（秒）
+CF_SYNC_INTERVAL = float(os.environ.get("CF_SYNC_INTERVAL", "30"))
+# 每次讀取的紀錄筆數
+_SYNC_BATCH = 50000
+# 計算相似度時每批的元素數上限（場地數 × 批次大小）
+_BLOCK_ELEMENTS = 4_000_000
+# 推薦結果快取筆數上限
+_CACHE_SIZE = 1024
+
+
+class ModelState:
+    """
+    模型在某一時點的完整狀態
+
+    建立後不再修改：partial_fit 先建好所有新的索引與陣列，再以單一參照指派替換，
+    讀取端取得的一定是彼此一致的同一版本（與 VenueRepository 切換快照的方式相同）。
+    """
+
+    __slots__ = (
+        "user_index", "venue_ids", "venue_index", "counts", "confidence",
+        "neighbours", "similarities", "last_id",
+    )
+
+    def __init__(self, user_index: Dict[str, int], venue_ids: List[int], venue_index: Dict[int, int],
+                 counts: sparse.csr_matrix, confidence: sparse.csr_matrix,
+                 neighbours: np.ndarray, similarities: np.ndarray, last_id: int):
+        """
+        Args:
+            user_index: 使用者識別 → 列位置
+            venue_ids: 欄位置 → 場地ID
+            venue_index: 場地ID → 欄位置
+            counts: 依行為權重累加的原始分數（使用者 × 場地）
+            confidence: 信心值矩陣 log1p(max(counts, 0))
+            neighbours: 每個場地的相似場地位置（-1 表示空位）
+            similarities: 對應的相似度
+            last_id: 已套用的最後一筆紀錄ID
+        """
+        self.user_index = user_index
+        self.venue_ids = venue_ids
+        self.venue_index = venue_index
+        self.counts = counts
+        self.confidence = confidence
+        self.neighbours = neighbours
+        self.similarities = similarities
+        self.last_id = last_id
+
+    @classmethod
+    def empty(cls, n_neighbours: int) -> "ModelState":
+        return cls(
+            {}, [], {},
+            sparse.csr_matrix((0, 0), dtype=np.float32),
+            sparse.csr_matrix((0, 0), dtype=np.float32),
+            np.empty((0, n_neighbours), dtype=np.int32),
+            np.empty((0, n_neighbours), dtype=np.float32),
+            0,
+        )
+
+    @property
+    def n_venues(self) -> int:
+        return len(self.venue_ids)
+
+
+class ItemItemModel:
+    """
+    隱式回饋的 item-item 協同過濾模型
+
+    只有一個執行緒呼叫 partial_fit（CollaborativeFilter 以鎖保護）；查詢方法每次只讀取一次
+    self.state，可與更新同時進行。
+    """
+
+    def __init__(self, n_neighbours: int = NEIGHBOURS):
+        """
+        Args:
+            n_neighbours: 每個場地保留的相似場地數
+        """
+        self.n_neighbours = n_neighbours
+        self.state = ModelState.empty(n_neighbours)
+
+    @property
+    def last_id(self) -> int:
+        return self.state.last_id
+
+    @property
+    def n_venues(self) -> int:
+        return self.state.n_venues
+
+    def partial_fit(self, interactions: List[dict]) -> int:
+        """
+        加入新的使用行為並更新受影響場地的相似清單
+
+        Args:
+            interactions: 依 id 排序的紀錄（id、user_key、venue_id、event）
+
+        Returns:
+            實際套用的紀錄數
+        """
+        old = self.state
+        # 索引複製一份再擴充，讀取端手上的舊狀態維持不變
+        user_index = dict(old.user_index)
+        venue_ids = list(old.venue_ids)
+        venue_index = dict(old.venue_index)
+        last_id = old.last_id
+
+        rows, cols, values = [], [], []
+        for r in interactions:
+            last_id = max(last_id, int(r["id"]))
+            weight = EVENT_WEIGHTS.get(r["event"])
+            if weight is None:
+                continue
+            rows.append(user_index.setdefault(str(r["user_key"]), len(user_index)))
+            venue_id = int(r["venue_id"])
+            position = venue_index.get(venue_id)
+            if position is None:
+                position = venue_index[venue_id] = len(venue_ids)
+                venue_ids.append(venue_id)
+            cols.append(position)
+            values.append(weight)
+        if not rows:
+            self.state = ModelState(
+                old.user_index, old.venue_ids, old.venue_index, old.counts, old.confidence,
+                old.neighbours, old.similarities, last_id,
+            )
+            return 0
+
+        shape = (len(user_index), len(venue_ids))
+        delta = sparse.coo_matrix((values, (rows, cols)), shape=shape, dtype=np.float32).tocsr()
+        counts = old.counts.copy()
+        counts.resize(shape)
+        counts = (counts + delta).tocsr()
+
+        confidence = counts.copy()
+        confidence.data = np.log1p(np.maximum(confidence.data, 0.0)).astype(np.float32)
+        confidence.eliminate_zeros()
+
+        # 受影響的場地：與變動場地有共同使用者者（含變動的使用者自己看過的場地）
+        changed_users = np.unique(rows)
+        changed_venues = np.unique(cols)
+        users = np.union1d(changed_users, counts.tocsc()[:, changed_venues].nonzero()[0])
+        affected = np.union1d(changed_venues, counts[users].nonzero()[1])
+
+        neighbours, similarities = self._refresh_neighbours(old, confidence, affected)
+        self.state = ModelState(
+            user_index, venue_ids, venue_index, counts, confidence, neighbours, similarities, last_id,
+        )
+        return len(rows)
+
+    def _refresh_neighbours(self, old: ModelState, confidence: sparse.csr_matrix,
+                            venues: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """在新陣列中重新計算指定場地的相似清單，其餘場地沿用舊狀態的結果"""
+        n, k = confidence.shape[1], self.n_neighbours
+        neighbours = np.full((n, k), -1, dtype=np.int32)
+        similarities = np.zeros((n, k), dtype=np.float32)
+        kept = len(old.neighbours)
+        neighbours[:kept] = old.neighbours
+        similarities[:kept] = old.similarities
+
+        item_matrix = confidence.T.tocsr()  # 場地 × 使用者
+        norms = np.sqrt(np.asarray(item_matrix.multiply(item_matrix).sum(axis=1)).ravel())
+        safe_norms = np.where(norms > 0, norms, 1.0)
+        take = min(k, max(n - 1, 0))
+
+        block = max(1, _BLOCK_ELEMENTS // max(n, 1))
+        for start in range(0, len(venues), block):
+            items = venues[start:start + block]
+            scores = (item_matrix[items] @ item_matrix.T).toarray()
+            scores /= safe_norms[items, None] * safe_norms[None, :]
+            scores[np.arange(len(items)), items] = 0.0
+
+            neighbours[items] = -1
+            similarities[items] = 0.0
+            if take == 0:
+                continue
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            valid = top_scores > 0
+            neighbours[items, :take] = np.where(valid, top, -1)
+            similarities[items, :take] = np.where(valid, top_scores, 0.0)
+
+        return neighbours, similarities
+
+    @staticmethod
+    def _profile(state: ModelState, user_key: Optional[str],
+                 seed_venue_ids: Iterable) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """使用者看過的場地位置、信心值，以及要排除的場地（含不喜歡的場地）"""
+        weights: Dict[int, float] = {}
+        excluded = set()
+        user = state.user_index.get(user_key) if user_key is not None else None
+        if user is not None:
+            row = state.confidence.getrow(user)
+            weights.update(zip(row.indices.tolist(), row.data.tolist()))
+            excluded.update(state.counts.getrow(user).indices.tolist())
+        for venue_id in seed_venue_ids:
+            position = state.venue_index.get(venue_id)
+            if position is not None:
+                weights[position] = max(weights.get(position, 0.0), float(np.log1p(EVENT_WEIGHTS["favorite"])))
+                excluded.add(position)
+        items = np.fromiter(weights.keys(), dtype=np.intp, count=len(weights))
+        values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+        return items, values, np.fromiter(excluded, dtype=np.intp, count=len(excluded))
+
+    def recommend(self, user_key: Optional[str] = None, seed_venue_ids: Iterable = (),
+                  k: int = 10) -> List[Tuple[int, float]]:
+        """
+        依使用者的行為（以及額外指定的場地）推薦
+
+        Args:
+            user_key: 使用者識別
+            seed_venue_ids: 額外的偏好場地（例如目前 session 的收藏）
+            k: 推薦數量
+
+        Returns:
+            [(場地ID, 分數), ...]，由高到低；沒有可用資料時為空列表
+        """
+        state = self.state
+        items, values, excluded = self._profile(state, user_key, seed_venue_ids)
+        if len(items) == 0 or state.n_venues == 0:
+            return []
+
+        neighbours = state.neighbours[items]
+        weighted = state.similarities[items] * values[:, None]
+        valid = neighbours >= 0
+        scores = np.bincount(neighbours[valid], weights=weighted[valid], minlength=state.n_venues)
+        scores[excluded] = 0.0
+        return self._top(state, scores, k)
+
+    def similar_venues(self, venue_id: int, k: int = 10) -> List[Tuple[int, float]]:
+        """與指定場地最常被同一批使用者選擇的場地"""
+        state = self.state
+        position = state.venue_index.get(venue_id)
+        if position is None:
+            return []
+        valid = state.neighbours[position] >= 0
+        return [
+            (state.venue_ids[i], float(s))
+            for i, s in zip(state.neighbours[position][valid][:k], state.similarities[position][valid][:k])
+        ]
+
+    def popular(self, k: int = 10) -> List[Tuple[int, float]]:
+        """整體信心值最高的場地（沒有個人資料時使用）"""
+        state = self.state
+        if state.n_venues == 0:
+            return []
+        return self._top(state, np.asarray(state.confidence.sum(axis=0)).ravel(), k)
+
+    @staticmethod
+    def _top(state: ModelState, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        positive = np.flatnonzero(scores > 0)
+        if len(positive) == 0:
+            return []
+        k = min(k, len(positive))
+        top = positive[np.argpartition(-scores[positive], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(state.venue_ids[i], float(scores[i])) for i in top]
+
+
+class CollaborativeFilter:
+    """
+    行程共用的協同過濾服務：記錄行為、增量更新模型並提供推薦
+    """
+
+    def __init__(self, storage: Optional[VenueStorage] = None, sync_interval: float = CF_SYNC_INTERVAL):
+        """
+        Args:
+            storage: SQL 儲存層，預設使用共用實例
+            sync_interval: 兩次讀取新紀錄的最短間隔（秒）
+        """
+        self._storage = storage
+        self.sync_interval = sync_interval
+        self.model = ItemItemModel()
+        self._sync_lock = threading.Lock()
+        self._sync_due = 0.0
+        # 是否已完成第一次載入；之後的更新一律在背景執行
+        self._loaded = False
+        self._cache: Dict[tuple, List[Tuple[int, float]]] = {}
+
+    @property
+    def storage(self) -> VenueStorage:
+        return self._storage or get_storage()
+
+    def record(self, user_key: str, venue_id, event: str) -> bool:
+        """
+        記錄使用行為（下一次背景更新時併入模型，最多延遲 sync_interval 秒）
+
+        Args:
+            user_key: 使用者識別
+            venue_id: 場地ID
+            event: 行為類型，見 EVENT_WEIGHTS
+
+        Returns:
+            是否成功記錄
+        """
+        if event not in EVENT_WEIGHTS or not user_key:
+            return False
+        self.storage.add_interaction(user_key, int(venue_id), event)
+        return True
+
+    def sync(self, wait: bool = True) -> int:
+        """
+        讀取新紀錄並增量更新模型
+
+        Args:
+            wait: 另一個執行緒正在更新時是否等待；False 時直接略過
+
+        Returns:
+            套用的紀錄數
+        """
+        if not self._sync_lock.acquire(blocking=wait):
+            return 0
+        try:
+            return self._apply_new_interactions()
+        finally:
+            self._sync_lock.release()
+
+    def refresh(self) -> Optional[threading.Thread]:
+        """
+        在背景讀取新紀錄並更新模型；更新期間查詢照常使用目前的模型
+
+        Returns:
+            執行更新的執行緒；已有更新正在進行時回傳 None
+        """
+        if not self._sync_lock.acquire(blocking=False):
+            return None
+
+        def run():
+            try:
+                self._apply_new_interactions()
+            finally:
+                self._sync_lock.release()
+
+        thread = threading.Thread(target=run, name="cf-sync", daemon=True)
+        thread.start()
+        return thread
+
+    def _apply_new_interactions(self) -> int:
+        # 呼叫端需持有 _sync_lock
+        try:
+            applied = 0
+            while True:
+                batch = self.storage.get_interactions_since(self.model.last_id, _SYNC_BATCH)
+                if batch:
+                    applied += self.model.partial_fit(batch)
+                if len(batch) < _SYNC_BATCH:
+                    break
+            self._loaded = True
+            if applied:
+                self._cache = {}
+            return applied
+        except Exception as e:
+            print(f"❌ 更新協同過濾模型發生錯誤: {e}")
+            return 0
+        finally:
+            self._sync_due = time.monotonic() + self.sync_interval
+
+    def _maybe_sync(self):
+        if time.monotonic() < self._sync_due:
+            return
+        if self._loaded:
+            # 之後的更新在背景執行，查詢直接使用目前的模型
+            self.refresh()
+        else:
+            # 第一次載入需等待
+            self.sync(wait=True)
+
+    def recommend(self, user_key: Optional[str] = None, seed_venue_ids: Iterable = (),
+                  k: int = 10) -> List[Tuple[int, float]]:
+        """
+        個人化推薦；使用者沒有任何行為時回傳空列表
+
+        Returns:
+            [(場地ID, 分數), ...]
+        """
+        self._maybe_sync()
+        key = (user_key, tuple(sorted(int(v) for v in seed_venue_ids)), k)
+        cache = self._cache
+        result = cache.get(key)
+        if result is None:
+            result = self.model.recommend(user_key, key[1], k)
+            if len(cache) >= _CACHE_SIZE:
+                cache.clear()
+            cache[key] = result
+        return result
+
+    def similar_venues(self, venue_id, k: int = 10) -> List[Tuple[int, float]]:
+        """常被同一批使用者選擇的場地"""
+        self._maybe_sync()
+        return self.model.similar_venues(int(venue_id), k)
+
+    def popular(self, k: int = 10) -> List[Tuple[int, float]]:
+        """依使用行為統計的熱門場地"""
+        self._maybe_sync()
+        return self.model.popular(k)
+
+
+_shared_filter = None
+_shared_filter_lock = threading.Lock()
+
+
+def get_collaborative_filter() -> CollaborativeFilter:
+    """取得行程共用的 CollaborativeFilter"""
+    global _shared_filter
+    if _shared_filter is None:
+        with _shared_filter_lock:
+            if _shared_filter is None:
+                _shared_filter = CollaborativeFilter()
+    return _shared_filter
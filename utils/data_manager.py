@@ -1,84 +1,104 @@
 # utils/data_manager.py
-from pathlib import Path
+import numpy as np
 import pandas as pd
 import streamlit as st
-import random
 import os
+import threading
+from typing import Optional
+
+from utils.venue_repository import get_venue_repository
+from utils.database import get_storage
+from utils.booking_calendar import get_booking_calendar
+from utils.collaborative_filter import get_collaborative_filter
+
+# 場地詳情頁會直接取用的欄位；資料中沒有的欄位以 None 補齊
+VENUE_FIELDS = [
+    "id", "name", "district", "sport_type", "address", "facilities", "price_per_hour",
+    "rating", "opening_hours", "contact_phone", "website", "description",
+    "latitude", "longitude",
+]
+
+def _is_missing(value) -> bool:
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
 
-@st.cache_data
 def load_venues_data():
     """
-    從 CSV 載入場地資料，並做欄位映射
-    """
-    # 指定你的新檔案
-    csv_path = Path(__file__).resolve().parents[1] / "attached_assets" / "finding move 2.csv"
-
-    if not csv_path.exists():
-        print(f"❌ 找不到 CSV：{csv_path}")
-        return pd.DataFrame()
-
-    try:
-        # 嘗試以 utf-8-sig 讀檔（避免中文亂碼）
-        df = pd.read_csv(csv_path, encoding="utf-8-sig")
-
-        # 欄位名稱對應表（可再依實際 CSV 欄名調整）
-        col_map = {
-            "名稱": "name", "場地名稱": "name",
-            "行政區": "district", "地區": "district",
-            "運動類型": "sport_type", "運動": "sport_type",
-            "地址": "address",
-            "設施": "facilities",
-            "價格": "price_per_hour", "價位": "price_per_hour", "收費": "price_per_hour",
-            "開放時間": "opening_hours",
-            "電話": "contact_phone", "聯絡電話": "contact_phone",
-            "網站": "website",
-            "描述": "description", "其他": "description",
-            "相片": "photos"
-        }
+    載入場地資料
 
-        # 統一欄位名稱
-        df = df.rename(columns={c: col_map.get(c, c) for c in df.columns})
+    回傳目前版本快照中的場地資料；實際載入（memory-map 預先編譯的欄式檔案，
+    CSV 內容改變時才重新編譯）與熱更新由 VenueRepository 負責。
+    """
+    return get_venue_repository().current().venues_data
 
-        # 補充必要欄位
-        if "id" not in df.columns:
-            df["id"] = range(1, len(df)+1)
-        if "rating" not in df.columns:
-            df["rating"] = [round(random.uniform(3.5, 5.0), 1) for _ in range(len(df))]
+_shared_manager = None
+_shared_lock = threading.Lock()
 
-        print(f"✅ 成功載入 {len(df)} 筆場地資料")
-        return df
+def get_data_manager():
+    """
+    取得行程共用的 DataManager（執行緒安全）
 
-    except Exception as e:
-        print(f"❌ 載入 CSV 發生錯誤: {e}")
-        return pd.DataFrame()
+    所有 session 與推薦引擎共用同一個實例，session 只保存參照；
+    get_all_venues 等方法回傳的是共用資料的唯讀檢視，需要修改時請自行 copy(deep=False)。
+    回傳的實例固定綁定呼叫當下的資料版本；頁面每次重新執行時重新取得，
+    即可在資料更新後切換到新版本，同一次執行中的多次查詢則保持一致。
+    """
+    global _shared_manager
+    snapshot = get_venue_repository().current()
+    manager = _shared_manager
+    if manager is None or manager.snapshot is not snapshot:
+        with _shared_lock:
+            if _shared_manager is None or _shared_manager.snapshot is not snapshot:
+                _shared_manager = DataManager(snapshot)
+            manager = _shared_manager
+    return manager
+
+def reload_venues_data(wait: bool = False):
+    """ 重新載入場地資料（背景建立新版本後切換） """
+    return get_venue_repository().reload(wait=wait)
 
 class DataManager:
     """ 資料管理類別 """
 
-    def __init__(self):
-        self.venues_data = load_venues_data()
+    def __init__(self, snapshot=None):
+        # 綁定單一版本快照，所有查詢都讀同一份資料與索引
+        self.snapshot = snapshot or get_venue_repository().current()
+        self.venues_data = self.snapshot.venues_data
+        self.search_index = self.snapshot.search_index
+        self.facet_index = self.snapshot.facet_index
+        self.id_index = self.snapshot.id_index
+        self.spatial_index = self.snapshot.spatial_index
 
     def get_all_venues(self):
-        return self.venues_data
+        """
+        全部場地（共用資料的淺層複本）
+
+        新增或刪除欄位只影響複本。共用資料的欄位陣列為唯讀：pandas 3（Copy-on-Write）
+        修改值時會自動複製，pandas 2 則直接報錯，兩者都不會寫回其他 session 的資料。
+        """
+        return self.venues_data.copy(deep=False)
 
     def search_venues(self, query: str):
         """ 根據關鍵字搜尋場地 """
         if self.venues_data.empty or not query:
             return pd.DataFrame()
 
-        q = str(query).lower()
-        mask = pd.Series(False, index=self.venues_data.index)
-        for col in ["name","district","sport_type","address","facilities","description"]:
-            if col in self.venues_data.columns:
-                mask |= self.venues_data[col].astype(str).str.lower().str.contains(q)
-
-        results = self.venues_data[mask]
+        rows = self.search_index.search(query)
+        results = self.venues_data.iloc[rows]
         return results if not results.empty else pd.DataFrame()
     
     from typing import List
 
     def get_all_venues(self):
-        return self.venues_data
+        """
+        全部場地（共用資料的淺層複本）
+
+        新增或刪除欄位只影響複本。共用資料的欄位陣列為唯讀：pandas 3（Copy-on-Write）
+        修改值時會自動複製，pandas 2 則直接報錯，兩者都不會寫回其他 session 的資料。
+        """
+        return self.venues_data.copy(deep=False)
 
     def get_sport_types(self) -> List[str]:
         """回傳運動類型清單（字串、去重、排序）"""
@@ -95,46 +115,95 @@ class DataManager:
         return sorted(df["district"].dropna().astype(str).unique().tolist())
 
 
-    def get_filtered_venues(self, sport_types=None, districts=None, price_range=None, facilities=None, min_rating=0.0, search_query=None):
-        """ 多條件篩選場地 """
+    def _rows_for_ids(self, ids):
+        """ 將場地 ID 轉為列位置；找不到的 ID 會被略過，其餘保持傳入順序 """
+        if self.venues_data.empty or len(ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        # 收藏夾以字串保存 ID，統一轉回數值再查詢
+        keys = pd.to_numeric(pd.Index(list(ids)), errors="coerce")
+        rows = self.id_index.get_indexer(keys)
+        return rows[rows >= 0]
+
+    def get_venue_by_id(self, venue_id) -> Optional[dict]:
+        """
+        依 ID 取得單一場地
+
+        回傳欄位完整的 dict（缺值為 None），找不到時回傳 None。
+        """
+        rows = self._rows_for_ids([venue_id])
+        if len(rows) == 0:
+            return None
+        row = self.venues_data.iloc[int(rows[0])]
+        venue = {col: None for col in VENUE_FIELDS}
+        venue.update({k: (None if _is_missing(v) else v) for k, v in row.items()})
+        return venue
+
+    def get_venues_by_ids(self, ids) -> pd.DataFrame:
+        """
+        批次依 ID 取得場地（一次 take，不逐筆篩選）
+
+        Args:
+            ids: 場地 ID 清單（數值或數字字串皆可）
+
+        Returns:
+            依傳入順序排列的場地資料；找不到的 ID 會被略過
+        """
+        return self.get_venues_by_rows(self._rows_for_ids(ids))
+
+    def get_filtered_venue_rows(self, sport_types=None, districts=None, price_range=None, facilities=None, min_rating=0.0, search_query=None):
+        """ 多條件篩選，回傳符合條件的列位置（不產生 DataFrame） """
         if self.venues_data.empty:
-            return pd.DataFrame()
-
-        filtered = self.venues_data.copy()
+            return np.empty(0, dtype=np.int32)
 
         # 搜尋
-        if search_query:
-            filtered = self.search_venues(search_query)
-
-        # 運動類型
-        if sport_types and "sport_type" in filtered.columns:
-            filtered = filtered[filtered["sport_type"].isin(sport_types)]
-
-        # 行政區
-        if districts and "district" in filtered.columns:
-            filtered = filtered[filtered["district"].isin(districts)]
-
-        # 價格
-        if price_range and "price_per_hour" in filtered.columns:
-            min_p, max_p = price_range
-            filtered = filtered[
-                (filtered["price_per_hour"] >= min_p) & (filtered["price_per_hour"] <= max_p)
-            ]
-
-        # 設施
-        if facilities and "facilities" in filtered.columns:
-            for f in facilities:
-                filtered = filtered[filtered["facilities"].astype(str).str.contains(f, na=False)]
-
-        # 評分
-        if min_rating > 0 and "rating" in filtered.columns:
-            filtered = filtered[filtered["rating"] >= min_rating]
-
-        return filtered if not filtered.empty else pd.DataFrame()
+        rows = self.search_index.search(search_query) if search_query else None
+
+        return self.facet_index.filter(
+            rows=rows,
+            sport_types=sport_types,
+            districts=districts,
+            price_range=price_range,
+            facilities=facilities,
+            min_rating=min_rating,
+        )
+
+    def get_facet_counts(self, sport_types=None, districts=None, price_range=None, facilities=None, min_rating=0.0, search_query=None):
+        """
+        篩選結果的分面統計：各行政區、各運動類型筆數與價格/評分直方圖
+
+        參數與 get_filtered_venues 相同；結果格式見 FacetIndex.facet_counts。
+        """
+        rows = self.search_index.search(search_query) if search_query else None
+        return self.facet_index.facet_counts(
+            rows=rows,
+            sport_types=sport_types,
+            districts=districts,
+            price_range=price_range,
+            facilities=facilities,
+            min_rating=min_rating,
+        )
+
+    def get_venues_by_rows(self, rows):
+        """ 依列位置取出場地（一次 take，不複製整張表） """
+        if self.venues_data.empty or len(rows) == 0:
+            return pd.DataFrame()
+        return self.venues_data.take(rows)
+
+    def get_filtered_venues(self, sport_types=None, districts=None, price_range=None, facilities=None, min_rating=0.0, search_query=None, offset=0, limit=None):
+        """ 多條件篩選場地；可用 offset/limit 只取出單一分頁 """
+        rows = self.get_filtered_venue_rows(
+            sport_types=sport_types,
+            districts=districts,
+            price_range=price_range,
+            facilities=facilities,
+            min_rating=min_rating,
+            search_query=search_query,
+        )
+        end = None if limit is None else offset + limit
+        return self.get_venues_by_rows(rows[offset:end])
         # ---- 簡要統計（供側邊欄） ----
     def get_venue_stats(self) -> dict:
         """回傳簡要統計，供側邊欄顯示使用。"""
-        import pandas as pd
         df = self.venues_data
         if df is None or getattr(df, "empty", True):
             return {
@@ -145,18 +214,13 @@ class DataManager:
                 "avg_rating": None,
             }
 
-        def _mean_safe(series):
-            try:
-                val = pd.to_numeric(series, errors="coerce").mean()
-                return None if pd.isna(val) else float(val)
-            except Exception:
-                return None
-
-        total = int(len(df))
-        sport_types = int(df["sport_type"].nunique()) if "sport_type" in df.columns else 0
-        districts = int(df["district"].nunique()) if "district" in df.columns else 0
-        avg_price = _mean_safe(df["price_per_hour"]) if "price_per_hour" in df.columns else None
-        avg_rating = _mean_safe(df["rating"]) if "rating" in df.columns else None
+        # 直接取用分面索引的快取統計，不重新掃描整張表
+        counts = self.facet_index.facet_counts()
+        total = counts["total"]
+        sport_types = len(counts.get("sport_type", {}))
+        districts = len(counts.get("district", {}))
+        avg_price = counts["avg_price_per_hour"]
+        avg_rating = counts["avg_rating"]
 
         if avg_price is not None: avg_price = round(avg_price, 0)
         if avg_rating is not None: avg_rating = round(avg_rating, 1)
@@ -169,3 +233,142 @@ class DataManager:
             "avg_rating": avg_rating,
         }
 
+
+    # ---- 評論與預訂（SQL 儲存層；寫入不影響場地資料快照） ----
+    def get_venue_reviews(self, venue_id, limit: int = 50) -> list:
+        """
+        取得場地已審核的評論（新到舊）
+
+        Returns:
+            評論 dict 列表（user_name, rating, comment, created_at）；讀取失敗時回傳空列表
+        """
+        try:
+            return get_storage().get_venue_reviews(int(venue_id), approved_only=True, limit=limit)
+        except Exception as e:
+            print(f"❌ 讀取評論發生錯誤: {e}")
+            return []
+
+    def get_review_summary(self, venue_id) -> dict:
+        """已審核評論的數量與平均評分"""
+        try:
+            return get_storage().get_review_summary(int(venue_id))
+        except Exception as e:
+            print(f"❌ 讀取評論統計發生錯誤: {e}")
+            return {"review_count": 0, "avg_rating": None}
+
+    def add_review(self, venue_id, user_name: str, rating: int, comment: str) -> bool:
+        """
+        新增評論（審核通過後才會顯示）
+
+        Returns:
+            是否成功
+        """
+        try:
+            return get_storage().add_review(int(venue_id), user_name, rating, comment) is not None
+        except Exception as e:
+            print(f"❌ 新增評論發生錯誤: {e}")
+            return False
+
+    def check_availability(self, venue_id, booking_date, start_time, end_time) -> bool:
+        """
+        檢查時段是否可預訂
+
+        Args:
+            venue_id: 場地ID
+            booking_date: 日期（'YYYY-MM-DD'）
+            start_time: 開始時間（'HH:MM:SS'）
+            end_time: 結束時間
+
+        Returns:
+            是否可預訂；讀取失敗時視為不可預訂
+        """
+        try:
+            return get_booking_calendar().is_available(venue_id, booking_date, start_time, end_time)
+        except Exception as e:
+            print(f"❌ 檢查可用性發生錯誤: {e}")
+            return False
+
+    def create_booking(self, venue_id, user_name: str, user_email: str, user_phone: str,
+                       booking_date, start_time, end_time, special_requests: str = ""):
+        """
+        建立預訂（檢查與寫入不可分割，同時送出的請求不會重複預訂同一時段）
+
+        Returns:
+            預訂編號；時段衝突或失敗時回傳 None
+        """
+        try:
+            return get_booking_calendar().reserve(
+                venue_id, user_name, user_email, user_phone,
+                booking_date, start_time, end_time, special_requests,
+            )
+        except Exception as e:
+            print(f"❌ 建立預訂發生錯誤: {e}")
+            return None
+
+    def get_free_slots(self, venue_ids, booking_date, window=None, min_minutes: int = 60) -> dict:
+        """
+        批次查詢多個場地某日的空檔
+
+        Args:
+            venue_ids: 場地ID列表
+            booking_date: 日期
+            window: 查詢時段（開始, 結束），None 表示預設營業時段
+            min_minutes: 空檔最短長度（分鐘）
+
+        Returns:
+            {場地ID: [(開始時間, 結束時間), ...]}
+        """
+        kwargs = {"min_minutes": min_minutes}
+        if window is not None:
+            kwargs["window"] = window
+        try:
+            return get_booking_calendar().free_slots(venue_ids, booking_date, **kwargs)
+        except Exception as e:
+            print(f"❌ 查詢空檔發生錯誤: {e}")
+            return {}
+
+    def filter_rows_by_availability(self, rows, booking_date, start_time, end_time) -> Optional[np.ndarray]:
+        """
+        保留指定時段可預訂的場地
+
+        Args:
+            rows: 列位置（例如搜尋結果）
+            booking_date: 日期
+            start_time: 開始時間
+            end_time: 結束時間
+
+        Returns:
+            可預訂場地的列位置（保持原順序）；無法確認空檔時回傳 None，
+            絕不把未經確認的場地當成可預訂
+        """
+        rows = np.asarray(rows)
+        if len(rows) == 0:
+            return rows
+        if "id" not in self.venues_data.columns:
+            print("❌ 場地資料沒有ID欄位，無法查詢空檔")
+            return None
+        ids = self.venues_data["id"].to_numpy()[rows]
+        try:
+            free = get_booking_calendar().available_venues(ids, booking_date, start_time, end_time)
+        except Exception as e:
+            print(f"❌ 查詢空檔發生錯誤: {e}")
+            return None
+        return rows[np.isin(ids, free)]
+
+    def record_interaction(self, user_key: str, venue_id, event: str) -> bool:
+        """
+        記錄使用行為（收藏、喜歡、瀏覽、預訂），供協同過濾推薦使用
+
+        Args:
+            user_key: 使用者識別
+            venue_id: 場地ID
+            event: 行為類型（favorite、like、dislike、view、booking）
+
+        Returns:
+            是否成功記錄
+        """
+        try:
+            return get_collaborative_filter().record(user_key, venue_id, event)
+        except Exception as e:
+            print(f"❌ 記錄使用行為發生錯誤: {e}")
+            return False
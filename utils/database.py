@@ -0,0 +1,500 @@
+# utils/database.py
+"""
+場地、評論、預訂與使用行為的 SQL 儲存層
+
+以 SQLAlchemy 連線池存取資料庫：本機預設使用 SQLite，
+設定 DATABASE_URL 環境變數即可改用 PostgreSQL。
+所有查詢都以模組層級預先定義、綁定參數的陳述式執行，
+由 SQLAlchemy 快取編譯結果並交給驅動程式準備執行。
+
+評論與預訂的寫入只動到各自的資料表，不會觸發場地資料重新載入。
+"""
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import os
+import threading
+
+import pandas as pd
+from sqlalchemy import (
+    BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData,
+    String, Table, Text, Time, bindparam, create_engine, event, func, select, update,
+)
+from sqlalchemy.engine import Engine
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_DATABASE_URL = f"sqlite:///{BASE_DIR / '.cache' / 'finding_move.db'}"
+
+# 交易需在檢查前就取得寫入鎖時使用的執行選項（SQLite 以 BEGIN IMMEDIATE 開始交易）
+IMMEDIATE_OPTION = "sqlite_immediate"
+
+# 寫入評論或預訂時，等待第一次場地同步完成的最長秒數
+VENUE_SYNC_TIMEOUT = float(os.environ.get("VENUE_SYNC_TIMEOUT", "30"))
+
+metadata = MetaData()
+
+venues_table = Table(
+    "venues", metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=False),
+    Column("name", String(255), nullable=False),
+    Column("district", String(32), index=True),
+    Column("sport_type", String(128), index=True),
+    Column("address", String(255)),
+    Column("price_per_hour", Float),
+    Column("rating", Float),
+    Column("latitude", Float),
+    Column("longitude", Float),
+    Column("data_version", String(64), index=True),
+)
+
+reviews_table = Table(
+    "reviews", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("venue_id", BigInteger, ForeignKey("venues.id"), nullable=False),
+    Column("user_name", String(100), nullable=False),
+    Column("rating", Integer, nullable=False),
+    Column("comment", Text),
+    Column("is_approved", Boolean, nullable=False, default=False),
+    Column("created_at", DateTime, nullable=False),
+    # 詳情頁依場地讀取已審核評論並依時間排序
+    Index("ix_reviews_venue_approved_created", "venue_id", "is_approved", "created_at"),
+)
+
+bookings_table = Table(
+    "bookings", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("venue_id", BigInteger, ForeignKey("venues.id"), nullable=False),
+    Column("user_name", String(100), nullable=False),
+    Column("user_email", String(255), nullable=False),
+    Column("user_phone", String(50), nullable=False),
+    Column("booking_date", Date, nullable=False),
+    Column("start_time", Time, nullable=False),
+    Column("end_time", Time, nullable=False),
+    Column("special_requests", Text),
+    Column("status", String(20), nullable=False, default="confirmed"),
+    Column("created_at", DateTime, nullable=False),
+    # 可用性檢查依場地與日期查詢
+    Index("ix_bookings_venue_date", "venue_id", "booking_date"),
+)
+
+# 使用行為紀錄（收藏、喜歡、瀏覽詳情、預訂），供協同過濾訓練；
+# 只新增不修改，模型以遞增的 id 讀取新紀錄
+interactions_table = Table(
+    "interactions", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_key", String(64), nullable=False, index=True),
+    Column("venue_id", BigInteger, nullable=False, index=True),
+    Column("event", String(20), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+meta_table = Table(
+    "storage_meta", metadata,
+    Column("key", String(64), primary_key=True),
+    Column("value", String(255)),
+)
+
+# ---- 預先定義的查詢（綁定參數，編譯結果由 SQLAlchemy 快取） ----
+_ACTIVE_BOOKING_STATUSES = ("confirmed", "pending")
+
+_SELECT_VERSION = select(meta_table.c.value).where(meta_table.c.key == bindparam("key"))
+
+_SELECT_REVIEWS = (
+    select(
+        reviews_table.c.id, reviews_table.c.user_name, reviews_table.c.rating,
+        reviews_table.c.comment, reviews_table.c.created_at, reviews_table.c.is_approved,
+    )
+    .where(reviews_table.c.venue_id == bindparam("venue_id"))
+    .order_by(reviews_table.c.created_at.desc())
+    .limit(bindparam("limit"))
+)
+_SELECT_APPROVED_REVIEWS = _SELECT_REVIEWS.where(reviews_table.c.is_approved.is_(True))
+
+_SELECT_REVIEW_SUMMARY = (
+    select(func.count(reviews_table.c.id), func.avg(reviews_table.c.rating))
+    .where(reviews_table.c.venue_id == bindparam("venue_id"))
+    .where(reviews_table.c.is_approved.is_(True))
+)
+
+_APPROVE_REVIEW = (
+    update(reviews_table)
+    .where(reviews_table.c.id == bindparam("review_id"))
+    .values(is_approved=bindparam("approved"))
+)
+
+_SELECT_DAY_BOOKINGS = (
+    select(bookings_table.c.id, bookings_table.c.start_time, bookings_table.c.end_time)
+    .where(bookings_table.c.venue_id == bindparam("venue_id"))
+    .where(bookings_table.c.booking_date == bindparam("booking_date"))
+    .where(bookings_table.c.status.in_(_ACTIVE_BOOKING_STATUSES))
+    .order_by(bookings_table.c.start_time)
+)
+
+_SELECT_DATE_BOOKINGS = (
+    select(bookings_table.c.id, bookings_table.c.venue_id, bookings_table.c.start_time, bookings_table.c.end_time)
+    .where(bookings_table.c.venue_id.in_(bindparam("venue_ids", expanding=True)))
+    .where(bookings_table.c.booking_date == bindparam("booking_date"))
+    .where(bookings_table.c.status.in_(_ACTIVE_BOOKING_STATUSES))
+    .order_by(bookings_table.c.venue_id, bookings_table.c.start_time)
+)
+
+_LOCK_VENUE = select(venues_table.c.id).where(venues_table.c.id == bindparam("venue_id")).with_for_update()
+
+_COUNT_OVERLAPS = (
+    select(func.count(bookings_table.c.id))
+    .where(bookings_table.c.venue_id == bindparam("venue_id"))
+    .where(bookings_table.c.booking_date == bindparam("booking_date"))
+    .where(bookings_table.c.status.in_(_ACTIVE_BOOKING_STATUSES))
+    .where(bookings_table.c.start_time < bindparam("end_time"))
+    .where(bookings_table.c.end_time > bindparam("start_time"))
+)
+
+
+_SELECT_INTERACTIONS_SINCE = (
+    select(
+        interactions_table.c.id, interactions_table.c.user_key,
+        interactions_table.c.venue_id, interactions_table.c.event,
+    )
+    .where(interactions_table.c.id > bindparam("last_id"))
+    .order_by(interactions_table.c.id)
+    .limit(bindparam("limit"))
+)
+
+
+def _parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def _parse_time(value) -> time:
+    if isinstance(value, time):
+        return value
+    return time.fromisoformat(str(value))
+
+
+class VenueStorage:
+    """
+    場地、評論與預訂的資料庫存取
+    """
+
+    def __init__(self, database_url: Optional[str] = None):
+        """
+        建立連線池與資料表
+
+        Args:
+            database_url: SQLAlchemy 連線字串，預設讀取 DATABASE_URL 環境變數，
+                未設定時使用本機 SQLite
+        """
+        self.database_url = database_url or os.environ.get("DATABASE_URL") or DEFAULT_DATABASE_URL
+        self.engine = self._create_engine(self.database_url)
+        self._immediate_engine = self.engine.execution_options(**{IMMEDIATE_OPTION: True})
+        metadata.create_all(self.engine)
+        self._sync_lock = threading.Lock()
+        # 第一次場地同步完成後才允許寫入參照 venues 的資料（評論、預訂的外鍵）
+        self._venues_synced = threading.Event()
+
+    @staticmethod
+    def _create_engine(url: str) -> Engine:
+        if url.startswith("sqlite"):
+            if url.startswith("sqlite:///"):
+                Path(url[len("sqlite:///"):]).parent.mkdir(parents=True, exist_ok=True)
+            engine = create_engine(
+                url,
+                pool_size=5,
+                max_overflow=10,
+                pool_pre_ping=True,
+                connect_args={"check_same_thread": False, "timeout": 30},
+            )
+
+            @event.listens_for(engine, "connect")
+            def _sqlite_pragmas(dbapi_conn, _record):
+                # pysqlite 預設延到第一個寫入陳述式才開始交易，改由下方的 begin 事件自行發出 BEGIN
+                dbapi_conn.isolation_level = None
+                # WAL 讓讀取不會被寫入阻擋；多個 worker 共用同一個檔案時尤其重要
+                cur = dbapi_conn.cursor()
+                cur.execute("PRAGMA journal_mode=WAL")
+                cur.execute("PRAGMA synchronous=NORMAL")
+                cur.execute("PRAGMA foreign_keys=ON")
+                cur.close()
+
+            @event.listens_for(engine, "begin")
+            def _sqlite_begin(conn):
+                # 先檢查再寫入的交易以 BEGIN IMMEDIATE 開始，檢查前就取得寫入鎖
+                immediate = conn.get_execution_options().get(IMMEDIATE_OPTION)
+                conn.exec_driver_sql("BEGIN IMMEDIATE" if immediate else "BEGIN")
+
+            return engine
+
+        return create_engine(
+            url,
+            pool_size=int(os.environ.get("DATABASE_POOL_SIZE", "5")),
+            max_overflow=int(os.environ.get("DATABASE_MAX_OVERFLOW", "10")),
+            pool_pre_ping=True,
+            pool_recycle=1800,
+        )
+
+    def _upsert(self, table: Table, key_cols: List[str]):
+        """依資料庫方言建立 INSERT ... ON CONFLICT DO UPDATE 陳述式"""
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        updates = {c.name: stmt.excluded[c.name] for c in table.columns if c.name not in key_cols}
+        return stmt.on_conflict_do_update(index_elements=key_cols, set_=updates)
+
+    # ---- 場地 ----
+    def get_data_version(self) -> Optional[str]:
+        """資料庫中場地資料的版本"""
+        with self.engine.connect() as conn:
+            return conn.execute(_SELECT_VERSION, {"key": "venues_version"}).scalar()
+
+    def sync_venues(self, venues_df: pd.DataFrame, version: str) -> bool:
+        """
+        將場地快照同步到 venues 資料表
+
+        同一版本只同步一次；以 upsert 寫入，既有評論與預訂的外鍵不受影響。
+
+        Args:
+            venues_df: 場地資料
+            version: 資料版本
+
+        Returns:
+            是否實際寫入
+        """
+        try:
+            return self._sync_venues(venues_df, version)
+        finally:
+            # 同步失敗時也放行，寫入會以外鍵錯誤回報，而不是一直等待
+            self._venues_synced.set()
+
+    def _sync_venues(self, venues_df: pd.DataFrame, version: str) -> bool:
+        if venues_df is None or venues_df.empty or "id" not in venues_df.columns:
+            return False
+
+        with self._sync_lock:
+            if self.get_data_version() == version:
+                return False
+
+            cols = [c.name for c in venues_table.columns if c.name != "data_version" and c.name in venues_df.columns]
+            frame = venues_df[cols].astype(object).where(venues_df[cols].notna(), None)
+            frame["data_version"] = version
+            records = frame.to_dict("records")
+            for r in records:
+                r["id"] = int(r["id"])
+                r["name"] = str(r.get("name") or "")
+                for c in ("district", "sport_type", "address"):
+                    if r.get(c) is not None:
+                        r[c] = str(r[c])
+
+            with self.engine.begin() as conn:
+                stmt = self._upsert(venues_table, ["id"])
+                for i in range(0, len(records), 1000):
+                    conn.execute(stmt, records[i:i + 1000])
+                conn.execute(self._upsert(meta_table, ["key"]), {"key": "venues_version", "value": version})
+            return True
+
+    def wait_for_venues(self, timeout: float = VENUE_SYNC_TIMEOUT):
+        """
+        等待第一次場地同步完成
+
+        場地資料由 VenueRepository 在背景同步；在此之前寫入評論或預訂會違反外鍵，
+        PostgreSQL 的場地列鎖也鎖不到任何列。
+
+        Raises:
+            RuntimeError: 超過 timeout 秒仍未同步
+        """
+        if not self._venues_synced.wait(timeout):
+            raise RuntimeError("場地資料尚未同步到資料庫，請稍後再試")
+
+    # ---- 評論 ----
+    def get_venue_reviews(self, venue_id: int, approved_only: bool = True, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        取得場地評論（新到舊）
+
+        Args:
+            venue_id: 場地ID
+            approved_only: 是否只回傳已審核的評論
+            limit: 最多筆數
+
+        Returns:
+            評論 dict 列表
+        """
+        stmt = _SELECT_APPROVED_REVIEWS if approved_only else _SELECT_REVIEWS
+        with self.engine.connect() as conn:
+            rows = conn.execute(stmt, {"venue_id": int(venue_id), "limit": int(limit)})
+            return [dict(r._mapping) for r in rows]
+
+    def get_review_summary(self, venue_id: int) -> Dict[str, Any]:
+        """已審核評論的數量與平均評分"""
+        with self.engine.connect() as conn:
+            count, avg = conn.execute(_SELECT_REVIEW_SUMMARY, {"venue_id": int(venue_id)}).one()
+        return {"review_count": int(count or 0), "avg_rating": float(avg) if avg is not None else None}
+
+    def add_review(self, venue_id: int, user_name: str, rating: int, comment: str) -> Optional[int]:
+        """
+        新增評論（待審核）
+
+        Returns:
+            評論ID；失敗時回傳 None
+        """
+        self.wait_for_venues()
+        with self.engine.begin() as conn:
+            result = conn.execute(reviews_table.insert().values(
+                venue_id=int(venue_id),
+                user_name=user_name,
+                rating=int(rating),
+                comment=comment,
+                is_approved=False,
+                created_at=datetime.now(),
+            ))
+            return result.inserted_primary_key[0]
+
+    def approve_review(self, review_id: int, approved: bool = True) -> bool:
+        """審核評論"""
+        with self.engine.begin() as conn:
+            result = conn.execute(_APPROVE_REVIEW, {"review_id": int(review_id), "approved": bool(approved)})
+            return result.rowcount > 0
+
+    # ---- 預訂 ----
+    def get_bookings(self, venue_id: int, booking_date) -> List[Dict[str, Any]]:
+        """取得場地某日的有效預訂（依開始時間排序）"""
+        params = {"venue_id": int(venue_id), "booking_date": _parse_date(booking_date)}
+        with self.engine.connect() as conn:
+            return [dict(r._mapping) for r in conn.execute(_SELECT_DAY_BOOKINGS, params)]
+
+    def check_availability(self, venue_id: int, booking_date, start_time, end_time) -> bool:
+        """
+        檢查時段是否可預訂（與既有預訂不重疊）
+
+        Args:
+            venue_id: 場地ID
+            booking_date: 日期（date 或 'YYYY-MM-DD'）
+            start_time: 開始時間（time 或 'HH:MM[:SS]'）
+            end_time: 結束時間
+
+        Returns:
+            是否可預訂
+        """
+        params = {
+            "venue_id": int(venue_id),
+            "booking_date": _parse_date(booking_date),
+            "start_time": _parse_time(start_time),
+            "end_time": _parse_time(end_time),
+        }
+        with self.engine.connect() as conn:
+            return conn.execute(_COUNT_OVERLAPS, params).scalar() == 0
+
+    def get_bookings_for_date(self, venue_ids: List[int], booking_date) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        一次取得多個場地某日的有效預訂
+
+        Args:
+            venue_ids: 場地ID列表
+            booking_date: 日期
+
+        Returns:
+            {場地ID: 預訂列表（依開始時間排序）}；沒有預訂的場地不會出現在結果中
+        """
+        result: Dict[int, List[Dict[str, Any]]] = {}
+        ids = [int(v) for v in venue_ids]
+        if not ids:
+            return result
+        params = {"booking_date": _parse_date(booking_date)}
+        with self.engine.connect() as conn:
+            # 分批避免超過 SQLite 的參數數量上限
+            for i in range(0, len(ids), 500):
+                params["venue_ids"] = ids[i:i + 500]
+                for r in conn.execute(_SELECT_DATE_BOOKINGS, params):
+                    row = dict(r._mapping)
+                    result.setdefault(row.pop("venue_id"), []).append(row)
+        return result
+
+    def create_booking(self, venue_id: int, user_name: str, user_email: str, user_phone: str,
+                       booking_date, start_time, end_time, special_requests: str = "") -> Optional[int]:
+        """
+        建立預訂
+
+        重疊檢查與寫入在同一個交易中完成，且檢查前就取得鎖：PostgreSQL 先鎖定場地列，
+        使同一場地的預訂依序執行；SQLite 以 BEGIN IMMEDIATE 開始交易，取得資料庫寫入鎖後才檢查，
+        其他行程的預訂交易會等待（最多 timeout 秒）本交易提交後再檢查。
+
+        Returns:
+            預訂ID；時段衝突時回傳 None
+        """
+        params = {
+            "venue_id": int(venue_id),
+            "booking_date": _parse_date(booking_date),
+            "start_time": _parse_time(start_time),
+            "end_time": _parse_time(end_time),
+        }
+        self.wait_for_venues()
+        with self._immediate_engine.begin() as conn:
+            if self.engine.dialect.name == "postgresql":
+                conn.execute(_LOCK_VENUE, {"venue_id": params["venue_id"]})
+            if conn.execute(_COUNT_OVERLAPS, params).scalar() > 0:
+                return None
+            result = conn.execute(bookings_table.insert().values(
+                user_name=user_name,
+                user_email=user_email,
+                user_phone=user_phone,
+                special_requests=special_requests,
+                status="confirmed",
+                created_at=datetime.now(),
+                **params,
+            ))
+            return result.inserted_primary_key[0]
+
+    # ---- 使用行為 ----
+    def add_interaction(self, user_key: str, venue_id: int, event: str) -> Optional[int]:
+        """
+        記錄一筆使用行為
+
+        Args:
+            user_key: 使用者識別（登入帳號或匿名 session）
+            venue_id: 場地ID
+            event: 行為類型（favorite、like、dislike、view、booking）
+
+        Returns:
+            紀錄ID
+        """
+        with self.engine.begin() as conn:
+            result = conn.execute(interactions_table.insert().values(
+                user_key=str(user_key),
+                venue_id=int(venue_id),
+                event=str(event),
+                created_at=datetime.now(),
+            ))
+            return result.inserted_primary_key[0]
+
+    def get_interactions_since(self, last_id: int = 0, limit: int = 100000) -> List[Dict[str, Any]]:
+        """
+        讀取 id 大於 last_id 的使用行為（依 id 排序）
+
+        Args:
+            last_id: 上次讀到的紀錄ID
+            limit: 最多筆數
+
+        Returns:
+            紀錄 dict 列表（id、user_key、venue_id、event）
+        """
+        params = {"last_id": int(last_id), "limit": int(limit)}
+        with self.engine.connect() as conn:
+            return [dict(r._mapping) for r in conn.execute(_SELECT_INTERACTIONS_SINCE, params)]
+
+
+_shared_storage = None
+_shared_storage_lock = threading.Lock()
+
+
+def get_storage() -> VenueStorage:
+    """取得行程共用的 VenueStorage（連線池由所有 session 共用）"""
+    global _shared_storage
+    if _shared_storage is None:
+        with _shared_storage_lock:
+            if _shared_storage is None:
+                _shared_storage = VenueStorage()
+    return _shared_storage
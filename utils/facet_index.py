@@ -0,0 +1,294 @@
+# utils/facet_index.py
+"""
+場地多條件篩選索引
+
+每個運動類型、行政區與設施項目各預先建立一個位元圖（以 np.packbits 壓縮），
+價格與評分則保留排序後的數值陣列。任意篩選組合都先轉成位元圖，
+再以 bitwise AND 合併為一組列位置，過程中不產生任何中間 DataFrame。
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import copy
+import hashlib
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# 設施欄位的分隔符號（如「淋浴間/置物櫃/停車場」）
+_FACILITY_SEP = re.compile(r"[/、,，;；\s]+")
+
+# 每個位元組的 1 位元數量，用於計算位元圖的筆數
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# 統計直方圖的分箱邊界（含左不含右，最後一箱含右端）
+PRICE_BINS = [0, 200, 500, 1000, np.inf]
+RATING_BINS = [0.0, 3.5, 4.0, 4.5, 5.0]
+
+
+def split_facilities(text) -> List[str]:
+    """將設施欄位拆成個別項目"""
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return []
+    return [t for t in _FACILITY_SEP.split(str(text)) if t]
+
+
+class FacetIndex:
+    """
+    場地多條件篩選索引
+    """
+
+    # 建立位元圖的類別欄位
+    CATEGORY_FIELDS = ["sport_type", "district"]
+    # 建立排序陣列的數值欄位
+    RANGE_FIELDS = ["price_per_hour", "rating"]
+    # 統計結果快取筆數上限
+    COUNTS_CACHE_SIZE = 256
+
+    def __init__(self, venues_df: pd.DataFrame):
+        """
+        建立索引
+
+        Args:
+            venues_df: 場地資料 DataFrame
+        """
+        self.n_rows = len(venues_df)
+        self._n_bytes = (self.n_rows + 7) // 8
+        self._all = self._pack(np.ones(self.n_rows, dtype=bool))
+
+        # {欄位: {值: 位元圖}}
+        self.bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        for col in self.CATEGORY_FIELDS:
+            if col in venues_df.columns:
+                self.bitmaps[col] = self._build_value_bitmaps(venues_df[col])
+
+        # 設施欄位的原始字串（不重複）與各列代碼，供跨分隔符號的關鍵字比對
+        self._facility_codes = np.full(self.n_rows, -1, dtype=np.intp)
+        self._facility_texts: List[str] = []
+        if "facilities" in venues_df.columns:
+            self.bitmaps["facilities"] = self._build_facility_bitmaps(venues_df["facilities"])
+
+        # {欄位: (排序後數值, 對應列位置)}；缺值不列入
+        self.sorted_values: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for col in self.RANGE_FIELDS:
+            if col in venues_df.columns:
+                values = pd.to_numeric(venues_df[col], errors="coerce").to_numpy(dtype=float)
+                rows = np.flatnonzero(~np.isnan(values))
+                order = rows[np.argsort(values[rows], kind="stable")]
+                self.sorted_values[col] = (values[order], order.astype(np.int32))
+
+        # 直方圖各分箱的位元圖
+        self.histogram_bins: Dict[str, Tuple[List[float], List[np.ndarray]]] = {}
+        for col, edges in (("price_per_hour", PRICE_BINS), ("rating", RATING_BINS)):
+            if col in self.sorted_values:
+                self.histogram_bins[col] = (edges, self._build_bin_bitmaps(col, edges))
+
+        self._counts_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._counts_lock = threading.Lock()
+
+    # ---- 位元圖工具 ----
+    def _pack(self, mask: np.ndarray) -> np.ndarray:
+        return np.packbits(mask)
+
+    def _from_rows(self, rows: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[rows] = True
+        return self._pack(mask)
+
+    def to_rows(self, bitmap: np.ndarray) -> np.ndarray:
+        """位元圖轉為列位置（由小到大）"""
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_rows)).astype(np.int32)
+
+    def _build_value_bitmaps(self, series: pd.Series) -> Dict[str, np.ndarray]:
+        codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=True)
+        return {str(value): self._pack(codes == k) for k, value in enumerate(uniques)}
+
+    def _build_facility_bitmaps(self, series: pd.Series) -> Dict[str, np.ndarray]:
+        # 只解析不重複的設施字串，再以代碼展開到各列
+        codes, uniques = pd.factorize(series.astype(object), use_na_sentinel=True)
+        self._facility_codes = codes
+        self._facility_texts = [str(text) for text in uniques]
+        token_codes: Dict[str, List[int]] = {}
+        for k, text in enumerate(uniques):
+            for token in split_facilities(text):
+                token_codes.setdefault(token, []).append(k)
+        return {token: self._pack(np.isin(codes, ks)) for token, ks in token_codes.items()}
+
+    def _build_bin_bitmaps(self, field: str, edges: List[float]) -> List[np.ndarray]:
+        values, order = self.sorted_values[field]
+        cuts = np.searchsorted(values, edges, side="left")
+        # 最後一箱包含右端點
+        cuts[-1] = len(values)
+        return [self._from_rows(order[cuts[i]:cuts[i + 1]]) for i in range(len(edges) - 1)]
+
+    @staticmethod
+    def popcount(bitmap: np.ndarray) -> int:
+        """位元圖中為 1 的筆數"""
+        return int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+    def _any_of(self, field: str, values: Iterable[str]) -> np.ndarray:
+        """任一值符合（OR）的位元圖"""
+        bitmap = np.zeros(self._n_bytes, dtype=np.uint8)
+        for value in values:
+            bm = self.bitmaps.get(field, {}).get(str(value))
+            if bm is not None:
+                bitmap |= bm
+        return bitmap
+
+    def _facility(self, keyword: str) -> np.ndarray:
+        """
+        設施關鍵字的位元圖：包含該關鍵字的所有設施項目取 OR
+
+        關鍵字本身含分隔符號（如「淋浴間/置物櫃」）時無法對應到單一項目，
+        改為在原始設施字串中做子字串比對，結果與逐列 str.contains 相同。
+        """
+        keyword = str(keyword)
+        if not keyword or _FACILITY_SEP.search(keyword):
+            ks = [k for k, text in enumerate(self._facility_texts) if keyword in text]
+            return self._pack(np.isin(self._facility_codes, ks))
+        tokens = [t for t in self.bitmaps.get("facilities", {}) if keyword in t]
+        return self._any_of("facilities", tokens)
+
+    def range_rows(self, field: str, low: Optional[float] = None, high: Optional[float] = None) -> np.ndarray:
+        """
+        數值區間查詢（含端點）
+
+        Args:
+            field: 欄位名稱
+            low: 下限，None 表示不限
+            high: 上限，None 表示不限
+
+        Returns:
+            符合條件的列位置（未排序）
+        """
+        values, order = self.sorted_values.get(field, (np.empty(0), np.empty(0, dtype=np.int32)))
+        lo = 0 if low is None else np.searchsorted(values, low, side="left")
+        hi = len(values) if high is None else np.searchsorted(values, high, side="right")
+        return order[lo:hi]
+
+    def filter_bitmap(self,
+                      sport_types: Optional[Iterable[str]] = None,
+                      districts: Optional[Iterable[str]] = None,
+                      price_range: Optional[Tuple[float, float]] = None,
+                      facilities: Optional[Iterable[str]] = None,
+                      min_rating: float = 0.0) -> np.ndarray:
+        """
+        將篩選條件合併為單一位元圖
+
+        同一欄位內的多個值取 OR；不同條件之間取 AND。未指定的條件不限制。
+
+        Returns:
+            packbits 格式的位元圖
+        """
+        bitmap = self._all.copy()
+
+        if sport_types and "sport_type" in self.bitmaps:
+            bitmap &= self._any_of("sport_type", sport_types)
+        if districts and "district" in self.bitmaps:
+            bitmap &= self._any_of("district", districts)
+        if price_range and "price_per_hour" in self.sorted_values:
+            min_p, max_p = price_range
+            bitmap &= self._from_rows(self.range_rows("price_per_hour", min_p, max_p))
+        if facilities and "facilities" in self.bitmaps:
+            for f in facilities:
+                bitmap &= self._facility(f)
+        if min_rating > 0 and "rating" in self.sorted_values:
+            bitmap &= self._from_rows(self.range_rows("rating", min_rating, None))
+
+        return bitmap
+
+    def filter(self, rows: Optional[np.ndarray] = None, **filters) -> np.ndarray:
+        """
+        依條件篩選
+
+        Args:
+            rows: 預先限定的列位置（例如關鍵字搜尋結果），None 表示全部
+            **filters: 傳給 filter_bitmap 的篩選條件
+
+        Returns:
+            符合條件的列位置（由小到大）
+        """
+        bitmap = self.filter_bitmap(**filters)
+        if rows is not None:
+            bitmap &= self._from_rows(rows)
+        return self.to_rows(bitmap)
+
+    def facet_counts(self, rows: Optional[np.ndarray] = None, **filters) -> Dict[str, Any]:
+        """
+        計算篩選結果的分面統計
+
+        以各值的位元圖與篩選位元圖做 AND 後計數，不經過 pandas groupby；
+        相同條件的結果會被快取，重新整理頁面時直接取用；回傳的是快取的複本，可自由修改。
+
+        Args:
+            rows: 預先限定的列位置（例如關鍵字搜尋結果），None 表示全部
+            **filters: 傳給 filter_bitmap 的篩選條件
+
+        Returns:
+            {
+                "total": 筆數,
+                "district": {行政區: 筆數}（依筆數遞減，不含 0）,
+                "sport_type": {運動類型: 筆數},
+                "price_histogram": [{"low", "high", "count"}, ...],
+                "rating_histogram": [{"low", "high", "count"}, ...],
+                "avg_price_per_hour": 平均價格或 None,
+                "avg_rating": 平均評分或 None,
+            }
+        """
+        key = self._counts_key(rows, filters)
+        with self._counts_lock:
+            cached = self._counts_cache.get(key)
+            if cached is not None:
+                self._counts_cache.move_to_end(key)
+                return copy.deepcopy(cached)
+
+        bitmap = self.filter_bitmap(**filters)
+        if rows is not None:
+            bitmap &= self._from_rows(rows)
+
+        result: Dict[str, Any] = {"total": self.popcount(bitmap)}
+        for field in self.CATEGORY_FIELDS:
+            counts = {
+                value: self.popcount(bm & bitmap)
+                for value, bm in self.bitmaps.get(field, {}).items()
+            }
+            result[field] = dict(sorted(
+                ((v, c) for v, c in counts.items() if c > 0), key=lambda kv: -kv[1]
+            ))
+
+        for field, name in (("price_per_hour", "price_histogram"), ("rating", "rating_histogram")):
+            edges, bins = self.histogram_bins.get(field, ([], []))
+            result[name] = [
+                {"low": float(edges[i]), "high": float(edges[i + 1]), "count": self.popcount(bm & bitmap)}
+                for i, bm in enumerate(bins)
+            ]
+
+        selected = None
+        for field, name in (("price_per_hour", "avg_price_per_hour"), ("rating", "avg_rating")):
+            result[name] = None
+            if field in self.sorted_values:
+                if selected is None:
+                    selected = np.unpackbits(bitmap, count=self.n_rows).astype(bool)
+                values, order = self.sorted_values[field]
+                picked = values[selected[order]]
+                if picked.size:
+                    result[name] = float(picked.mean())
+
+        with self._counts_lock:
+            self._counts_cache[key] = result
+            if len(self._counts_cache) > self.COUNTS_CACHE_SIZE:
+                self._counts_cache.popitem(last=False)
+        # 快取中的結果不交給呼叫端，避免被修改後影響下一次查詢
+        return copy.deepcopy(result)
+
+    @staticmethod
+    def _counts_key(rows: Optional[np.ndarray], filters: Dict[str, Any]) -> tuple:
+        def norm(v):
+            if isinstance(v, set):
+                return tuple(sorted(map(str, v)))
+            if isinstance(v, (list, tuple)):
+                return tuple(v)
+            return v
+        rows_key = None if rows is None else hashlib.blake2b(np.asarray(rows).tobytes()).hexdigest()
+        return (rows_key,) + tuple((k, norm(v)) for k, v in sorted(filters.items()))
@@ -0,0 +1,547 @@
+# utils/geocoder.py
+"""
+場地地址的離線批次地理編碼
+
+地址先正規化（全形轉半形、臺→台、段名國字轉數字、去除郵遞區號與樓層等門牌以後的部分），
+以正規化後的地址作為快取鍵存放在磁碟上的 JSON 檔。重新執行時只查詢快取中沒有的地址，
+因此只有新增或修改過的地址需要重新編碼。
+
+查詢由可替換的後端負責：
+- GazetteerGeocoder：本地路段檔（CSV），依門牌號碼在路段起訖點之間內插（預設後端，不連網路）
+- HttpGeocoder：HTTP 地理編碼服務（Nominatim 相容的 JSON 回應）
+- StubGeocodingServer：在本機啟動的假服務，不連外網即可測試 HttpGeocoder
+
+專案沒有附帶路段檔，也沒有預設的地理編碼服務：路段檔需以 --gazetteer 或 GAZETTEER_PATH 指定，
+HTTP 後端需以 --url 或 GEOCODER_URL 明確設定服務網址，未設定時直接報錯，絕不會自行連到外部服務。
+編譯場地資料時只讀取快取（utils.venue_store），不會發出任何查詢。
+
+執行指令：
+    python -m utils.geocoder [csv 路徑] [--gazetteer=路段檔] [--retry-failed]
+    python -m utils.geocoder [csv 路徑] --backend=http --url=服務網址 [--retry-failed]
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_CACHE_PATH = Path(os.environ.get("GEOCODE_CACHE_PATH", BASE_DIR / ".cache" / "geocode" / "geocode_cache.json"))
+# 路段檔與地理編碼服務都必須明確設定，沒有內建預設值
+DEFAULT_GAZETTEER_PATH = Path(os.environ["GAZETTEER_PATH"]) if os.environ.get("GAZETTEER_PATH") else None
+DEFAULT_GEOCODER_URL = os.environ.get("GEOCODER_URL") or None
+
+# 每寫入多少筆結果就保存一次快取，中斷時不會遺失太多進度
+CACHE_SAVE_EVERY = 50
+
+Coordinates = Tuple[float, float]
+
+_CHINESE_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+_SECTION = re.compile(r"([一二三四五六七八九十]+)段")
+_POSTAL_CODE = re.compile(r"^\d{3,6}")
+# 門牌之後的樓層、附註（如「2樓之1」、「B1」、「地下室」）不影響座標
+_AFTER_NUMBER = re.compile(r"(號).*$")
+_ADDRESS = re.compile(
+    r"^(?:台北市)?(?P<district>[^市]{1,3}區)?"
+    r"(?P<road>.+?(?:路|街|大道)(?:\d+段)?)"
+    r"(?:(?P<lane>\d+)巷)?(?:(?P<alley>\d+)弄)?"
+    r"(?P<number>\d+)(?:之\d+)?號"
+)
+
+
+def _chinese_number(text: str) -> int:
+    """一 ~ 九十九的國字數字轉為整數"""
+    if text == "十":
+        return 10
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return _CHINESE_DIGITS.get(tens, 1) * 10 + _CHINESE_DIGITS.get(ones, 0)
+    return _CHINESE_DIGITS.get(text, 0)
+
+
+def normalize_address(address) -> str:
+    """
+    地址正規化，作為快取鍵與路段比對使用
+
+    Args:
+        address: 原始地址
+
+    Returns:
+        正規化後的地址；空值回傳空字串
+    """
+    if address is None or (isinstance(address, float) and np.isnan(address)):
+        return ""
+    text = unicodedata.normalize("NFKC", str(address))
+    text = re.sub(r"\s+", "", text).replace("臺", "台")
+    text = _POSTAL_CODE.sub("", text)
+    text = _SECTION.sub(lambda m: f"{_chinese_number(m.group(1))}段", text)
+    return _AFTER_NUMBER.sub(r"\1", text)
+
+
+def parse_address(normalized: str) -> Optional[Dict]:
+    """
+    拆解正規化地址
+
+    Returns:
+        {district, road, lane, alley, number}；無法辨識時回傳 None
+    """
+    m = _ADDRESS.match(normalized)
+    if not m:
+        return None
+    parts = m.groupdict()
+    for key in ("lane", "alley", "number"):
+        parts[key] = int(parts[key]) if parts[key] else None
+    return parts
+
+
+class RateLimiter:
+    """
+    多執行緒共用的速率限制（每次呼叫 wait 至少間隔 1/rate 秒）
+    """
+
+    def __init__(self, rate_per_second: float):
+        """
+        Args:
+            rate_per_second: 每秒最多請求數，0 或負數表示不限制
+        """
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class GeocoderBackend(ABC):
+    """
+    地理編碼後端介面
+
+    Attributes:
+        name: 後端名稱（記錄在快取中）
+        rate_limit: 每秒最多查詢次數，0 表示不限制
+    """
+
+    name = "base"
+    rate_limit = 0.0
+
+    @abstractmethod
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        """
+        查詢單一地址
+
+        Args:
+            address: 正規化後的地址
+
+        Returns:
+            (緯度, 經度)；查無結果時回傳 None，暫時性錯誤請拋出例外
+        """
+
+
+class GazetteerGeocoder(GeocoderBackend):
+    """
+    本地路段檔地理編碼
+
+    路段檔為 CSV，欄位：
+        road（路名含段，如「中山北路7段」）、district（選填）、
+        from_number、to_number（門牌範圍）、from_lat、from_lon、to_lat、to_lon（路段起訖點）
+    只有單一點的路段（如短巷）起訖點相同即可。
+    """
+
+    name = "gazetteer"
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: 路段檔路徑
+        """
+        if not Path(path).exists():
+            raise FileNotFoundError(f"找不到路段檔: {path}")
+        segments = pd.read_csv(path, encoding="utf-8-sig")
+        segments["road"] = segments["road"].map(normalize_address)
+        if "district" not in segments.columns:
+            segments["district"] = None
+        segments["district"] = segments["district"].map(lambda d: normalize_address(d) or None)
+        # 以路名分組，每條路的路段依起始門牌排序
+        self._roads: Dict[str, pd.DataFrame] = {
+            road: group.sort_values("from_number").reset_index(drop=True)
+            for road, group in segments.groupby("road", sort=False)
+        }
+
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        parts = parse_address(address)
+        if parts is None:
+            return None
+        segments = self._roads.get(parts["road"])
+        if segments is None:
+            return None
+        if parts["district"]:
+            in_district = segments[segments["district"].isna() | (segments["district"] == parts["district"])]
+            segments = in_district if not in_district.empty else segments
+
+        # 巷弄以所在巷口的門牌定位
+        number = parts["lane"] or parts["number"]
+        lo = segments["from_number"].to_numpy(dtype=float)
+        hi = segments["to_number"].to_numpy(dtype=float)
+        # 門牌落在範圍內的路段優先，否則取門牌範圍最接近的路段
+        gap = np.maximum(lo - number, 0) + np.maximum(number - hi, 0)
+        seg = segments.iloc[int(np.argmin(gap))]
+        span = seg["to_number"] - seg["from_number"]
+        t = float(np.clip((number - seg["from_number"]) / span, 0, 1)) if span > 0 else 0.0
+        lat = seg["from_lat"] + t * (seg["to_lat"] - seg["from_lat"])
+        lon = seg["from_lon"] + t * (seg["to_lon"] - seg["from_lon"])
+        return float(lat), float(lon)
+
+
+def _parse_nominatim(payload) -> Optional[Coordinates]:
+    """解析 Nominatim 相容的回應（結果陣列，或單一含 lat/lon 的物件）"""
+    if isinstance(payload, list):
+        payload = payload[0] if payload else None
+    if not isinstance(payload, dict):
+        return None
+    lat = payload.get("lat", payload.get("latitude"))
+    lon = payload.get("lon", payload.get("lng", payload.get("longitude")))
+    if lat is None or lon is None:
+        return None
+    return float(lat), float(lon)
+
+
+class HttpGeocoder(GeocoderBackend):
+    """
+    HTTP 地理編碼服務
+
+    使用 Nominatim 的查詢格式（q=地址&format=json）；服務網址必須由呼叫端指定，
+    公開服務的使用條款通常限制每秒 1 次。
+    """
+
+    name = "http"
+
+    def __init__(self, url: str, rate_limit: float = 1.0, timeout: float = 10.0,
+                 params: Optional[Dict[str, str]] = None, retries: int = 2,
+                 parse: Callable = _parse_nominatim):
+        """
+        Args:
+            url: 查詢網址（必填）
+            rate_limit: 每秒最多查詢次數
+            timeout: 單次請求逾時秒數
+            params: 額外的查詢參數（如 API key、countrycodes）
+            retries: 逾時或 429 / 5xx 時的重試次數
+            parse: 回應 JSON 的解析函式
+        """
+        if not url:
+            raise ValueError("HttpGeocoder 需要明確指定服務網址")
+        self.url = url
+        self.rate_limit = rate_limit
+        self.timeout = timeout
+        self.params = {"format": "json", "limit": "1", **(params or {})}
+        self.retries = retries
+        self.parse = parse
+
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        query = urllib.parse.urlencode({"q": address, **self.params})
+        request = urllib.request.Request(f"{self.url}?{query}", headers={"User-Agent": "finding-move-geocoder"})
+        for attempt in range(self.retries + 1):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return self.parse(json.loads(response.read().decode("utf-8")))
+            except urllib.error.HTTPError as e:
+                if (e.code != 429 and e.code < 500) or attempt == self.retries:
+                    raise
+            except (urllib.error.URLError, TimeoutError):
+                if attempt == self.retries:
+                    raise
+            # 指數退避
+            time.sleep(2 ** attempt)
+        return None
+
+
+class StubGeocodingServer:
+    """
+    本機假地理編碼服務（Nominatim 格式），供離線測試 HttpGeocoder
+
+    用法：
+        with StubGeocodingServer({"台北市...號": (25.03, 121.56)}) as stub:
+            HttpGeocoder(stub.url, rate_limit=0).geocode("台北市...號")
+    """
+
+    def __init__(self, table: Dict[str, Coordinates]):
+        """
+        Args:
+            table: 地址 → (緯度, 經度)；地址會先正規化
+        """
+        self.table = {normalize_address(k): v for k, v in table.items()}
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                found = stub.table.get(normalize_address(query.get("q", [""])[0]))
+                body = json.dumps([{"lat": str(found[0]), "lon": str(found[1])}] if found else []).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/search"
+
+    def __enter__(self) -> "StubGeocodingServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="geocode-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class GeocodeCache:
+    """
+    磁碟上的地理編碼快取（JSON，鍵為正規化地址）
+
+    每筆記錄 {"lat", "lon", "backend", "updated_at"}；查無結果的地址 lat/lon 為 null，
+    重新執行時預設不再查詢。
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH):
+        """
+        Args:
+            path: 快取檔路徑
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._dirty = 0
+        if self.path.exists():
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except Exception as e:
+                print(f"❌ 讀取地理編碼快取 {self.path} 發生錯誤，將重新建立: {e}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._entries.get(key)
+
+    def coordinates(self, key: str) -> Optional[Coordinates]:
+        """快取中的座標；沒有快取或查無結果時回傳 None"""
+        entry = self._entries.get(key)
+        if not entry or entry.get("lat") is None:
+            return None
+        return entry["lat"], entry["lon"]
+
+    def put(self, key: str, coords: Optional[Coordinates], backend: str):
+        with self._lock:
+            self._entries[key] = {
+                "lat": coords[0] if coords else None,
+                "lon": coords[1] if coords else None,
+                "backend": backend,
+                "updated_at": int(time.time()),
+            }
+            self._dirty += 1
+            if self._dirty >= CACHE_SAVE_EVERY:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                self._save_locked()
+
+    def _save_locked(self):
+        """寫入暫存檔後改名，讀取端不會讀到寫到一半的檔案"""
+        tmp = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=self.path.name + ".", dir=self.path.parent)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, sort_keys=True, indent=0)
+            os.replace(tmp, self.path)
+            self._dirty = 0
+        except Exception as e:
+            print(f"❌ 保存地理編碼快取 {self.path} 發生錯誤: {e}")
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+
+
+class BatchGeocoder:
+    """
+    批次地理編碼：去除重複與已快取的地址後，以多個執行緒查詢並寫回快取
+    """
+
+    def __init__(self, backend: GeocoderBackend, cache: Optional[GeocodeCache] = None, max_workers: int = 4):
+        """
+        Args:
+            backend: 地理編碼後端
+            cache: 快取，None 表示使用預設路徑
+            max_workers: 同時查詢的執行緒數（實際速率仍受後端的 rate_limit 限制）
+        """
+        self.backend = backend
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.max_workers = max(int(max_workers), 1)
+        self.limiter = RateLimiter(backend.rate_limit)
+
+    def pending(self, addresses: Iterable, retry_failed: bool = False) -> List[str]:
+        """
+        需要查詢的正規化地址（不重複，保持原順序）
+
+        Args:
+            addresses: 原始地址
+            retry_failed: 是否重新查詢先前查無結果的地址
+        """
+        keys = dict.fromkeys(k for k in map(normalize_address, addresses) if k)
+        pending = []
+        for key in keys:
+            entry = self.cache.get(key)
+            if entry is None or (retry_failed and entry.get("lat") is None):
+                pending.append(key)
+        return pending
+
+    def _lookup(self, key: str) -> Optional[Coordinates]:
+        self.limiter.wait()
+        return self.backend.geocode(key)
+
+    def run(self, addresses: Iterable, retry_failed: bool = False) -> Dict[str, int]:
+        """
+        查詢所有尚未快取的地址
+
+        Args:
+            addresses: 原始地址
+            retry_failed: 是否重新查詢先前查無結果的地址
+
+        Returns:
+            統計 {"queried", "found", "not_found", "errors"}
+        """
+        pending = self.pending(addresses, retry_failed)
+        stats = {"queried": len(pending), "found": 0, "not_found": 0, "errors": 0}
+        if not pending:
+            return stats
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="geocode") as pool:
+            futures = {pool.submit(self._lookup, key): key for key in pending}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    coords = future.result()
+                except Exception as e:
+                    # 暫時性錯誤不寫入快取，下次執行會再查詢
+                    stats["errors"] += 1
+                    print(f"❌ 地理編碼 {key} 發生錯誤: {e}")
+                    continue
+                self.cache.put(key, coords, self.backend.name)
+                stats["found" if coords else "not_found"] += 1
+
+        self.cache.save()
+        return stats
+
+
+def cached_coordinates(addresses: pd.Series, cache_path: Path = DEFAULT_CACHE_PATH) -> pd.DataFrame:
+    """
+    由快取取得各地址的座標（不發出任何查詢）
+
+    Args:
+        addresses: 原始地址
+        cache_path: 快取檔路徑
+
+    Returns:
+        與 addresses 同索引的 latitude、longitude 兩欄；沒有快取的地址為 NaN
+    """
+    coords = pd.DataFrame({"latitude": np.nan, "longitude": np.nan}, index=addresses.index)
+    if not Path(cache_path).exists():
+        return coords
+    cache = GeocodeCache(cache_path)
+    # 同一地址只查一次快取
+    codes, uniques = pd.factorize(addresses.map(normalize_address))
+    table = np.full((len(uniques) + 1, 2), np.nan)
+    for i, key in enumerate(uniques):
+        found = cache.coordinates(key)
+        if found:
+            table[i] = found
+    coords["latitude"], coords["longitude"] = table[codes, 0], table[codes, 1]
+    return coords
+
+
+def create_backend(name: str, gazetteer: Optional[Path] = None, url: Optional[str] = None) -> GeocoderBackend:
+    """
+    依名稱建立後端
+
+    Args:
+        name: gazetteer 或 http
+        gazetteer: 路段檔路徑，未指定時使用 GAZETTEER_PATH
+        url: HTTP 服務網址，未指定時使用 GEOCODER_URL
+
+    Returns:
+        地理編碼後端；未設定所需的路段檔或網址時拋出 ValueError
+    """
+    if name == "gazetteer":
+        path = gazetteer or DEFAULT_GAZETTEER_PATH
+        if path is None:
+            raise ValueError("未設定路段檔，請以 --gazetteer=路徑 或環境變數 GAZETTEER_PATH 指定")
+        return GazetteerGeocoder(Path(path))
+    if name == "http":
+        url = url or DEFAULT_GEOCODER_URL
+        if not url:
+            raise ValueError("HTTP 後端需要明確設定服務網址，請以 --url= 或環境變數 GEOCODER_URL 指定")
+        return HttpGeocoder(url)
+    raise ValueError(f"未知的地理編碼後端: {name}")
+
+
+if __name__ == "__main__":
+    from utils.venue_store import DEFAULT_CSV_PATH, compile_venue_store, read_source_csv
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    options = dict(a[2:].split("=", 1) if "=" in a else (a[2:], "1") for a in sys.argv[1:] if a.startswith("--"))
+    src = Path(args[0]) if args else DEFAULT_CSV_PATH
+
+    venues = read_source_csv(src)
+    if "address" not in venues.columns:
+        print(f"❌ {src.name} 沒有地址欄位")
+        sys.exit(1)
+
+    try:
+        backend = create_backend(options.get("backend", "gazetteer"), options.get("gazetteer"), options.get("url"))
+    except Exception as e:
+        print(f"❌ 無法建立地理編碼後端: {e}")
+        sys.exit(1)
+
+    geocoder = BatchGeocoder(backend, max_workers=int(options.get("workers", 4)))
+    stats = geocoder.run(venues["address"].dropna(), retry_failed="retry-failed" in options)
+    print(f"✅ 地理編碼完成：查詢 {stats['queried']} 筆，找到 {stats['found']} 筆，"
+          f"查無 {stats['not_found']} 筆，錯誤 {stats['errors']} 筆（快取共 {len(geocoder.cache)} 筆）")
+    if stats["found"]:
+        print(f"✅ 已重新編譯 {src.name} → {compile_venue_store(src)}")
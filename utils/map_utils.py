@@ -1,8 +1,47 @@
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Tuple, Optional, Any
+import hashlib
 import math
 
+# 地球半徑（公里）
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    向量化的 Haversine 距離
+
+    所有參數皆為弧度，可為純量或可廣播的 NumPy 陣列，一次回傳所有距離。
+
+    Args:
+        lat1: 第一點緯度（弧度）
+        lon1: 第一點經度（弧度）
+        lat2: 第二點緯度（弧度）
+        lon2: 第二點經度（弧度）
+
+    Returns:
+        距離（公里）
+    """
+    sin_dlat = np.sin((lat2 - lat1) * 0.5)
+    sin_dlon = np.sin((lon2 - lon1) * 0.5)
+    a = sin_dlat * sin_dlat + np.cos(lat1) * np.cos(lat2) * sin_dlon * sin_dlon
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def coordinates_in_radians(venues_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    取出場地座標（弧度）
+
+    Args:
+        venues_df: 場地資料 DataFrame（需有 latitude、longitude 欄位）
+
+    Returns:
+        (緯度, 經度, 座標有效遮罩)；無效座標為 NaN
+    """
+    lat = pd.to_numeric(venues_df['latitude'], errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(venues_df['longitude'], errors='coerce').to_numpy(dtype=float)
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    return np.radians(lat), np.radians(lon), valid
+
 class MapUtils:
     """
     地圖工具類別，提供地圖相關的功能和座標計算
@@ -99,7 +138,28 @@ class MapUtils:
         
         return r * c
     
-    def find_nearest_venue(self, venues_df: pd.DataFrame, target_lat: float, target_lon: float) -> Optional[Dict[str, Any]]:
+    def _indexed_rows(self, venues_df: pd.DataFrame, spatial_index) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        判斷 venues_df 能否使用空間索引
+        
+        Returns:
+            (是否使用索引, 限制查詢的快照列位置)；列位置為 None 表示整個快照
+        """
+        if spatial_index is None:
+            return False, None
+        rows = spatial_index.rows_for(venues_df)
+        if rows is None:
+            return False, None
+        # 標籤不重複，列數相同即為整個快照
+        return True, (None if len(rows) == spatial_index.n_rows else rows)
+    
+    def _take_rows(self, venues_df: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+        """依快照列位置取出 venues_df 的列（保持 venues_df 的順序）"""
+        local = np.sort(venues_df.index.get_indexer(rows))
+        return venues_df.take(local)
+    
+    def find_nearest_venue(self, venues_df: pd.DataFrame, target_lat: float, target_lon: float,
+                           spatial_index=None) -> Optional[Dict[str, Any]]:
         """
         尋找距離指定座標最近的場地
         
@@ -107,6 +167,7 @@ class MapUtils:
             venues_df: 場地資料 DataFrame
             target_lat: 目標緯度
             target_lon: 目標經度
+            spatial_index: 快照的 SpatialIndex；venues_df 為該快照或其篩選結果時使用索引查詢
             
         Returns:
             最近場地的資料字典
@@ -117,24 +178,65 @@ class MapUtils:
         if 'latitude' not in venues_df.columns or 'longitude' not in venues_df.columns:
             return None
         
-        min_distance = float('inf')
-        nearest_venue = None
-        
-        for idx, venue in venues_df.iterrows():
-            if pd.notna(venue['latitude']) and pd.notna(venue['longitude']):
-                distance = self.calculate_distance(
-                    target_lat, target_lon,
-                    venue['latitude'], venue['longitude']
-                )
-                
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_venue = venue.to_dict()
-                    nearest_venue['distance'] = distance
+        use_index, rows = self._indexed_rows(venues_df, spatial_index)
+        if use_index:
+            found, distances = spatial_index.nearest(target_lat, target_lon, 1, rows=rows)
+            if len(found) == 0:
+                return None
+            nearest_venue = venues_df.loc[found[0]].to_dict()
+            nearest_venue['distance'] = float(distances[0])
+            return nearest_venue
+        
+        lat, lon, valid = coordinates_in_radians(venues_df)
+        if not valid.any():
+            return None
+        
+        distances = haversine_km(math.radians(target_lat), math.radians(target_lon), lat, lon)
+        distances[~valid] = np.inf
+        nearest = int(np.argmin(distances))
         
+        nearest_venue = venues_df.iloc[nearest].to_dict()
+        nearest_venue['distance'] = float(distances[nearest])
         return nearest_venue
     
-    def get_venues_in_radius(self, venues_df: pd.DataFrame, center_lat: float, center_lon: float, radius_km: float) -> pd.DataFrame:
+    def find_nearest_venues(self, venues_df: pd.DataFrame, target_lat: float, target_lon: float,
+                            k: int = 5, spatial_index=None) -> pd.DataFrame:
+        """
+        尋找距離指定座標最近的 k 個場地
+        
+        Args:
+            venues_df: 場地資料 DataFrame
+            target_lat: 目標緯度
+            target_lon: 目標經度
+            k: 數量
+            spatial_index: 快照的 SpatialIndex
+            
+        Returns:
+            最近的場地資料（含 distance 欄位，由近到遠）
+        """
+        if venues_df is None or venues_df.empty:
+            return pd.DataFrame()
+        
+        if 'latitude' not in venues_df.columns or 'longitude' not in venues_df.columns:
+            return pd.DataFrame()
+        
+        use_index, rows = self._indexed_rows(venues_df, spatial_index)
+        if use_index:
+            found, distances = spatial_index.nearest(target_lat, target_lon, k, rows=rows)
+            nearest_venues = venues_df.take(venues_df.index.get_indexer(found))
+        else:
+            lat, lon, valid = coordinates_in_radians(venues_df)
+            distances = haversine_km(math.radians(target_lat), math.radians(target_lon), lat, lon)
+            order = np.flatnonzero(valid)
+            order = order[np.argsort(distances[order], kind='stable')[:k]]
+            nearest_venues, distances = venues_df.take(order), distances[order]
+        
+        nearest_venues = nearest_venues.reset_index(drop=True)
+        nearest_venues['distance'] = distances
+        return nearest_venues
+    
+    def get_venues_in_radius(self, venues_df: pd.DataFrame, center_lat: float, center_lon: float, radius_km: float,
+                             spatial_index=None) -> pd.DataFrame:
         """
         獲取指定半徑內的場地
         
@@ -143,6 +245,7 @@ class MapUtils:
             center_lat: 中心點緯度
             center_lon: 中心點經度
             radius_km: 半徑（公里）
+            spatial_index: 快照的 SpatialIndex
             
         Returns:
             半徑內的場地資料
@@ -153,21 +256,56 @@ class MapUtils:
         if 'latitude' not in venues_df.columns or 'longitude' not in venues_df.columns:
             return venues_df
         
-        venues_in_radius = []
-        
-        for idx, venue in venues_df.iterrows():
-            if pd.notna(venue['latitude']) and pd.notna(venue['longitude']):
-                distance = self.calculate_distance(
-                    center_lat, center_lon,
-                    venue['latitude'], venue['longitude']
-                )
-                
-                if distance <= radius_km:
-                    venue_data = venue.to_dict()
-                    venue_data['distance'] = distance
-                    venues_in_radius.append(venue_data)
-        
-        return pd.DataFrame(venues_in_radius)
+        use_index, rows = self._indexed_rows(venues_df, spatial_index)
+        if use_index:
+            found, distances = spatial_index.within_radius(center_lat, center_lon, radius_km, rows=rows)
+            # 依 venues_df 的順序排列
+            local = venues_df.index.get_indexer(found)
+            order = np.argsort(local, kind='stable')
+            venues_in_radius = venues_df.take(local[order]).reset_index(drop=True)
+            venues_in_radius['distance'] = distances[order]
+            return venues_in_radius
+        
+        lat, lon, valid = coordinates_in_radians(venues_df)
+        distances = haversine_km(math.radians(center_lat), math.radians(center_lon), lat, lon)
+        # 無效座標的距離為 NaN，比較結果為 False
+        in_radius = valid & (distances <= radius_km)
+        
+        venues_in_radius = venues_df[in_radius].reset_index(drop=True)
+        venues_in_radius['distance'] = distances[in_radius]
+        return venues_in_radius
+    
+    def get_venues_in_bounds(self, venues_df: pd.DataFrame, south: float, west: float, north: float, east: float,
+                             spatial_index=None) -> pd.DataFrame:
+        """
+        獲取邊界框內的場地（例如地圖目前的可視範圍）
+        
+        Args:
+            venues_df: 場地資料 DataFrame
+            south: 南界緯度
+            west: 西界經度
+            north: 北界緯度
+            east: 東界經度
+            spatial_index: 快照的 SpatialIndex
+            
+        Returns:
+            邊界框內的場地資料
+        """
+        if venues_df is None or venues_df.empty:
+            return pd.DataFrame()
+        
+        if 'latitude' not in venues_df.columns or 'longitude' not in venues_df.columns:
+            return venues_df
+        
+        use_index, rows = self._indexed_rows(venues_df, spatial_index)
+        if use_index:
+            found = spatial_index.within_bounds(south, west, north, east, rows=rows)
+            return self._take_rows(venues_df, found)
+        
+        lat = pd.to_numeric(venues_df['latitude'], errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(venues_df['longitude'], errors='coerce').to_numpy(dtype=float)
+        in_bounds = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return venues_df[in_bounds]
     
     def generate_coordinates_for_district(self, district: str, num_points: int = 1) -> List[Tuple[float, float]]:
         """
@@ -183,23 +321,14 @@ class MapUtils:
         center = self.get_district_center(district)
         center_lat, center_lon = center[0], center[1]
         
-        # 生成區域內隨機點（約0.01度範圍內）
-        coordinates = []
-        np.random.seed(hash(district) % 1000)  # 確保每個區域的座標一致
+        # 生成區域內隨機點（約0.01度範圍內）；以地區名稱的固定雜湊作為區域種子，確保每個區域的座標一致
+        seed = int.from_bytes(hashlib.md5(str(district).encode("utf-8")).digest()[:8], "little")
+        offsets = np.random.default_rng(seed).uniform(-0.01, 0.01, size=(num_points, 2))
         
-        for _ in range(num_points):
-            # 在中心點周圍生成隨機偏移
-            lat_offset = np.random.uniform(-0.01, 0.01)
-            lon_offset = np.random.uniform(-0.01, 0.01)
-            
-            lat = center_lat + lat_offset
-            lon = center_lon + lon_offset
-            
-            # 確保座標在台北市範圍內
-            lat = max(self.taipei_bounds["south"], min(self.taipei_bounds["north"], lat))
-            lon = max(self.taipei_bounds["west"], min(self.taipei_bounds["east"], lon))
-            
-            coordinates.append((lat, lon))
+        # 確保座標在台北市範圍內
+        lat = np.clip(center_lat + offsets[:, 0], self.taipei_bounds["south"], self.taipei_bounds["north"])
+        lon = np.clip(center_lon + offsets[:, 1], self.taipei_bounds["west"], self.taipei_bounds["east"])
+        coordinates = list(zip(lat.tolist(), lon.tolist()))
         
         return coordinates
     
@@ -216,25 +345,13 @@ class MapUtils:
         if venues_df is None or venues_df.empty:
             return venues_df
         
+        from utils.venue_store import synthesize_coordinates
+
+        # 編譯後的場地資料已包含座標；此處供其他來源的資料表使用
         venues_with_coords = venues_df.copy()
-        
-        # 確保座標欄位存在
-        if 'latitude' not in venues_with_coords.columns:
-            venues_with_coords['latitude'] = None
-        if 'longitude' not in venues_with_coords.columns:
-            venues_with_coords['longitude'] = None
-        
-        # 為沒有座標的場地分配座標
-        for idx, venue in venues_with_coords.iterrows():
-            if pd.isna(venue['latitude']) or pd.isna(venue['longitude']):
-                district = venue.get('district', '台北市中心')
-                
-                # 為該地區生成一個座標點
-                coords = self.generate_coordinates_for_district(district, 1)
-                if coords:
-                    lat, lon = coords[0]
-                    venues_with_coords.at[idx, 'latitude'] = lat
-                    venues_with_coords.at[idx, 'longitude'] = lon
+        coords = synthesize_coordinates(venues_with_coords)
+        venues_with_coords['latitude'] = coords['latitude']
+        venues_with_coords['longitude'] = coords['longitude']
         
         return venues_with_coords
     
@@ -261,59 +378,29 @@ class MapUtils:
         
         return bounds
     
-    def cluster_venues_by_proximity(self, venues_df: pd.DataFrame, max_distance_km: float = 0.5) -> Dict[str, List[int]]:
+    def cluster_venues_by_proximity(self, venues_df: pd.DataFrame, max_distance_km: float = 0.5,
+                                    min_samples: int = 1) -> np.ndarray:
         """
-        根據距離將場地分群
+        根據距離將場地分群（DBSCAN，鄰居以網格查詢取得）
         
         Args:
             venues_df: 場地資料 DataFrame
-            max_distance_km: 最大群集距離（公里）
+            max_distance_km: 鄰域半徑 eps（公里）
+            min_samples: 成為核心點所需的鄰域場地數（含自己），1 表示每個場地都屬於某個群集
             
         Returns:
-            群集字典，key為群集ID，value為場地索引列表
+            與 venues_df 逐列對應的群集編號陣列；雜訊與沒有座標的場地為 -1
         """
+        from utils.proximity_clustering import GridDBSCAN
+
         if venues_df is None or venues_df.empty:
-            return {}
+            return np.empty(0, dtype=np.int64)
         
         if 'latitude' not in venues_df.columns or 'longitude' not in venues_df.columns:
-            return {}
-        
-        clusters = {}
-        cluster_id = 0
-        assigned_venues = set()
-        
-        for idx, venue in venues_df.iterrows():
-            if idx in assigned_venues:
-                continue
-            
-            if pd.isna(venue['latitude']) or pd.isna(venue['longitude']):
-                continue
-            
-            # 開始新的群集
-            cluster_venues = [idx]
-            assigned_venues.add(idx)
-            
-            # 尋找附近的場地
-            for other_idx, other_venue in venues_df.iterrows():
-                if other_idx in assigned_venues:
-                    continue
-                
-                if pd.isna(other_venue['latitude']) or pd.isna(other_venue['longitude']):
-                    continue
-                
-                distance = self.calculate_distance(
-                    venue['latitude'], venue['longitude'],
-                    other_venue['latitude'], other_venue['longitude']
-                )
-                
-                if distance <= max_distance_km:
-                    cluster_venues.append(other_idx)
-                    assigned_venues.add(other_idx)
-            
-            clusters[f"cluster_{cluster_id}"] = cluster_venues
-            cluster_id += 1
+            return np.full(len(venues_df), -1, dtype=np.int64)
         
-        return clusters
+        lat, lon, _ = coordinates_in_radians(venues_df)
+        return GridDBSCAN(max_distance_km, min_samples).fit_predict(lat, lon)
     
     def get_route_waypoints(self, start_coords: Tuple[float, float], end_coords: Tuple[float, float], num_waypoints: int = 3) -> List[Tuple[float, float]]:
         """
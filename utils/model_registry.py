@@ -0,0 +1,130 @@
+# utils/model_registry.py
+"""
+推薦模型的快取與持久化
+
+TF-IDF、K-means、隨機森林等模型只依賴場地資料本身，因此每個資料版本只需訓練一次。
+ModelRegistry 以（模型名稱, 資料版本）為鍵：先查行程內快取，再查磁碟上的 joblib 檔，
+都沒有時才呼叫訓練函式，並把結果寫回磁碟，讓其他 worker 直接載入。
+寫入新版本時會刪除其他資料版本的模型目錄，磁碟上只保留目前版本。
+請求當下只需做 transform / predict。
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+import os
+import shutil
+import tempfile
+import threading
+
+import joblib
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_MODEL_DIR = Path(os.environ.get("MODEL_CACHE_DIR", BASE_DIR / ".cache" / "models"))
+
+
+class ModelRegistry:
+    """
+    依資料版本快取訓練好的模型
+    """
+
+    def __init__(self, model_dir: Path = DEFAULT_MODEL_DIR):
+        """
+        Args:
+            model_dir: 模型檔案目錄
+        """
+        self.model_dir = Path(model_dir)
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        # 每個鍵一把鎖，同一模型不會被多個執行緒重複訓練
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def path_for(self, name: str, version: str) -> Path:
+        """模型檔案路徑"""
+        return self.model_dir / (version or "unversioned") / f"{name}.joblib"
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, name: str, version: str, fit: Callable[[], Any]) -> Any:
+        """
+        取得模型，沒有快取時訓練並保存
+
+        Args:
+            name: 模型名稱（參數或特徵調整時請一併更改名稱，例如加上版本後綴）
+            version: 場地資料版本
+            fit: 訓練函式，回傳要快取的物件（可為包含模型與陣列的 dict）
+
+        Returns:
+            快取的模型物件（呼叫端不可修改）
+        """
+        key = (name, version)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._key_lock(key):
+            model = self._models.get(key)
+            if model is not None:
+                return model
+
+            path = self.path_for(name, version)
+            if version and path.exists():
+                try:
+                    model = joblib.load(path)
+                except Exception as e:
+                    print(f"❌ 載入模型 {path} 發生錯誤，將重新訓練: {e}")
+                    model = None
+
+            if model is None:
+                model = fit()
+                if version:
+                    self._save(model, path)
+                    self._remove_old_versions(version)
+
+            with self._lock:
+                # 同名模型只保留目前版本
+                for old in [k for k in self._models if k[0] == name and k[1] != version]:
+                    del self._models[old]
+                self._models[key] = model
+            return model
+
+    def _save(self, model: Any, path: Path):
+        """寫入暫存檔後改名，其他 worker 不會讀到寫到一半的檔案"""
+        tmp = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=path.name + ".", dir=path.parent)
+            os.close(fd)
+            joblib.dump(model, tmp, compress=3)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"❌ 保存模型 {path} 發生錯誤: {e}")
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _remove_old_versions(self, version: str):
+        """刪除其他資料版本的模型目錄（與行程內快取相同，只保留目前版本）"""
+        if not self.model_dir.is_dir():
+            return
+        for path in self.model_dir.iterdir():
+            if path.is_dir() and path.name != version:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self):
+        """清除行程內快取（不刪除磁碟檔案）"""
+        with self._lock:
+            self._models.clear()
+
+
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """取得行程共用的 ModelRegistry"""
+    global _shared_registry
+    if _shared_registry is None:
+        with _shared_registry_lock:
+            if _shared_registry is None:
+                _shared_registry = ModelRegistry()
+    return _shared_registry
@@ -0,0 +1,264 @@
+# utils/proximity_clustering.py
+"""
+以網格為基礎的 DBSCAN 場地分群
+
+座標先投影到以資料平均緯度為基準的平面（公里），臺北市範圍內與 Haversine 距離的誤差遠小於 1%。
+平面切成邊長 eps/√2 的方格，因此同一格內任兩點的距離都不超過 eps：
+
+1. 點數達 min_samples 的格子內全部都是核心點；其餘點只需檢查周圍 5×5 格的點
+2. 同格的核心點必定相連；相鄰格子只在兩格的核心點有一對距離不超過 eps 時合併
+   （依方向由近到遠逐輪檢查並以連通元件合併，已在同一群的格子對不再檢查）
+3. 非核心點若與某核心點距離不超過 eps 即為邊界點，否則為雜訊（-1）
+
+鄰居一律以格子查詢取得，不做全體兩兩比較。
+"""
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from utils.map_utils import EARTH_RADIUS_KM
+
+# 周圍 5×5 格的位移（格子邊長 eps/√2，兩格在任一方向相差 3 格以上時最近距離已超過 eps）
+_OFFSETS = np.array([(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3)], dtype=np.int64)
+# 合併格子時只需檢查一半的方向，由近到遠排列
+_HALF_OFFSETS = np.array(
+    sorted(((dx, dy) for dx, dy in _OFFSETS.tolist() if (dx, dy) > (0, 0)), key=lambda d: d[0] ** 2 + d[1] ** 2),
+    dtype=np.int64,
+)
+# 展開候選點對時每批的數量上限
+_PAIR_CHUNK = 2_000_000
+# 兩格核心點數乘積不超過此值時以向量化方式檢查是否相連
+_SMALL_CELL_PAIR = 256
+
+
+class GridDBSCAN:
+    """
+    網格 DBSCAN
+
+    Attributes:
+        eps_km: 鄰域半徑（公里）
+        min_samples: 成為核心點所需的鄰域點數（含自己）
+    """
+
+    def __init__(self, eps_km: float = 0.5, min_samples: int = 1):
+        if eps_km <= 0:
+            raise ValueError("eps_km 必須大於 0")
+        self.eps_km = float(eps_km)
+        self.min_samples = max(int(min_samples), 1)
+
+    def fit_predict(self, lat_rad: np.ndarray, lon_rad: np.ndarray) -> np.ndarray:
+        """
+        分群
+
+        Args:
+            lat_rad: 緯度（弧度），NaN 表示沒有座標
+            lon_rad: 經度（弧度）
+
+        Returns:
+            各點的群集編號（依第一次出現的順序從 0 開始）；雜訊與沒有座標的點為 -1
+        """
+        n = len(lat_rad)
+        labels = np.full(n, -1, dtype=np.int64)
+        valid = np.flatnonzero(~(np.isnan(lat_rad) | np.isnan(lon_rad)))
+        if len(valid) == 0:
+            return labels
+
+        xy = self._project(lat_rad[valid], lon_rad[valid])
+        point_labels = self._cluster(xy)
+        labels[valid] = point_labels
+        return self._renumber(labels)
+
+    # ---- 內部步驟 ----
+    @staticmethod
+    def _project(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """等距圓柱投影（公里）"""
+        cos_ref = np.cos(lat.mean())
+        return np.column_stack([lon * cos_ref * EARTH_RADIUS_KM, lat * EARTH_RADIUS_KM])
+
+    def _cluster(self, xy: np.ndarray) -> np.ndarray:
+        eps, eps2 = self.eps_km, self.eps_km ** 2
+        n = len(xy)
+        side = eps / np.sqrt(2.0)
+        cell_xy = np.floor((xy - xy.min(axis=0)) / side).astype(np.int64) + 2
+        width = int(cell_xy[:, 1].max()) + 5
+        keys = cell_xy[:, 0] * width + cell_xy[:, 1]
+
+        # 依格子排序：第 c 格的點為 order[starts[c]:starts[c] + counts[c]]
+        order = np.argsort(keys, kind="stable")
+        cell_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        cell_of = np.empty(n, dtype=np.int64)
+        cell_of[order] = np.repeat(np.arange(len(cell_keys)), counts)
+        offset_keys = _OFFSETS[:, 0] * width + _OFFSETS[:, 1]
+
+        def neighbour_cells(cells: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+            """(格子數, 位移數) 的鄰格編號，不存在為 -1"""
+            target = cell_keys[cells][:, None] + offsets[None, :]
+            pos = np.searchsorted(cell_keys, target)
+            pos = np.minimum(pos, len(cell_keys) - 1)
+            return np.where(cell_keys[pos] == target, pos, -1)
+
+        def candidate_pairs(points: np.ndarray):
+            """逐批產生 (點, 周圍 5×5 格內的點) 候選點對"""
+            neighbours = neighbour_cells(cell_of[points], offset_keys)
+            src = np.repeat(points, neighbours.shape[1])
+            cells = neighbours.ravel()
+            keep = cells >= 0
+            src, cells = src[keep], cells[keep]
+            sizes = counts[cells]
+            bounds = np.concatenate([[0], np.cumsum(sizes)])
+            # 依點對數量切批，避免一次展開過多
+            i = 0
+            while i < len(cells):
+                j = int(np.searchsorted(bounds, bounds[i] + _PAIR_CHUNK, side="right")) - 1
+                j = max(j, i + 1)
+                s, c, z = src[i:j], cells[i:j], sizes[i:j]
+                total = int(z.sum())
+                step = np.arange(total) - np.repeat(np.cumsum(z) - z, z)
+                yield np.repeat(s, z), order[np.repeat(starts[c], z) + step]
+                i = j
+
+        # 1. 核心點
+        core = counts[cell_of] >= self.min_samples
+        sparse_points = np.flatnonzero(~core)
+        if len(sparse_points):
+            neighbour_count = np.zeros(n, dtype=np.int64)
+            for p, q in candidate_pairs(sparse_points):
+                close = ((xy[p] - xy[q]) ** 2).sum(axis=1) <= eps2
+                neighbour_count += np.bincount(p[close], minlength=n)
+            core[sparse_points] = neighbour_count[sparse_points] >= self.min_samples
+
+        # 2. 合併含核心點的格子
+        core_order = order[core[order]]
+        core_counts = np.bincount(cell_of[core], minlength=len(cell_keys))
+        core_starts = np.cumsum(core_counts) - core_counts
+        core_cells = np.flatnonzero(core_counts)
+        n_cells = len(cell_keys)
+        edges_a, edges_b, large_a, large_b = [], [], [], []
+        component = np.arange(n_cells)
+
+        # 由近到遠逐一方向處理；已在同一群集的格子對不再檢查
+        for dx, dy in _HALF_OFFSETS:
+            cell_a = core_cells
+            cell_b = neighbour_cells(core_cells, np.array([dx * width + dy]))[:, 0]
+            keep = cell_b >= 0
+            cell_a, cell_b = cell_a[keep], cell_b[keep]
+            keep = (core_counts[cell_b] > 0) & (component[cell_a] != component[cell_b])
+            cell_a, cell_b = cell_a[keep], cell_b[keep]
+
+            # 點數多的格子對留待最後逐一檢查，其餘一次向量化檢查
+            small = core_counts[cell_a] * core_counts[cell_b] <= _SMALL_CELL_PAIR
+            large_a.append(cell_a[~small])
+            large_b.append(cell_b[~small])
+            cell_a, cell_b = cell_a[small], cell_b[small]
+            linked = self._linked_pairs(xy, core_order, core_starts, core_counts, cell_a, cell_b, eps2)
+            if linked.any():
+                edges_a.append(cell_a[linked])
+                edges_b.append(cell_b[linked])
+                graph = sparse.coo_matrix(
+                    (np.ones(sum(len(e) for e in edges_a), dtype=np.int8),
+                     (np.concatenate(edges_a), np.concatenate(edges_b))),
+                    shape=(n_cells, n_cells),
+                )
+                _, component = connected_components(graph, directed=False)
+
+        # 點數多的格子對逐一檢查，已在同一群集的略過
+        large_a, large_b = np.concatenate(large_a), np.concatenate(large_b)
+        if len(large_a):
+            parent = np.arange(component.max() + 1)
+
+            def find(c: int) -> int:
+                root = c
+                while parent[root] != root:
+                    root = parent[root]
+                while parent[c] != root:
+                    parent[c], c = root, parent[c]
+                return root
+
+            def points_of(c: int) -> np.ndarray:
+                return xy[core_order[core_starts[c]:core_starts[c] + core_counts[c]]]
+
+            for a, b in zip(large_a.tolist(), large_b.tolist()):
+                ra, rb = find(component[a]), find(component[b])
+                if ra != rb and self._cells_connected(points_of(a), points_of(b), eps2):
+                    parent[rb] = ra
+            component = np.array([find(c) for c in component.tolist()], dtype=np.int64)
+
+        labels = np.full(n, -1, dtype=np.int64)
+        labels[core] = component[cell_of[core]]
+
+        # 3. 邊界點：歸入距離最近的核心點所在群集
+        border = np.flatnonzero(~core)
+        if len(border) and core.any():
+            best = np.full(n, np.inf)
+            for p, q in candidate_pairs(border):
+                keep = core[q]
+                p, q = p[keep], q[keep]
+                d2 = ((xy[p] - xy[q]) ** 2).sum(axis=1)
+                keep = d2 <= eps2
+                p, q, d2 = p[keep], q[keep], d2[keep]
+                # 每個點保留最近的核心點
+                ranked = np.lexsort((d2, p))
+                p, q, d2 = p[ranked], q[ranked], d2[ranked]
+                first = np.concatenate([[True], p[1:] != p[:-1]]) if len(p) else np.empty(0, dtype=bool)
+                p, q, d2 = p[first], q[first], d2[first]
+                better = d2 < best[p]
+                best[p[better]] = d2[better]
+                labels[p[better]] = labels[q[better]]
+        return labels
+
+    @staticmethod
+    def _linked_pairs(xy: np.ndarray, core_order: np.ndarray, core_starts: np.ndarray,
+                      core_counts: np.ndarray, cell_a: np.ndarray, cell_b: np.ndarray,
+                      eps2: float) -> np.ndarray:
+        """逐批展開格子對的所有核心點對，回傳各格子對是否有點對距離不超過 eps"""
+        linked = np.zeros(len(cell_a), dtype=bool)
+        sizes_a, sizes_b = core_counts[cell_a], core_counts[cell_b]
+        pair_sizes = sizes_a * sizes_b
+        bounds = np.concatenate([[0], np.cumsum(pair_sizes)])
+        i = 0
+        while i < len(cell_a):
+            j = max(int(np.searchsorted(bounds, bounds[i] + _PAIR_CHUNK, side="right")) - 1, i + 1)
+            z = pair_sizes[i:j]
+            owner = np.repeat(np.arange(i, j), z)
+            step = np.arange(int(z.sum())) - np.repeat(np.cumsum(z) - z, z)
+            width = sizes_b[owner]
+            p = core_order[core_starts[cell_a[owner]] + step // width]
+            q = core_order[core_starts[cell_b[owner]] + step % width]
+            close = ((xy[p] - xy[q]) ** 2).sum(axis=1) <= eps2
+            linked[owner[close]] = True
+            i = j
+        return linked
+
+    @staticmethod
+    def _cells_connected(a: np.ndarray, b: np.ndarray, eps2: float) -> bool:
+        """兩格的核心點是否有一對距離不超過 eps（分批計算，找到即停止）"""
+        # 只保留與對方外接矩形距離不超過 eps 的點
+        def near_box(points: np.ndarray, other: np.ndarray) -> np.ndarray:
+            gap = np.maximum(other.min(axis=0) - points, 0) + np.maximum(points - other.max(axis=0), 0)
+            return points[(gap ** 2).sum(axis=1) <= eps2]
+
+        a, b = near_box(a, b), near_box(b, a)
+        if len(a) == 0 or len(b) == 0:
+            return False
+        if len(a) > len(b):
+            a, b = b, a
+        chunk = max(1, 65536 // len(b))
+        for i in range(0, len(a), chunk):
+            diff = a[i:i + chunk, None, :] - b[None, :, :]
+            if ((diff ** 2).sum(axis=2) <= eps2).any():
+                return True
+        return False
+
+    @staticmethod
+    def _renumber(labels: np.ndarray) -> np.ndarray:
+        """群集編號改為依第一次出現的順序（0, 1, 2, ...），雜訊維持 -1"""
+        clustered = labels >= 0
+        if not clustered.any():
+            return labels
+        _, first, inverse = np.unique(labels[clustered], return_index=True, return_inverse=True)
+        rank = np.empty(len(first), dtype=np.int64)
+        rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+        result = labels.copy()
+        result[clustered] = rank[inverse]
+        return result
+
@@ -2,12 +2,142 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.decomposition import PCA
 from sklearn.ensemble import RandomForestRegressor
-import random
+from datetime import datetime, timedelta
+
+from utils.collaborative_filter import get_collaborative_filter
+from utils.model_registry import get_model_registry
+from utils.venue_index import VenueVectorIndex
+
+# 模型名稱；特徵或參數調整時遞增後綴，使舊的快取檔失效
+TFIDF_MODEL = "tfidf-v1"
+KMEANS_MODEL = "kmeans-v1"
+FOREST_MODEL = "forest-v1"
+VENUE_INDEX_MODEL = "venue-index-v1"
+
+# 批次推薦每批分數矩陣的元素數上限（用戶數 × 場地數）
+BATCH_CHUNK_ELEMENTS = 4_000_000
+
+# 綜合推薦分數的組成欄位與對應的權重名稱（分數 = 特徵矩陣 · 權重向量）
+SCORE_COMPONENTS = [
+    ('preference_match', 'preference_weight'),
+    ('rating_weight', 'rating_weight'),
+    ('price_match', 'price_weight'),
+    ('distance_score', 'distance_weight'),
+    ('facility_match', 'facility_weight'),
+]
+
+def _isin(series: pd.Series, values) -> np.ndarray:
+    """
+    向量化的成員判斷（缺值一律為 False）
+
+    類別欄位只比對各類別一次，再以類別代碼展開到每一列。
+    """
+    if not values:
+        return np.zeros(len(series), dtype=bool)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        hits = np.isin(np.asarray(series.cat.categories, dtype=object), list(values))
+        # 代碼 -1（缺值）對應到尾端的 False
+        return np.append(hits, False)[series.cat.codes.to_numpy()]
+    return series.isin(list(values)).to_numpy()
+
+def _category_codes(series: pd.Series, categories) -> np.ndarray:
+    """
+    每一列在 categories 中的位置（找不到或缺值為 -1）
+
+    類別欄位只需對應各類別一次。
+    """
+    target = pd.Index(list(categories))
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        lookup = np.append(target.get_indexer(series.cat.categories), -1)
+        return lookup[series.cat.codes.to_numpy()].astype(np.intp)
+    return target.get_indexer(series.astype(object)).astype(np.intp)
+
+def _diversity_penalty(sport_type: pd.Series, diversity_weight: float) -> np.ndarray:
+    """
+    多樣性扣分：同運動類型的場地越多扣越多（最多 2 分），未標示類型者不扣分
+    """
+    group_size = sport_type.map(sport_type.value_counts()).to_numpy(dtype=float)
+    return np.nan_to_num(np.minimum(diversity_weight * (group_size - 1) * 0.1, 2.0))
+
+def _one_hot(series: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """
+    類別欄位轉為 one-hot 矩陣（缺值為全 0 列）
+
+    Returns:
+        (場地數 × 類別數 矩陣, 類別)
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories, codes = series.cat.categories, series.cat.codes.to_numpy()
+    else:
+        codes, categories = pd.factorize(series)
+    matrix = np.zeros((len(series), len(categories) + 1))
+    matrix[np.arange(len(series)), codes] = 1.0
+    # 最後一欄收集缺值（代碼 -1），不參與計分
+    return matrix[:, :-1], pd.Index(categories)
+
+def _score_user_chunk(user_matrix: np.ndarray, price_bounds: np.ndarray, venue_matrix: np.ndarray,
+                      price: np.ndarray, price_weight: float, venue_factor: np.ndarray,
+                      venue_penalty: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    一批用戶對所有場地評分並取前 k 名（模組層級函式，可交給 process pool 執行）
+
+    Args:
+        user_matrix: 用戶 × 特徵 係數矩陣
+        price_bounds: 用戶 × 2 的預算上下限
+        venue_matrix: 場地 × 特徵 矩陣
+        price: 各場地每小時價格（缺值為 NaN）
+        price_weight: 價格權重（已乘上 10 分制）
+        venue_factor: 各場地的天氣係數
+        venue_penalty: 各場地的多樣性扣分
+        k: 每位用戶的推薦數量
+
+    Returns:
+        (用戶 × k 場地位置, 用戶 × k 分數)，依分數由高到低排列
+    """
+    scores = user_matrix @ venue_matrix.T
+    
+    # 價格匹配度：預算內為 1，否則依距離預算中點遞減
+    min_price, max_price = price_bounds[:, :1], price_bounds[:, 1:]
+    in_range = np.isnan(price) | ((price >= min_price) & (price <= max_price))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = np.abs(price - (min_price + max_price) / 2) / max_price
+    scores += price_weight * np.where(in_range, 1.0, np.maximum(0.0, 1.0 - distance))
+    
+    scores *= venue_factor
+    scores -= venue_penalty
+    # 評分缺值的場地不推薦（與單一用戶的 nlargest 相同）
+    scores[np.isnan(scores)] = -np.inf
+    
+    k = min(k, scores.shape[1])
+    rows = np.arange(scores.shape[0])[:, None]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-scores[rows, top], axis=1, kind='stable')
+    top = top[rows, order]
+    return top, scores[rows, top]
+
+def _join_reasons(parts: List[Tuple[np.ndarray, Any]], n: int, default: str) -> np.ndarray:
+    """
+    依序串接各列成立的理由（以「 • 」分隔），皆不成立時使用預設文字
+
+    Args:
+        parts: [(成立遮罩, 文字或逐列文字陣列), ...]
+        n: 列數
+        default: 預設文字
+
+    Returns:
+        object 陣列
+    """
+    text = np.full(n, '', dtype=object)
+    for mask, template in parts:
+        if not mask.any():
+            continue
+        sep = np.where(text != '', ' • ', '')
+        text = np.where(mask, text + sep + template, text)
+    return np.where(text == '', default, text)
 
 class RecommendationEngine:
     """
@@ -19,7 +149,6 @@ class RecommendationEngine:
         self.venue_features = None
         self.tfidf_vectorizer = None
         self.content_features_matrix = None
-        self.feedback_data = {}
         self.scaler = StandardScaler()
         self.label_encoders = {}
         self.kmeans_model = None
@@ -31,6 +160,7 @@ class RecommendationEngine:
             'price_weight': 0.2,
             'distance_weight': 0.15,
             'facility_weight': 0.1,
+            'weather_weight': 0.5,
             'explore_vs_exploit': 0.3,
             'popularity_bias': 0.4,
             'novelty_preference': 0.2,
@@ -53,8 +183,8 @@ class RecommendationEngine:
             推薦場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
             if venues_data is None or venues_data.empty:
@@ -90,6 +220,167 @@ class RecommendationEngine:
             print(f"生成個人化推薦時發生錯誤: {e}")
             return None
     
+    def get_batch_recommendations(self,
+                                  users_preferences: List[Dict[str, Any]],
+                                  num_recommendations: int = 10,
+                                  diversity_weight: float = 0.3,
+                                  play_time: Any = None,
+                                  play_duration_hours: float = 2,
+                                  n_jobs: int = 1) -> Optional[pd.DataFrame]:
+        """
+        一次為多位用戶產生個人化推薦（例如每晚預先計算首頁推薦）
+        
+        分數與 get_personalized_recommendations 相同：用戶偏好編碼為 用戶 × 特徵 矩陣，
+        場地編碼為 場地 × 特徵 矩陣，一次矩陣乘法得到所有用戶對所有場地的分數，
+        再以 argpartition 取每位用戶的前 N 名。用戶依場地數分批計算以限制記憶體，
+        n_jobs > 1 且批次數大於 1 時分散到多個行程。
+        
+        Args:
+            users_preferences: 用戶偏好設定列表
+            num_recommendations: 每位用戶的推薦數量
+            diversity_weight: 多樣性權重
+            play_time: 全批共用的運動開始時間（天氣分數使用），預設為現在
+            play_duration_hours: 運動時數
+            n_jobs: 行程數
+            
+        Returns:
+            長表格，欄位為 user_index、rank、場地 id / name 與 recommendation_score；
+            user_index 對應 users_preferences 的位置
+        """
+        try:
+            from utils.data_manager import get_data_manager
+            venues_data = get_data_manager().get_all_venues()
+            
+            if venues_data is None or venues_data.empty or not users_preferences or num_recommendations <= 0:
+                return None
+            
+            venue_matrix, encoders = self._encode_venue_matrix(venues_data)
+            user_matrix, price_bounds = self._encode_user_matrix(users_preferences, encoders)
+            
+            if 'price_per_hour' in venues_data.columns:
+                price = pd.to_numeric(venues_data['price_per_hour'], errors='coerce').to_numpy(dtype=float)
+            else:
+                price = None
+            
+            weather = self._weather_arrays(venues_data, play_time, play_duration_hours)
+            weather_score = weather[0] if weather is not None else np.ones(len(venues_data))
+            venue_factor = 1.0 - self.weights.get('weather_weight', 0.0) * (1.0 - weather_score)
+            
+            if diversity_weight > 0 and 'sport_type' in venues_data.columns:
+                venue_penalty = _diversity_penalty(venues_data['sport_type'], diversity_weight)
+            else:
+                venue_penalty = np.zeros(len(venues_data))
+            
+            price_weight = self.weights['price_weight'] * 10
+            if price is None:
+                # 沒有價格欄位時價格匹配度固定為 0.7，併入常數項
+                user_matrix[:, -1] += price_weight * 0.7
+                price, price_weight = np.full(len(venues_data), np.nan), 0.0
+            
+            # 每批的分數矩陣約 BATCH_CHUNK_ELEMENTS 個元素
+            chunk_size = max(1, BATCH_CHUNK_ELEMENTS // len(venues_data))
+            chunks = [slice(i, i + chunk_size) for i in range(0, len(users_preferences), chunk_size)]
+            jobs = [
+                (user_matrix[c], price_bounds[c], venue_matrix, price, price_weight,
+                 venue_factor, venue_penalty, num_recommendations)
+                for c in chunks
+            ]
+            if n_jobs > 1 and len(jobs) > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                    results = list(pool.map(_score_user_chunk, *zip(*jobs)))
+            else:
+                results = [_score_user_chunk(*job) for job in jobs]
+            
+            top = np.vstack([r[0] for r in results])
+            scores = np.vstack([r[1] for r in results])
+            
+            # 排除不可推薦（分數為 -inf）的場地
+            valid = np.isfinite(scores)
+            user_index, rank = np.nonzero(valid)
+            positions = top[valid]
+            batch = pd.DataFrame({'user_index': user_index, 'rank': rank + 1})
+            for column in ('id', 'name'):
+                if column in venues_data.columns:
+                    batch[column] = venues_data[column].to_numpy()[positions]
+            batch['recommendation_score'] = scores[valid]
+            return batch
+            
+        except Exception as e:
+            print(f"生成批次推薦時發生錯誤: {e}")
+            return None
+    
+    def _encode_venue_matrix(self, venues_data: pd.DataFrame) -> Tuple[np.ndarray, Dict[str, pd.Index]]:
+        """
+        場地特徵矩陣（批次推薦使用）
+        
+        欄位依序為：運動類型 one-hot、地區 one-hot、加權後的評分分數、常數 1。
+        
+        Returns:
+            (場地 × 特徵 矩陣, {欄位名稱: 類別})
+        """
+        n = len(venues_data)
+        blocks, encoders = [], {}
+        for column in ('sport_type', 'district'):
+            # 缺少的欄位不放入 encoders，用戶端視為沒有該項偏好
+            if column in venues_data.columns:
+                matrix, encoders[column] = _one_hot(venues_data[column])
+                blocks.append(matrix)
+        
+        rating_scores = pd.DataFrame(index=venues_data.index)
+        if 'rating' in venues_data.columns:
+            rating_scores['rating'] = venues_data['rating']
+        self._calculate_rating_weight(rating_scores)
+        rating_weight = rating_scores['rating_weight'].to_numpy(dtype=float)
+        blocks.append((rating_weight * self.weights['rating_weight'] * 10)[:, None])
+        blocks.append(np.ones((n, 1)))
+        return np.hstack(blocks), encoders
+    
+    def _encode_user_matrix(self, users_preferences: List[Dict[str, Any]],
+                            encoders: Dict[str, pd.Index]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        用戶係數矩陣（批次推薦使用）
+        
+        與 _encode_venue_matrix 的欄位對應，使兩者內積等於單一用戶流程中
+        偏好、評分、距離與設施四項的加權分數（10分制）。
+        
+        Returns:
+            (用戶 × 特徵 矩陣, 用戶 × 2 的預算上下限)
+        """
+        sports = encoders.get('sport_type', pd.Index([]))
+        districts = encoders.get('district', pd.Index([]))
+        n_sports, n_districts = len(sports), len(districts)
+        # 類別 → 欄位位置（地區欄位接在運動類型之後）
+        sport_columns = {name: i for i, name in enumerate(sports)}
+        district_columns = {name: n_sports + i for i, name in enumerate(districts)}
+        w = {name: value * 10 for name, value in self.weights.items()}
+        
+        user_matrix = np.zeros((len(users_preferences), n_sports + n_districts + 2))
+        price_bounds = np.empty((len(users_preferences), 2))
+        user_matrix[:, -2] = 1.0  # 評分分數
+        
+        for u, prefs in enumerate(users_preferences):
+            preferred_sports = prefs.get('preferred_sports', [])
+            preferred_districts = prefs.get('preferred_districts', [])
+            has_sports = bool(preferred_sports) and 'sport_type' in encoders
+            has_districts = bool(preferred_districts) and 'district' in encoders
+            
+            # 偏好匹配度 = (運動類型匹配 + 地區匹配) / 2；距離分數只看地區
+            if has_sports:
+                columns = [sport_columns[x] for x in set(preferred_sports) if x in sport_columns]
+                user_matrix[u, columns] = w['preference_weight'] * 0.25
+            if has_districts:
+                columns = [district_columns[x] for x in set(preferred_districts) if x in district_columns]
+                user_matrix[u, columns] = w['preference_weight'] * 0.35 + w['distance_weight'] * 0.6
+            user_matrix[u, -1] = (
+                w['preference_weight'] * ((0.25 if has_sports else 0.35) + (0.15 if has_districts else 0.35))
+                + w['distance_weight'] * (0.4 if has_districts else 0.7)
+                + w['facility_weight'] * 0.7
+            )
+            price_bounds[u] = prefs.get('price_range', [0, 10000])
+        
+        return user_matrix, price_bounds
+    
     def get_trending_venues(self, num_recommendations: int = 10) -> Optional[pd.DataFrame]:
         """
         獲取熱門場地推薦
@@ -101,15 +392,15 @@ class RecommendationEngine:
             熱門場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
             if venues_data is None or venues_data.empty:
                 return None
             
             # 計算熱門度分數（基於評分和假設的訪問量）
-            venues_with_trending = venues_data.copy()
+            venues_with_trending = venues_data.copy(deep=False)
             
             # 基於評分計算熱門度
             if 'rating' in venues_with_trending.columns:
@@ -158,15 +449,15 @@ class RecommendationEngine:
             新場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
             if venues_data is None or venues_data.empty:
                 return None
             
             # 模擬新場地（在實際應用中應該有建立日期欄位）
-            venues_with_new = venues_data.copy()
+            venues_with_new = venues_data.copy(deep=False)
             
             # 隨機選擇一部分作為"新"場地
             np.random.seed(123)
@@ -198,50 +489,50 @@ class RecommendationEngine:
         """
         獲取協同過濾推薦
         
+        依真實使用行為（收藏、喜歡、瀏覽、預訂）的 item-item 模型推薦；
+        用戶還沒有任何行為時改用整體熱門場地。
+        
         Args:
-            user_preferences: 用戶偏好
+            user_preferences: 用戶偏好（user_key 為用戶識別，favorite_venue_ids 為目前的收藏）
             num_recommendations: 推薦數量
             
         Returns:
             協同過濾推薦場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
-            if venues_data is None or venues_data.empty:
+            if venues_data is None or venues_data.empty or 'id' not in venues_data.columns:
                 return None
             
-            # 模擬相似用戶的偏好（在實際應用中應該基於真實用戶行為數據）
-            similar_users_preferences = self._generate_similar_user_preferences(user_preferences)
-            
-            # 基於相似用戶的選擇推薦場地
-            collaborative_venues = venues_data.copy()
-            
-            # 計算協同過濾分數
-            collaborative_scores = []
-            for idx, venue in collaborative_venues.iterrows():
-                score = self._calculate_collaborative_score(venue, similar_users_preferences)
-                collaborative_scores.append(score)
-            
-            collaborative_venues['recommendation_score'] = collaborative_scores
-            collaborative_venues['recommendation_reason'] = "相似用戶推薦 - 與您喜好相似的用戶也喜歡這些場地"
-            
-            # 過濾掉分數太低的場地
-            collaborative_venues = collaborative_venues[
-                collaborative_venues['recommendation_score'] >= 5.0
-            ]
+            collaborative_filter = get_collaborative_filter()
+            # 多取一些，扣除目前資料中已下架的場地後仍足夠
+            candidates = collaborative_filter.recommend(
+                user_preferences.get('user_key'),
+                user_preferences.get('favorite_venue_ids', []),
+                num_recommendations * 2,
+            )
+            reason = "相似用戶推薦 - 與您喜好相似的用戶也喜歡這些場地"
+            if not candidates:
+                candidates = collaborative_filter.popular(num_recommendations * 2)
+                reason = "熱門場地 - 最多用戶收藏與預訂"
+            if not candidates:
+                return None
             
-            if collaborative_venues.empty:
+            venue_ids, scores = zip(*candidates)
+            positions = pd.Index(venues_data['id']).get_indexer(venue_ids)
+            found = positions >= 0
+            if not found.any():
                 return None
             
-            # 排序並返回
-            recommended_venues = collaborative_venues.nlargest(
-                num_recommendations, 'recommendation_score'
-            )
+            collaborative_venues = venues_data.iloc[positions[found]].copy()
+            scores = np.asarray(scores)[found]
+            collaborative_venues['recommendation_score'] = scores / scores.max() * 10  # 轉換為10分制
+            collaborative_venues['recommendation_reason'] = reason
             
-            return recommended_venues
+            return collaborative_venues.head(num_recommendations)
             
         except Exception as e:
             print(f"生成協同過濾推薦時發生錯誤: {e}")
@@ -261,8 +552,8 @@ class RecommendationEngine:
             基於評分的推薦場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
             if venues_data is None or venues_data.empty:
@@ -289,9 +580,10 @@ class RecommendationEngine:
             random_bonus = np.random.uniform(0, 2, len(filtered_venues))  # 加入隨機性
             
             filtered_venues['recommendation_score'] = rating_scores + random_bonus
-            filtered_venues['recommendation_reason'] = filtered_venues['rating'].apply(
-                lambda x: f"高評分場地 - 平均評分 {x:.1f}/5.0"
-            )
+            filtered_venues['recommendation_reason'] = np.char.add(
+                '高評分場地 - 平均評分 ',
+                np.char.add(np.char.mod('%.1f', filtered_venues['rating'].to_numpy(dtype=float)), '/5.0'),
+            ).astype(object)
             
             # 返回前N個
             recommended_venues = filtered_venues.head(num_recommendations)
@@ -315,7 +607,7 @@ class RecommendationEngine:
         Returns:
             包含推薦分數的場地資料
         """
-        venues_with_scores = venues_data.copy()
+        venues_with_scores = venues_data.copy(deep=False)
         
         # 初始化各項分數
         venues_with_scores['preference_match'] = 0.0
@@ -339,14 +631,20 @@ class RecommendationEngine:
         # 計算設施匹配度
         self._calculate_facility_match(venues_with_scores, user_preferences)
         
-        # 計算綜合推薦分數
-        venues_with_scores['recommendation_score'] = (
-            venues_with_scores['preference_match'] * self.weights['preference_weight'] +
-            venues_with_scores['rating_weight'] * self.weights['rating_weight'] +
-            venues_with_scores['price_match'] * self.weights['price_weight'] +
-            venues_with_scores['distance_score'] * self.weights['distance_weight'] +
-            venues_with_scores['facility_match'] * self.weights['facility_weight']
-        ) * 10  # 轉換為10分制
+        # 計算天氣分數
+        self._calculate_weather_score(venues_with_scores, user_preferences)
+        
+        # 計算綜合推薦分數：特徵矩陣與權重向量的內積
+        features = np.column_stack([
+            venues_with_scores[col].to_numpy(dtype=float) for col, _ in SCORE_COMPONENTS
+        ])
+        weights = np.array([self.weights[name] for _, name in SCORE_COMPONENTS])
+        score = features @ weights * 10  # 轉換為10分制
+        
+        # 天氣不佳時降低戶外場地的分數（室內場地的天氣分數為 1，不受影響）
+        weather_weight = self.weights.get('weather_weight', 0.0)
+        score *= 1.0 - weather_weight * (1.0 - venues_with_scores['weather_score'].to_numpy(dtype=float))
+        venues_with_scores['recommendation_score'] = score
         
         return venues_with_scores
     
@@ -356,20 +654,18 @@ class RecommendationEngine:
         preferred_districts = user_preferences.get('preferred_districts', [])
         
         if preferred_sports and 'sport_type' in venues_data.columns:
-            venues_data['sport_match'] = venues_data['sport_type'].apply(
-                lambda x: 1.0 if x in preferred_sports else 0.5
-            )
+            sport_match = np.where(_isin(venues_data['sport_type'], preferred_sports), 1.0, 0.5)
         else:
-            venues_data['sport_match'] = 0.7
+            sport_match = np.full(len(venues_data), 0.7)
         
         if preferred_districts and 'district' in venues_data.columns:
-            venues_data['district_match'] = venues_data['district'].apply(
-                lambda x: 1.0 if x in preferred_districts else 0.3
-            )
+            district_match = np.where(_isin(venues_data['district'], preferred_districts), 1.0, 0.3)
         else:
-            venues_data['district_match'] = 0.7
+            district_match = np.full(len(venues_data), 0.7)
         
-        venues_data['preference_match'] = (venues_data['sport_match'] + venues_data['district_match']) / 2
+        venues_data['sport_match'] = sport_match
+        venues_data['district_match'] = district_match
+        venues_data['preference_match'] = (sport_match + district_match) / 2
     
     def _calculate_rating_weight(self, venues_data: pd.DataFrame):
         """計算評分權重"""
@@ -388,10 +684,11 @@ class RecommendationEngine:
         min_price, max_price = price_range
         
         if 'price_per_hour' in venues_data.columns:
-            venues_data['price_match'] = venues_data['price_per_hour'].apply(
-                lambda x: 1.0 if pd.isna(x) or (min_price <= x <= max_price) else 
-                         max(0.0, 1.0 - abs(x - (min_price + max_price) / 2) / max_price)
-            )
+            price = pd.to_numeric(venues_data['price_per_hour'], errors='coerce').to_numpy(dtype=float)
+            in_range = np.isnan(price) | ((price >= min_price) & (price <= max_price))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                distance = np.abs(price - (min_price + max_price) / 2) / max_price
+            venues_data['price_match'] = np.where(in_range, 1.0, np.maximum(0.0, 1.0 - distance))
         else:
             venues_data['price_match'] = 0.7
     
@@ -400,8 +697,8 @@ class RecommendationEngine:
         preferred_districts = user_preferences.get('preferred_districts', [])
         
         if preferred_districts and 'district' in venues_data.columns:
-            venues_data['distance_score'] = venues_data['district'].apply(
-                lambda x: 1.0 if x in preferred_districts else 0.4
+            venues_data['distance_score'] = np.where(
+                _isin(venues_data['district'], preferred_districts), 1.0, 0.4
             )
         else:
             venues_data['distance_score'] = 0.7
@@ -412,6 +709,67 @@ class RecommendationEngine:
         # 暫時給予統一分數
         venues_data['facility_match'] = 0.7
     
+    def _calculate_weather_score(self, venues_data: pd.DataFrame, user_preferences: Dict[str, Any]):
+        """
+        計算天氣分數
+
+        依場地所在地區在運動時段內的最大降雨機率與最高體感溫度，為戶外場地計算 0~1 的分數；
+        各地區的分數先算成查表陣列，再以地區代碼一次對應到所有場地。
+        """
+        weather = self._weather_arrays(
+            venues_data, user_preferences.get('play_time'),
+            user_preferences.get('play_duration_hours', 2)
+        )
+        if weather is None:
+            venues_data['weather_score'] = 1.0
+            venues_data['precipitation_probability'] = np.nan
+            return
+        venues_data['weather_score'], venues_data['precipitation_probability'] = weather
+    
+    def _weather_arrays(self, venues_data: pd.DataFrame, play_time: Any = None,
+                        duration_hours: float = 2) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        各場地在運動時段內的天氣分數與降雨機率
+        
+        Args:
+            venues_data: 場地資料
+            play_time: 運動開始時間（datetime 或 epoch 秒），預設為現在
+            duration_hours: 運動時數
+            
+        Returns:
+            (天氣分數, 降雨機率)；沒有地區欄位或讀取天氣失敗時回傳 None
+        """
+        if 'district' not in venues_data.columns or venues_data.empty:
+            return None
+        
+        try:
+            from utils.weather_manager import get_weather_manager
+            start = play_time or datetime.now()
+            if not isinstance(start, datetime):
+                start = datetime.fromtimestamp(float(start))
+            end = start + timedelta(hours=float(duration_hours))
+            conditions = get_weather_manager().get_district_conditions(start, end)
+        except Exception as e:
+            print(f"讀取天氣資料時發生錯誤: {e}")
+            return None
+        
+        pop = conditions['precipitation_probability']
+        apparent = conditions['apparent_temperature']
+        # 降雨機率越高越不適合；體感溫度超過 32°C 後逐步降低，最多扣一半
+        rain_factor = 1.0 - np.nan_to_num(pop, nan=0.0) / 100.0
+        heat_factor = 1.0 - np.clip((np.nan_to_num(apparent, nan=0.0) - 32.0) / 16.0, 0.0, 0.5)
+        
+        # 查表陣列最後一格給找不到預報的地區（代碼 -1）
+        score_lookup = np.append(rain_factor * heat_factor, 1.0)
+        pop_lookup = np.append(pop, np.nan)
+        codes = _category_codes(venues_data['district'], conditions['districts'])
+        
+        if 'is_outdoor' in venues_data.columns:
+            outdoor = venues_data['is_outdoor'].to_numpy() == 1
+        else:
+            outdoor = np.zeros(len(venues_data), dtype=bool)
+        return np.where(outdoor, score_lookup[codes], 1.0), pop_lookup[codes]
+    
     def _apply_diversity(self, venues_data: pd.DataFrame, diversity_weight: float) -> pd.DataFrame:
         """
         應用多樣性到推薦結果
@@ -426,22 +784,13 @@ class RecommendationEngine:
         if 'sport_type' not in venues_data.columns:
             return venues_data
         
-        # 按運動類型分組
-        sport_groups = venues_data.groupby('sport_type')
-        
-        # 為每個運動類型添加多樣性懲罰
-        diversified_venues = []
-        
-        for sport_type, group in sport_groups:
-            group = group.copy()
-            # 根據該運動類型場地數量調整分數
-            group_size = len(group)
-            diversity_penalty = min(diversity_weight * (group_size - 1) * 0.1, 2.0)
-            
-            group['recommendation_score'] = group['recommendation_score'] - diversity_penalty
-            diversified_venues.append(group)
+        diversity_penalty = _diversity_penalty(venues_data['sport_type'], diversity_weight)
         
-        return pd.concat(diversified_venues, ignore_index=True)
+        diversified_venues = venues_data.copy(deep=False)
+        diversified_venues['recommendation_score'] = (
+            diversified_venues['recommendation_score'].to_numpy(dtype=float) - diversity_penalty
+        )
+        return diversified_venues
     
     def _add_recommendation_reasons(self, venues_data: pd.DataFrame, user_preferences: Dict[str, Any]) -> pd.DataFrame:
         """
@@ -454,29 +803,39 @@ class RecommendationEngine:
         Returns:
             包含推薦原因的場地資料
         """
-        venues_with_reasons = venues_data.copy()
+        venues_with_reasons = venues_data.copy(deep=False)
+        n = len(venues_with_reasons)
         
-        def generate_reason(row):
-            reasons = []
-            
-            if row.get('preference_match', 0) > 0.8:
-                if 'sport_type' in row and row['sport_type'] in user_preferences.get('preferred_sports', []):
-                    reasons.append(f"符合您偏好的{row['sport_type']}")
-                if 'district' in row and row['district'] in user_preferences.get('preferred_districts', []):
-                    reasons.append(f"位於您偏好的{row['district']}")
-            
-            if row.get('rating_weight', 0) > 0.8 and 'rating' in row:
-                reasons.append(f"高評分場地({row['rating']:.1f}/5.0)")
-            
-            if row.get('price_match', 0) > 0.8:
-                reasons.append("價格符合您的預算")
-            
-            if not reasons:
-                reasons.append("綜合評估推薦")
-            
-            return " • ".join(reasons)
+        def column(name, default=0.0):
+            if name in venues_with_reasons.columns:
+                return venues_with_reasons[name].to_numpy(dtype=float)
+            return np.full(n, default)
+        
+        def text(name):
+            return venues_with_reasons[name].astype(object).to_numpy()
         
-        venues_with_reasons['recommendation_reason'] = venues_with_reasons.apply(generate_reason, axis=1)
+        preference_hit = column('preference_match') > 0.8
+        parts = []
+        if 'sport_type' in venues_with_reasons.columns:
+            mask = preference_hit & _isin(venues_with_reasons['sport_type'], user_preferences.get('preferred_sports', []))
+            parts.append((mask, '符合您偏好的' + text('sport_type').astype(str)))
+        if 'district' in venues_with_reasons.columns:
+            mask = preference_hit & _isin(venues_with_reasons['district'], user_preferences.get('preferred_districts', []))
+            parts.append((mask, '位於您偏好的' + text('district').astype(str)))
+        if 'rating' in venues_with_reasons.columns:
+            mask = column('rating_weight') > 0.8
+            rating_text = np.char.mod('%.1f', np.nan_to_num(column('rating')))
+            parts.append((mask, np.char.add(np.char.add('高評分場地(', rating_text), '/5.0)').astype(object)))
+        parts.append((column('price_match') > 0.8, '價格符合您的預算'))
+        
+        pop = column('precipitation_probability', np.nan)
+        rainy = ~np.isnan(pop) & (pop >= 50)
+        outdoor = column('is_outdoor') == 1
+        pop_text = np.char.mod('%d', np.nan_to_num(pop).astype(int))
+        parts.append((rainy & outdoor, np.char.add(np.char.add('戶外場地，降雨機率', pop_text), '%').astype(object)))
+        parts.append((rainy & ~outdoor, '室內場地，不受降雨影響'))
+        
+        venues_with_reasons['recommendation_reason'] = _join_reasons(parts, n, '綜合評估推薦')
         
         return venues_with_reasons
     
@@ -491,7 +850,7 @@ class RecommendationEngine:
         Returns:
             篩選後的場地資料
         """
-        filtered_venues = venues_data.copy()
+        filtered_venues = venues_data.copy(deep=False)
         
         # 運動類型篩選
         preferred_sports = user_preferences.get('preferred_sports', [])
@@ -519,47 +878,6 @@ class RecommendationEngine:
         
         return filtered_venues
     
-    def _generate_similar_user_preferences(self, user_preferences: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """
-        生成相似用戶偏好（模擬）
-        
-        Args:
-            user_preferences: 當前用戶偏好
-            
-        Returns:
-            相似用戶偏好列表
-        """
-        similar_users = []
-        
-        # 基於當前用戶偏好生成相似用戶
-        base_sports = user_preferences.get('preferred_sports', [])
-        base_districts = user_preferences.get('preferred_districts', [])
-        
-        for i in range(5):  # 生成5個相似用戶
-            similar_user = {
-                'preferred_sports': base_sports.copy(),
-                'preferred_districts': base_districts.copy()
-            }
-            
-            # 添加一些變化
-            if base_sports:
-                # 隨機添加相關運動類型
-                additional_sports = ['籃球', '足球', '網球', '羽毛球', '游泳']
-                for sport in additional_sports:
-                    if sport not in similar_user['preferred_sports'] and random.random() < 0.3:
-                        similar_user['preferred_sports'].append(sport)
-            
-            if base_districts:
-                # 隨機添加鄰近地區
-                additional_districts = ['中正區', '大安區', '信義區', '中山區']
-                for district in additional_districts:
-                    if district not in similar_user['preferred_districts'] and random.random() < 0.2:
-                        similar_user['preferred_districts'].append(district)
-            
-            similar_users.append(similar_user)
-        
-        return similar_users
-    
     def get_ml_based_recommendations(self, 
                                    user_preferences: Dict[str, Any],
                                    num_recommendations: int = 10) -> Optional[pd.DataFrame]:
@@ -574,21 +892,25 @@ class RecommendationEngine:
             機器學習推薦場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
             if venues_data is None or venues_data.empty:
                 return None
             
-            # 準備特徵數據
-            feature_data = self._prepare_ml_features(venues_data)
+            # 取得此資料版本的模型（每個版本只訓練一次）
+            artifact = get_model_registry().get(
+                FOREST_MODEL, data_manager.snapshot.version,
+                lambda: self._fit_ml_artifact(venues_data),
+            )
             
-            if feature_data is None or feature_data.empty:
+            if not artifact:
                 return self.get_personalized_recommendations(user_preferences, num_recommendations)
             
-            # 訓練或更新機器學習模型
-            self._train_ml_model(feature_data, venues_data)
+            # 快取中的模型與編碼器由所有 session 共用，只能讀取
+            self.ml_model = artifact['model']
+            self.label_encoders = artifact['label_encoders']
             
             # 生成用戶特徵向量
             user_features = self._generate_user_features(user_preferences, venues_data)
@@ -598,7 +920,7 @@ class RecommendationEngine:
                 predictions = self.ml_model.predict(user_features.reshape(1, -1))
                 
                 # 創建推薦結果
-                ml_venues = venues_data.copy()
+                ml_venues = venues_data.copy(deep=False)
                 ml_venues['recommendation_score'] = np.random.uniform(5.0, 10.0, len(ml_venues))
                 ml_venues['recommendation_reason'] = "機器學習模型推薦 - 基於數據模式分析"
                 
@@ -632,26 +954,27 @@ class RecommendationEngine:
             聚類推薦場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
             if venues_data is None or venues_data.empty:
                 return None
             
-            # 準備聚類特徵
-            cluster_features = self._prepare_cluster_features(venues_data)
+            # 取得此資料版本的聚類結果（每個版本只訓練一次）
+            artifact = get_model_registry().get(
+                KMEANS_MODEL, data_manager.snapshot.version,
+                lambda: self._fit_cluster_artifact(venues_data),
+            )
             
-            if cluster_features is None or len(cluster_features) < 3:
+            if not artifact:
                 return self.get_personalized_recommendations(user_preferences, num_recommendations)
             
-            # 執行K-means聚類
-            n_clusters = min(5, len(venues_data) // 2)  # 動態確定聚類數量
-            self.kmeans_model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-            cluster_labels = self.kmeans_model.fit_predict(cluster_features)
+            self.kmeans_model = artifact['model']
+            cluster_labels = artifact['labels']
             
             # 為場地添加聚類標籤
-            cluster_venues = venues_data.copy()
+            cluster_venues = venues_data.copy(deep=False)
             cluster_venues['cluster'] = cluster_labels
             
             # 根據用戶偏好找到最相關的聚類
@@ -700,39 +1023,23 @@ class RecommendationEngine:
             內容推薦場地列表
         """
         try:
-            from utils.data_manager import DataManager
-            data_manager = DataManager()
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
             venues_data = data_manager.get_all_venues()
             
             if venues_data is None or venues_data.empty:
                 return None
             
-            # 準備文本內容特徵
-            content_features = self._prepare_content_features(venues_data)
-            
-            if not content_features:
+            index = self._get_venue_index(data_manager, venues_data)
+            if index is None:
                 return self.get_personalized_recommendations(user_preferences, num_recommendations)
             
-            # 使用TF-IDF向量化
-            if self.tfidf_vectorizer is None:
-                self.tfidf_vectorizer = TfidfVectorizer(
-                    max_features=100,
-                    stop_words=None,  # 中文沒有預設停用詞
-                    ngram_range=(1, 2)
-                )
-            
-            # 訓練TF-IDF模型
-            tfidf_matrix = self.tfidf_vectorizer.fit_transform(content_features)
-            
-            # 生成用戶查詢向量
+            # 由向量索引取出最相似的候選場地（保留空間給評分加權後的重新排序）
             user_query = self._generate_user_query(user_preferences)
-            user_vector = self.tfidf_vectorizer.transform([user_query])
-            
-            # 計算余弦相似度
-            similarities = cosine_similarity(user_vector, tfidf_matrix).flatten()
+            positions, similarities = index.query_text(user_query, max(num_recommendations * 5, 50))
             
             # 創建推薦結果
-            content_venues = venues_data.copy()
+            content_venues = venues_data.iloc[positions].copy()
             content_venues['similarity_score'] = similarities
             content_venues['recommendation_score'] = similarities * 10  # 轉換為10分制
             content_venues['recommendation_reason'] = "內容相似性推薦 - 基於場地描述和特徵匹配"
@@ -759,10 +1066,113 @@ class RecommendationEngine:
             print(f"內容推薦時發生錯誤: {e}")
             return self.get_personalized_recommendations(user_preferences, num_recommendations)
     
-    def _prepare_ml_features(self, venues_data: pd.DataFrame) -> Optional[pd.DataFrame]:
-        """準備機器學習特徵"""
+    def _fit_ml_artifact(self, venues_data: pd.DataFrame) -> Dict[str, Any]:
+        """
+        訓練隨機森林模型（由 ModelRegistry 呼叫，每個資料版本一次）
+
+        編碼器與模型都是新建立的物件，不修改 self，也不會動到舊版本快取中的物件。
+        """
+        label_encoders: Dict[str, LabelEncoder] = {}
+        feature_data = self._prepare_ml_features(venues_data, label_encoders)
+        if feature_data is None or feature_data.empty:
+            return {}
+        model = self._train_ml_model(feature_data, venues_data)
+        if model is None:
+            return {}
+        return {'model': model, 'label_encoders': label_encoders}
+    
+    def _fit_cluster_artifact(self, venues_data: pd.DataFrame) -> Dict[str, Any]:
+        """執行 K-means 聚類（由 ModelRegistry 呼叫，每個資料版本一次）"""
+        cluster_features = self._prepare_cluster_features(venues_data)
+        if cluster_features is None or len(cluster_features) < 3:
+            return {}
+        n_clusters = min(5, len(venues_data) // 2)  # 動態確定聚類數量
+        model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        labels = model.fit_predict(cluster_features)
+        return {'model': model, 'labels': labels.astype(np.int32)}
+    
+    def get_similar_venues(self, venue_id: Any, num_recommendations: int = 5) -> Optional[pd.DataFrame]:
+        """
+        與指定場地內容最相似的其他場地（場地詳情頁使用）
+        
+        Args:
+            venue_id: 場地ID
+            num_recommendations: 推薦數量
+            
+        Returns:
+            相似場地列表（含 similarity_score），找不到場地時回傳 None
+        """
+        try:
+            from utils.data_manager import get_data_manager
+            data_manager = get_data_manager()
+            venues_data = data_manager.get_all_venues()
+            
+            if venues_data is None or venues_data.empty:
+                return None
+            
+            index = self._get_venue_index(data_manager, venues_data)
+            if index is None:
+                return None
+            
+            positions, similarities = index.similar_to(venue_id, num_recommendations)
+            if len(positions) == 0:
+                return None
+            
+            similar_venues = venues_data.iloc[positions].copy()
+            similar_venues['similarity_score'] = similarities
+            similar_venues['recommendation_score'] = similarities * 10
+            similar_venues['recommendation_reason'] = "與此場地的類型與描述相似"
+            return similar_venues
+            
+        except Exception as e:
+            print(f"查詢相似場地時發生錯誤: {e}")
+            return None
+    
+    def _get_venue_index(self, data_manager, venues_data: pd.DataFrame) -> Optional[VenueVectorIndex]:
+        """取得此資料版本的場地向量索引（每個版本只建立一次）"""
+        registry = get_model_registry()
+        version = data_manager.snapshot.version
+        artifact = registry.get(
+            TFIDF_MODEL, version, lambda: self._fit_content_artifact(venues_data),
+        )
+        if not artifact:
+            return None
+        
+        self.tfidf_vectorizer = artifact['vectorizer']
+        self.content_features_matrix = artifact['matrix']
+        venue_ids = venues_data['id'] if 'id' in venues_data.columns else venues_data.index
+        return registry.get(
+            VENUE_INDEX_MODEL, version,
+            lambda: VenueVectorIndex.build(artifact['vectorizer'], artifact['matrix'], venue_ids.to_numpy()),
+        )
+    
+    def _fit_content_artifact(self, venues_data: pd.DataFrame) -> Dict[str, Any]:
+        """訓練 TF-IDF 模型並轉換所有場地（由 ModelRegistry 呼叫，每個資料版本一次）"""
+        content_features = self._prepare_content_features(venues_data)
+        if not content_features:
+            return {}
+        vectorizer = TfidfVectorizer(
+            max_features=100,
+            stop_words=None,  # 中文沒有預設停用詞
+            ngram_range=(1, 2)
+        )
+        matrix = vectorizer.fit_transform(content_features)
+        return {'vectorizer': vectorizer, 'matrix': matrix.tocsr()}
+    
+    def _prepare_ml_features(self, venues_data: pd.DataFrame,
+                             label_encoders: Dict[str, LabelEncoder]) -> Optional[pd.DataFrame]:
+        """
+        準備機器學習特徵
+
+        Args:
+            venues_data: 場地資料
+            label_encoders: 存放各類別欄位新建編碼器的 dict
+
+        Returns:
+            加上編碼欄位的特徵資料
+        """
         try:
-            feature_data = venues_data.copy()
+            feature_data = venues_data.copy(deep=False)
             
             # 數值特徵
             numeric_features = ['price_per_hour', 'rating']
@@ -774,14 +1184,15 @@ class RecommendationEngine:
             categorical_features = ['sport_type', 'district']
             for col in categorical_features:
                 if col in feature_data.columns:
-                    if col not in self.label_encoders:
-                        self.label_encoders[col] = LabelEncoder()
+                    # 每次訓練都建立新的編碼器
+                    encoder = LabelEncoder()
+                    label_encoders[col] = encoder
                     
                     # 處理未見過的類別
                     unique_values = feature_data[col].dropna().unique()
-                    self.label_encoders[col].fit(unique_values)
+                    encoder.fit(unique_values)
                     feature_data[f'{col}_encoded'] = feature_data[col].apply(
-                        lambda x: self.label_encoders[col].transform([x])[0] if pd.notna(x) and x in self.label_encoders[col].classes_ else -1
+                        lambda x: encoder.transform([x])[0] if pd.notna(x) and x in encoder.classes_ else -1
                     )
             
             return feature_data
@@ -790,8 +1201,8 @@ class RecommendationEngine:
             print(f"準備ML特徵時發生錯誤: {e}")
             return None
     
-    def _train_ml_model(self, feature_data: pd.DataFrame, venues_data: pd.DataFrame):
-        """訓練機器學習模型"""
+    def _train_ml_model(self, feature_data: pd.DataFrame, venues_data: pd.DataFrame) -> Optional[RandomForestRegressor]:
+        """訓練機器學習模型；失敗時回傳 None"""
         try:
             # 準備訓練數據
             feature_cols = ['price_per_hour', 'rating']
@@ -807,11 +1218,13 @@ class RecommendationEngine:
             y = np.clip(y, 0, 10)
             
             # 訓練隨機森林模型
-            self.ml_model = RandomForestRegressor(n_estimators=50, random_state=42, max_depth=5)
-            self.ml_model.fit(X, y)
+            model = RandomForestRegressor(n_estimators=50, random_state=42, max_depth=5)
+            model.fit(X, y)
+            return model
             
         except Exception as e:
             print(f"訓練ML模型時發生錯誤: {e}")
+            return None
     
     def _generate_user_features(self, user_preferences: Dict[str, Any], venues_data: pd.DataFrame) -> Optional[np.ndarray]:
         """生成用戶特徵向量"""
@@ -859,23 +1272,19 @@ class RecommendationEngine:
     
     def _adjust_ml_scores(self, venues_data: pd.DataFrame, user_preferences: Dict[str, Any]) -> pd.DataFrame:
         """調整機器學習推薦分數"""
-        adjusted_venues = venues_data.copy()
+        adjusted_venues = venues_data.copy(deep=False)
         
         # 根據用戶偏好調整分數
         preferred_sports = user_preferences.get('preferred_sports', [])
         preferred_districts = user_preferences.get('preferred_districts', [])
         
+        score = adjusted_venues['recommendation_score'].to_numpy(dtype=float)
         if preferred_sports and 'sport_type' in adjusted_venues.columns:
-            sport_bonus = adjusted_venues['sport_type'].apply(
-                lambda x: 2.0 if x in preferred_sports else 0.0
-            )
-            adjusted_venues['recommendation_score'] += sport_bonus
+            score = score + 2.0 * _isin(adjusted_venues['sport_type'], preferred_sports)
         
         if preferred_districts and 'district' in adjusted_venues.columns:
-            district_bonus = adjusted_venues['district'].apply(
-                lambda x: 1.5 if x in preferred_districts else 0.0
-            )
-            adjusted_venues['recommendation_score'] += district_bonus
+            score = score + 1.5 * _isin(adjusted_venues['district'], preferred_districts)
+        adjusted_venues['recommendation_score'] = score
         
         return adjusted_venues
     
@@ -918,33 +1327,31 @@ class RecommendationEngine:
             preferred_sports = user_preferences.get('preferred_sports', [])
             preferred_districts = user_preferences.get('preferred_districts', [])
             
-            # 計算每個聚類的匹配度
-            cluster_scores = {}
+            # 以 bincount 一次計算每個聚類的匹配度
+            labels = cluster_venues['cluster'].to_numpy()
+            if len(labels) == 0:
+                return None
+            sizes = np.bincount(labels)
+            present = sizes > 0
+            safe_sizes = np.maximum(sizes, 1)
+            score = np.zeros(len(sizes))
             
-            for cluster_id in cluster_venues['cluster'].unique():
-                cluster_data = cluster_venues[cluster_venues['cluster'] == cluster_id]
-                score = 0
-                
-                # 運動類型匹配度
-                if preferred_sports and 'sport_type' in cluster_data.columns:
-                    sport_matches = cluster_data['sport_type'].isin(preferred_sports).sum()
-                    score += sport_matches / len(cluster_data) * 3.0
-                
-                # 地區匹配度
-                if preferred_districts and 'district' in cluster_data.columns:
-                    district_matches = cluster_data['district'].isin(preferred_districts).sum()
-                    score += district_matches / len(cluster_data) * 2.0
-                
-                # 評分因子
-                avg_rating = cluster_data['rating'].fillna(3.0).mean()
-                score += avg_rating * 0.5
-                
-                cluster_scores[cluster_id] = score
+            # 運動類型匹配度
+            if preferred_sports and 'sport_type' in cluster_venues.columns:
+                hits = _isin(cluster_venues['sport_type'], preferred_sports)
+                score += np.bincount(labels, weights=hits, minlength=len(sizes)) / safe_sizes * 3.0
             
-            if cluster_scores:
-                return max(cluster_scores, key=cluster_scores.get)
+            # 地區匹配度
+            if preferred_districts and 'district' in cluster_venues.columns:
+                hits = _isin(cluster_venues['district'], preferred_districts)
+                score += np.bincount(labels, weights=hits, minlength=len(sizes)) / safe_sizes * 2.0
             
-            return None
+            # 評分因子
+            ratings = cluster_venues['rating'].fillna(3.0).to_numpy(dtype=float)
+            score += np.bincount(labels, weights=ratings, minlength=len(sizes)) / safe_sizes * 0.5
+            
+            score[~present] = -np.inf
+            return int(np.argmax(score))
             
         except Exception as e:
             print(f"尋找用戶聚類時發生錯誤: {e}")
@@ -993,60 +1400,19 @@ class RecommendationEngine:
         
         return ' '.join(query_parts) if query_parts else '運動場地'
     
-    def _calculate_collaborative_score(self, venue: pd.Series, similar_users_preferences: List[Dict[str, Any]]) -> float:
-        """
-        計算協同過濾分數
-        
-        Args:
-            venue: 場地資料
-            similar_users_preferences: 相似用戶偏好列表
-            
-        Returns:
-            協同過濾分數
-        """
-        total_score = 0.0
-        matching_users = 0
-        
-        for user_pref in similar_users_preferences:
-            score = 0.0
-            
-            # 運動類型匹配
-            if venue.get('sport_type') in user_pref.get('preferred_sports', []):
-                score += 3.0
-            
-            # 地區匹配
-            if venue.get('district') in user_pref.get('preferred_districts', []):
-                score += 2.0
-            
-            # 評分影響
-            if venue.get('rating'):
-                score += venue.get('rating', 0) * 0.5
-            
-            if score > 0:
-                total_score += score
-                matching_users += 1
-        
-        if matching_users > 0:
-            return total_score / matching_users
-        else:
-            return 5.0  # 預設分數
-    
     def record_feedback(self, venue_id: Any, feedback_type: str, user_preferences: Dict[str, Any]):
         """
-        記錄用戶反饋
+        記錄用戶反饋（寫入資料庫，供協同過濾模型訓練）
         
         Args:
             venue_id: 場地ID
-            feedback_type: 反饋類型 ('like', 'dislike')
-            user_preferences: 用戶偏好
+            feedback_type: 反饋類型 ('like', 'dislike', 'favorite', 'view', 'booking')
+            user_preferences: 用戶偏好（user_key 為用戶識別）
         """
-        if venue_id not in self.feedback_data:
-            self.feedback_data[venue_id] = {'likes': 0, 'dislikes': 0}
-        
-        if feedback_type == 'like':
-            self.feedback_data[venue_id]['likes'] += 1
-        elif feedback_type == 'dislike':
-            self.feedback_data[venue_id]['dislikes'] += 1
+        try:
+            get_collaborative_filter().record(user_preferences.get('user_key'), venue_id, feedback_type)
+        except Exception as e:
+            print(f"記錄用戶反饋時發生錯誤: {e}")
     
     def update_user_profile(self, user_preferences: Dict[str, Any]):
         """
@@ -1090,6 +1456,7 @@ class RecommendationEngine:
             'price_weight': 0.2,
             'distance_weight': 0.15,
             'facility_weight': 0.1,
+            'weather_weight': 0.5,
             'explore_vs_exploit': 0.3,
             'popularity_bias': 0.4,
             'novelty_preference': 0.2,
@@ -0,0 +1,120 @@
+# utils/search_index.py
+"""
+場地關鍵字倒排索引
+
+中文沒有空白分詞，因此以字元 bigram（以及單字元）作為詞彙；英數字同樣以 bigram
+建索引，保留原本「子字串包含」的搜尋語意。每個詞彙對應一個排序好的列位置陣列，
+查詢時只做 posting 交集，再對少量候選列確認子字串，不必掃描整張表。
+"""
+from typing import Dict, Iterable, List, Optional
+import re
+
+import numpy as np
+import pandas as pd
+
+# 納入索引的欄位
+SEARCH_FIELDS = ["name", "district", "sport_type", "address", "facilities", "description"]
+
+# 欄位分隔字元；不會出現在查詢中，避免跨欄位誤判
+_FIELD_SEP = "\x1f"
+_WORD_RUN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> set:
+    """
+    將文字切成索引詞彙（已轉小寫）
+
+    每段連續的文字/數字各自產生單字元與相鄰兩字元的詞彙，不跨越空白或標點。
+    """
+    tokens = set()
+    for run in _WORD_RUN.findall(text.lower()):
+        tokens.update(run)
+        tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _query_tokens(query: str) -> List[str]:
+    """查詢字串所需的詞彙：單一字元查詢用單字元，其餘取所有 bigram"""
+    tokens = []
+    for run in _WORD_RUN.findall(query):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class SearchIndex:
+    """
+    場地關鍵字倒排索引
+    """
+
+    def __init__(self, venues_df: pd.DataFrame, fields: Optional[Iterable[str]] = None):
+        """
+        建立索引
+
+        Args:
+            venues_df: 場地資料 DataFrame
+            fields: 要索引的欄位，預設為 SEARCH_FIELDS
+        """
+        fields = [c for c in (fields or SEARCH_FIELDS) if c in venues_df.columns]
+        self.n_rows = len(venues_df)
+
+        # 每列的各欄位文字（小寫），用於最後的子字串確認
+        columns = [
+            venues_df[c].astype(object).where(venues_df[c].notna(), "").astype(str).str.lower().tolist()
+            for c in fields
+        ]
+        self._texts: List[str] = [_FIELD_SEP.join(vals) for vals in zip(*columns)] if columns else [""] * self.n_rows
+
+        postings: Dict[str, List[int]] = {}
+        for row, text in enumerate(self._texts):
+            for token in tokenize(text):
+                postings.setdefault(token, []).append(row)
+
+        # 列位置依序加入，天然已排序
+        self.postings: Dict[str, np.ndarray] = {
+            token: np.asarray(rows, dtype=np.int32) for token, rows in postings.items()
+        }
+
+    def search(self, query: str) -> np.ndarray:
+        """
+        搜尋包含關鍵字的場地
+
+        Args:
+            query: 關鍵字（不分大小寫，視為一般字串而非正規表示式）
+
+        Returns:
+            符合條件的列位置（由小到大排序）
+        """
+        q = str(query).lower()
+        if not q:
+            return np.empty(0, dtype=np.int32)
+
+        tokens = _query_tokens(q)
+        if tokens:
+            lists = []
+            for token in set(tokens):
+                rows = self.postings.get(token)
+                if rows is None:
+                    return np.empty(0, dtype=np.int32)
+                lists.append(rows)
+
+            # 由最短的 posting 開始交集，候選集合很快縮小
+            lists.sort(key=len)
+            candidates = lists[0]
+            for rows in lists[1:]:
+                if candidates.size == 0:
+                    break
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+
+            # 查詢本身就是單一詞彙時，posting 即為精確結果
+            if len(tokens) == 1 and tokens[0] == q:
+                return candidates
+        else:
+            # 查詢只有標點或空白，無法利用索引
+            candidates = np.arange(self.n_rows, dtype=np.int32)
+
+        texts = self._texts
+        keep = [i for i in candidates.tolist() if q in texts[i]]
+        return np.asarray(keep, dtype=np.int32)
@@ -0,0 +1,189 @@
+# utils/spatial_index.py
+"""
+場地座標空間索引
+
+每個資料快照建立一次：以 haversine 距離的 BallTree 回答最近鄰與半徑查詢（O(log n)），
+另保存依緯度排序的陣列，邊界框查詢先二分搜尋緯度範圍，再篩選經度。
+
+查詢結果皆為快照中的列位置；可另外傳入 rows（例如篩選結果的列位置）限制查詢範圍。
+"""
+from typing import Optional, Tuple
+import weakref
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from utils.map_utils import EARTH_RADIUS_KM, coordinates_in_radians, haversine_km
+
+# 限制範圍的列數少於此值時，直接對這些列計算距離比查樹快
+_SCAN_LIMIT = 2048
+
+
+class SpatialIndex:
+    """
+    場地座標空間索引
+    """
+
+    def __init__(self, venues_df: pd.DataFrame):
+        """
+        建立索引
+
+        Args:
+            venues_df: 場地資料 DataFrame（需有 latitude、longitude 欄位）
+        """
+        self.n_rows = len(venues_df)
+        # 只保留弱參照，用於辨識呼叫端傳入的是否就是建立索引的資料表
+        self._source = weakref.ref(venues_df)
+        self.ids = venues_df["id"].to_numpy() if "id" in venues_df.columns else None
+        if self.n_rows and {"latitude", "longitude"} <= set(venues_df.columns):
+            lat, lon, valid = coordinates_in_radians(venues_df)
+        else:
+            lat = lon = np.full(self.n_rows, np.nan)
+            valid = np.zeros(self.n_rows, dtype=bool)
+
+        self.lat, self.lon, self.valid = lat, lon, valid
+        # 樹中的第 i 個點對應快照的第 points[i] 列
+        self.points = np.flatnonzero(valid).astype(np.int64)
+        self.tree = (
+            BallTree(np.column_stack([lat[self.points], lon[self.points]]), metric="haversine")
+            if len(self.points) else None
+        )
+        # 邊界框查詢使用：依緯度排序的列位置與緯度
+        order = self.points[np.argsort(lat[self.points], kind="stable")]
+        self._lat_order = order
+        self._lat_sorted = lat[order]
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def rows_for(self, venues_df: pd.DataFrame) -> Optional[np.ndarray]:
+        """
+        venues_df 在建立索引之快照中的列位置
+
+        快照的子集（例如 DataManager 篩選結果）保留快照的列位置作為索引標籤；
+        以場地ID確認對應無誤。
+
+        Returns:
+            列位置；不是此快照（或其子集）時回傳 None
+        """
+        if venues_df is self._source():
+            return np.arange(self.n_rows)
+        if self.ids is None or "id" not in venues_df.columns:
+            return None
+        if venues_df.index.dtype.kind not in "iu" or not venues_df.index.is_unique:
+            return None
+        rows = venues_df.index.to_numpy()
+        if len(rows) and (rows.min() < 0 or rows.max() >= self.n_rows):
+            return None
+        if not np.array_equal(self.ids[rows], venues_df["id"].to_numpy()):
+            return None
+        return rows
+
+    def _allowed(self, rows: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if rows is None:
+            return None
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def _scan(self, lat: float, lon: float, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """直接計算指定列的距離（略過無效座標）"""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[self.valid[rows]]
+        return rows, haversine_km(lat, lon, self.lat[rows], self.lon[rows])
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k 個最近的場地
+
+        Args:
+            lat: 緯度（度）
+            lon: 經度（度）
+            k: 數量
+            rows: 限制查詢的列位置，None 表示全部
+
+        Returns:
+            (列位置, 距離公里)，由近到遠
+        """
+        lat, lon = np.radians(lat), np.radians(lon)
+        if self.tree is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        if rows is not None and len(rows) <= _SCAN_LIMIT:
+            candidates, distances = self._scan(lat, lon, rows)
+            order = np.argsort(distances, kind="stable")[:k]
+            return candidates[order], distances[order]
+
+        allowed = self._allowed(rows)
+        query = min(k, len(self.points))
+        while True:
+            dist, idx = self.tree.query([[lat, lon]], k=query)
+            found = self.points[idx[0]]
+            dist = dist[0] * EARTH_RADIUS_KM
+            if allowed is not None:
+                keep = allowed[found]
+                found, dist = found[keep], dist[keep]
+            # 限制範圍時可能不足 k 個，加倍查詢直到足夠或已查完所有點
+            if len(found) >= k or query >= len(self.points):
+                return found[:k], dist[:k]
+            query = min(query * 2, len(self.points))
+
+    def within_radius(self, lat: float, lon: float, radius_km: float,
+                      rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        半徑內的場地
+
+        Args:
+            lat: 緯度（度）
+            lon: 經度（度）
+            radius_km: 半徑（公里）
+            rows: 限制查詢的列位置
+
+        Returns:
+            (列位置, 距離公里)，依列位置排序
+        """
+        lat, lon = np.radians(lat), np.radians(lon)
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        if rows is not None and len(rows) <= _SCAN_LIMIT:
+            found, dist = self._scan(lat, lon, rows)
+            keep = dist <= radius_km
+            found, dist = found[keep], dist[keep]
+        else:
+            idx, dist = self.tree.query_radius([[lat, lon]], r=radius_km / EARTH_RADIUS_KM, return_distance=True)
+            found, dist = self.points[idx[0]], dist[0] * EARTH_RADIUS_KM
+            allowed = self._allowed(rows)
+            if allowed is not None:
+                keep = allowed[found]
+                found, dist = found[keep], dist[keep]
+
+        order = np.argsort(found, kind="stable")
+        return found[order], dist[order]
+
+    def within_bounds(self, south: float, west: float, north: float, east: float,
+                      rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        邊界框內的場地
+
+        Args:
+            south: 南界緯度（度）
+            west: 西界經度（度）
+            north: 北界緯度（度）
+            east: 東界經度（度）
+            rows: 限制查詢的列位置
+
+        Returns:
+            列位置（由小到大）
+        """
+        lo = np.searchsorted(self._lat_sorted, np.radians(south), side="left")
+        hi = np.searchsorted(self._lat_sorted, np.radians(north), side="right")
+        found = self._lat_order[lo:hi]
+        lon = self.lon[found]
+        found = found[(lon >= np.radians(west)) & (lon <= np.radians(east))]
+        allowed = self._allowed(rows)
+        if allowed is not None:
+            found = found[allowed[found]]
+        return np.sort(found)
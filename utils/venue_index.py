@@ -0,0 +1,216 @@
+# utils/venue_index.py
+"""
+場地內容向量索引
+
+場地的 TF-IDF 向量先以 TruncatedSVD 降維並正規化，內積即為餘弦相似度。
+場地數量不多時直接對所有場地計算內積（精確搜尋）；超過 EXACT_SEARCH_LIMIT 時
+改用隨機投影 LSH：每張雜湊表以一組隨機超平面把向量編成位元碼，
+查詢只比對同桶（以及相差一個位元的鄰近桶）的候選場地，再以精確內積排序。
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+# 場地數量超過此值時使用 LSH
+EXACT_SEARCH_LIMIT = 5000
+# 降維後的維度上限
+EMBEDDING_DIM = 64
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """列向量正規化為單位長度（零向量維持為零）"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """分數最高的 k 個位置（由高到低）"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class RandomProjectionLSH:
+    """
+    隨機投影（SimHash）局部敏感雜湊
+
+    每張表的桶以排序後的雜湊碼保存，查詢時以二分搜尋找出桶的範圍。
+    """
+
+    def __init__(self, n_tables: int = 8, n_bits: int = 12, seed: int = 0):
+        """
+        Args:
+            n_tables: 雜湊表數量（越多召回率越高）
+            n_bits: 每張表的位元數（越多桶越小）
+            seed: 隨機種子
+        """
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+        self.planes: Optional[np.ndarray] = None
+        self.sorted_codes: Optional[np.ndarray] = None
+        self.order: Optional[np.ndarray] = None
+        self._weights = (1 << np.arange(n_bits)).astype(np.int64)
+
+    def _codes(self, vectors: np.ndarray) -> np.ndarray:
+        """(表數, 向量數) 的雜湊碼"""
+        bits = np.einsum("tbd,nd->tnb", self.planes, vectors) > 0
+        return bits.astype(np.int64) @ self._weights
+
+    def fit(self, vectors: np.ndarray) -> "RandomProjectionLSH":
+        """
+        建立雜湊表
+
+        Args:
+            vectors: (向量數, 維度) 矩陣
+        """
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((self.n_tables, self.n_bits, vectors.shape[1])).astype(np.float32)
+        codes = self._codes(vectors)
+        self.order = np.argsort(codes, axis=1, kind="stable")
+        self.sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+        return self
+
+    def candidates(self, vector: np.ndarray, multi_probe: bool = True) -> np.ndarray:
+        """
+        與查詢向量落在同一桶的向量位置
+
+        Args:
+            vector: 查詢向量
+            multi_probe: 是否一併查詢相差一個位元的鄰近桶
+
+        Returns:
+            候選位置（不重複）
+        """
+        codes = self._codes(vector[None, :])[:, 0]
+        if multi_probe:
+            probes = np.concatenate([codes[:, None], codes[:, None] ^ self._weights[None, :]], axis=1)
+        else:
+            probes = codes[:, None]
+
+        found = []
+        for t in range(self.n_tables):
+            lo = np.searchsorted(self.sorted_codes[t], probes[t], side="left")
+            hi = np.searchsorted(self.sorted_codes[t], probes[t], side="right")
+            for a, b in zip(lo, hi):
+                if b > a:
+                    found.append(self.order[t, a:b])
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate(found))
+
+
+class VenueVectorIndex:
+    """
+    場地內容相似度索引
+    """
+
+    def __init__(self, vectorizer, svd: Optional[TruncatedSVD], embeddings: np.ndarray,
+                 venue_ids: Sequence, lsh: Optional[RandomProjectionLSH] = None):
+        """
+        Args:
+            vectorizer: 已訓練的 TfidfVectorizer
+            svd: 降維模型，維度太小無法降維時為 None
+            embeddings: 正規化後的場地向量（與 venue_ids 同順序）
+            venue_ids: 場地ID
+            lsh: LSH 索引，精確搜尋時為 None
+        """
+        self.vectorizer = vectorizer
+        self.svd = svd
+        self.embeddings = embeddings
+        self.venue_ids = np.asarray(venue_ids)
+        self.lsh = lsh
+        self._positions: Dict = {vid: i for i, vid in enumerate(self.venue_ids.tolist())}
+
+    @classmethod
+    def build(cls, vectorizer, tfidf_matrix, venue_ids: Sequence,
+              dim: int = EMBEDDING_DIM, exact_limit: int = EXACT_SEARCH_LIMIT) -> "VenueVectorIndex":
+        """
+        由 TF-IDF 矩陣建立索引
+
+        Args:
+            vectorizer: 已訓練的 TfidfVectorizer
+            tfidf_matrix: 場地的 TF-IDF 稀疏矩陣
+            venue_ids: 場地ID（與矩陣列同順序）
+            dim: 降維後維度上限
+            exact_limit: 精確搜尋的場地數上限
+
+        Returns:
+            VenueVectorIndex
+        """
+        n_venues, n_terms = tfidf_matrix.shape
+        n_components = min(dim, n_terms - 1, n_venues - 1)
+        if n_components >= 2:
+            svd = TruncatedSVD(n_components=n_components, random_state=42)
+            reduced = svd.fit_transform(tfidf_matrix)
+        else:
+            svd, reduced = None, tfidf_matrix.toarray()
+        embeddings = _normalize(reduced)
+
+        lsh = RandomProjectionLSH().fit(embeddings) if n_venues > exact_limit else None
+        return cls(vectorizer, svd, embeddings, venue_ids, lsh)
+
+    def __len__(self) -> int:
+        return len(self.venue_ids)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """文字轉為正規化向量"""
+        matrix = self.vectorizer.transform(texts)
+        reduced = self.svd.transform(matrix) if self.svd is not None else matrix.toarray()
+        return _normalize(reduced)
+
+    def search(self, vector: np.ndarray, k: int = 10,
+               exclude: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        以向量查詢最相似的場地
+
+        Args:
+            vector: 正規化後的查詢向量
+            k: 回傳數量
+            exclude: 要排除的場地位置（例如查詢場地本身）
+
+        Returns:
+            (場地位置, 餘弦相似度)，由高到低排列
+        """
+        if not np.any(vector):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        wanted = k + (exclude is not None)
+        candidates = self.lsh.candidates(vector) if self.lsh is not None else None
+        # 沒有 LSH 或候選太少時對所有場地做精確搜尋，確保回傳數量
+        if candidates is None or len(candidates) < wanted:
+            scores = self.embeddings @ vector
+            positions = _top_k(scores, wanted)
+            scores = scores[positions]
+        else:
+            scores = self.embeddings[candidates] @ vector
+            best = _top_k(scores, wanted)
+            positions, scores = candidates[best], scores[best]
+        if exclude is not None:
+            keep = positions != exclude
+            positions, scores = positions[keep], scores[keep]
+        return positions[:k], scores[:k]
+
+    def query_text(self, text: str, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        以文字查詢最相似的場地
+
+        Returns:
+            (場地位置, 餘弦相似度)
+        """
+        return self.search(self.embed([text])[0], k)
+
+    def similar_to(self, venue_id, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        與指定場地內容最相似的其他場地
+
+        Returns:
+            (場地位置, 餘弦相似度)；找不到場地時回傳空陣列
+        """
+        position = self._positions.get(venue_id)
+        if position is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        return self.search(self.embeddings[position], k, exclude=position)
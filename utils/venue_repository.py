@@ -0,0 +1,243 @@
+# utils/venue_repository.py
+"""
+場地資料版本化快照與熱更新
+
+VenueSnapshot 是某一版本場地資料及其衍生結構（索引、座標、統計）的不可變組合；
+VenueRepository 在背景執行緒建好新快照後，才以單一參照替換切換版本。
+已取得舊快照的呼叫端在下次重新整理前都會繼續讀到一致的舊版本。
+"""
+from pathlib import Path
+from typing import Optional
+import os
+import threading
+import time
+
+import pandas as pd
+
+from utils.venue_store import (
+    DEFAULT_CSV_PATH, DEFAULT_STORE_DIR, GEOCODE_CACHE_PATH, compile_venue_store, read_store,
+    remove_stale_stores, source_fingerprint,
+)
+from utils.search_index import SearchIndex
+from utils.facet_index import FacetIndex
+from utils.spatial_index import SpatialIndex
+
+# 檢查來源檔是否變更的間隔秒數；設為 0 可停用自動監看
+WATCH_INTERVAL = float(os.environ.get("VENUE_DATA_WATCH_INTERVAL", "60"))
+
+
+class VenueSnapshot:
+    """
+    單一版本的場地資料與衍生結構
+
+    建立後不再修改，可安全地在多個 session 之間共用。
+    """
+
+    def __init__(self, venues_data: pd.DataFrame, version: str = ""):
+        """
+        建立快照並預先計算所有衍生結構
+
+        Args:
+            venues_data: 場地資料 DataFrame
+            version: 資料版本（編譯結果名稱，包含來源檔內容雜湊）
+        """
+        self.version = version
+        self.loaded_at = time.time()
+
+        self.venues_data = venues_data
+        # id → 列位置（雜湊索引，查詢為 O(1)）
+        self.id_index = pd.Index(venues_data["id"] if "id" in venues_data.columns else [])
+        self.search_index = SearchIndex(venues_data)
+        self.facet_index = FacetIndex(venues_data)
+        # 座標空間索引（最近鄰、半徑與邊界框查詢）
+        self.spatial_index = SpatialIndex(venues_data)
+        # 預熱全表統計，側邊欄第一次顯示時不必再計算
+        self.stats = self.facet_index.facet_counts()
+
+    @classmethod
+    def empty(cls) -> "VenueSnapshot":
+        """沒有資料時使用的空快照"""
+        return cls(pd.DataFrame(), version="")
+
+    @classmethod
+    def from_csv(cls, csv_path: Path) -> "VenueSnapshot":
+        """
+        由來源 CSV 建立快照（經由已編譯的欄式檔案）
+
+        Args:
+            csv_path: 來源 CSV 路徑
+
+        Returns:
+            場地資料快照
+        """
+        store_path = compile_venue_store(csv_path)
+        version = store_path.name
+        return cls(read_store(store_path), version=version)
+
+
+class VenueRepository:
+    """
+    行程共用的場地資料來源
+
+    持有目前的快照，並負責監看來源檔、在背景重建與切換版本。
+    """
+
+    def __init__(self, csv_path: Path = DEFAULT_CSV_PATH, watch_interval: float = WATCH_INTERVAL):
+        """
+        Args:
+            csv_path: 來源 CSV 路徑
+            watch_interval: 監看間隔秒數，0 表示不自動監看
+        """
+        self.csv_path = Path(csv_path)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._source_stat = None
+        self._source_hash = None
+        self._current = self._build()
+        self._watcher = None
+        self._sync_to_storage(self._current)
+
+        if watch_interval > 0:
+            self.start_watching(watch_interval)
+
+    def current(self) -> VenueSnapshot:
+        """目前的快照（單一參照讀取，不需加鎖）"""
+        return self._current
+
+    @property
+    def version(self) -> str:
+        return self._current.version
+
+    def _stat(self):
+        # 地理編碼快取更新後也需要重建（編譯結果包含快取中的座標）
+        stats = []
+        for path in (self.csv_path, GEOCODE_CACHE_PATH):
+            try:
+                st = os.stat(path)
+                stats.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                stats.append(None)
+        return tuple(stats) if stats[0] is not None else None
+
+    def _build(self) -> VenueSnapshot:
+        """建立第一個快照；失敗時回傳空快照"""
+        if not self.csv_path.exists():
+            print(f"❌ 找不到 CSV：{self.csv_path}")
+            return VenueSnapshot.empty()
+        try:
+            self._source_stat = self._stat()
+            self._source_hash = source_fingerprint(self.csv_path)
+            snapshot = VenueSnapshot.from_csv(self.csv_path)
+            print(f"✅ 成功載入 {len(snapshot.venues_data)} 筆場地資料（版本 {snapshot.version}）")
+            self._remove_old_stores(snapshot)
+            return snapshot
+        except Exception as e:
+            print(f"❌ 載入場地資料發生錯誤: {e}")
+            return VenueSnapshot.empty()
+
+    @staticmethod
+    def _remove_old_stores(snapshot: VenueSnapshot):
+        """新快照上線後刪除其他版本的編譯結果，只保留目前使用中的目錄"""
+        if snapshot.version:
+            remove_stale_stores(DEFAULT_STORE_DIR, keep=DEFAULT_STORE_DIR / snapshot.version)
+
+    def _sync_to_storage(self, snapshot: VenueSnapshot, wait: bool = False):
+        """
+        將場地資料同步到 SQL 儲存層（評論與預訂的外鍵參照）
+
+        同一版本只寫入一次；資料庫無法使用時只記錄錯誤，不影響場地資料服務。
+        第一次同步在背景執行，完成前評論與預訂的寫入會等待（VenueStorage.wait_for_venues）。
+
+        Args:
+            snapshot: 場地資料快照
+            wait: 是否在目前執行緒同步（重新載入時於切換版本前完成，新場地一上線即可寫入）
+        """
+        def run():
+            try:
+                from utils.database import get_storage
+                if get_storage().sync_venues(snapshot.venues_data, snapshot.version):
+                    print(f"✅ 場地資料已同步到資料庫（版本 {snapshot.version}）")
+            except Exception as e:
+                print(f"❌ 同步場地資料到資料庫發生錯誤: {e}")
+
+        if wait:
+            run()
+        else:
+            threading.Thread(target=run, name="venue-sync", daemon=True).start()
+
+    def reload(self, wait: bool = False, force: bool = False) -> Optional[threading.Thread]:
+        """
+        重新載入來源檔
+
+        新快照在背景執行緒建立，完成後才替換版本指標；建立期間所有讀取仍使用舊快照。
+        若已有重新載入正在進行則直接略過。
+
+        Args:
+            wait: 是否等待重新載入完成
+            force: 來源內容未變更時是否仍重建
+
+        Returns:
+            執行重新載入的執行緒；略過時回傳 None
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return None
+
+        def run():
+            new_stat = None
+            try:
+                if not self.csv_path.exists():
+                    return
+                new_stat = self._stat()
+                new_hash = source_fingerprint(self.csv_path)
+                if not force and new_hash == self._source_hash:
+                    self._source_stat = new_stat
+                    return
+                snapshot = VenueSnapshot.from_csv(self.csv_path)
+                self._sync_to_storage(snapshot, wait=True)
+                with self._lock:
+                    self._current = snapshot
+                    self._source_stat = new_stat
+                    self._source_hash = new_hash
+                print(f"🔄 場地資料已更新為版本 {snapshot.version}（{len(snapshot.venues_data)} 筆）")
+                self._remove_old_stores(snapshot)
+            except Exception as e:
+                # 保留舊快照繼續服務；記下失敗時的檔案狀態，來源檔再次變更前監看不會重試
+                print(f"❌ 重新載入場地資料發生錯誤: {e}")
+                if new_stat is not None:
+                    self._source_stat = new_stat
+            finally:
+                self._reload_lock.release()
+
+        thread = threading.Thread(target=run, name="venue-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def start_watching(self, interval: float = WATCH_INTERVAL):
+        """啟動背景監看：來源檔或地理編碼快取的修改時間或大小改變時觸發重新載入"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                if self._stat() != self._source_stat:
+                    self.reload()
+
+        self._watcher = threading.Thread(target=watch, name="venue-watch", daemon=True)
+        self._watcher.start()
+
+
+_shared_repository = None
+_shared_repository_lock = threading.Lock()
+
+
+def get_venue_repository() -> VenueRepository:
+    """取得行程共用的 VenueRepository（執行緒安全）"""
+    global _shared_repository
+    if _shared_repository is None:
+        with _shared_repository_lock:
+            if _shared_repository is None:
+                _shared_repository = VenueRepository()
+    return _shared_repository
@@ -0,0 +1,485 @@
+# utils/venue_store.py
+"""
+場地資料編譯儲存
+
+將來源 CSV 編譯為欄式的 NumPy 檔案組（每欄一個 .npy），以來源檔（與地理編碼快取）內容雜湊作為鍵。
+啟動時直接以 memory-map 開啟，多個 worker 共用同一份分頁快取，
+只有在來源 CSV 內容改變時才需要重新解析。
+
+建置指令：
+    python -m utils.venue_store [csv 路徑]
+"""
+from pathlib import Path
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from utils.geocoder import DEFAULT_CACHE_PATH as GEOCODE_CACHE_PATH, cached_coordinates
+
+# 儲存格式版本；格式或衍生欄位的算法調整時遞增，使舊的編譯結果自動失效
+STORE_VERSION = 6
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_CSV_PATH = BASE_DIR / "attached_assets" / "finding move 2.csv"
+DEFAULT_STORE_DIR = BASE_DIR / ".cache" / "venue_store"
+
+MANIFEST_NAME = "manifest.json"
+
+# 欄位名稱對應表（以 CSV 欄名第一行、去除空白後比對）
+COLUMN_MAP = {
+    "名稱": "name", "場地名稱": "name",
+    "行政區": "district", "地區": "district",
+    "運動類型": "sport_type", "運動": "sport_type", "運動種類": "sport_type", "種類": "sport_type",
+    "地址": "address",
+    "設施": "facilities", "設施配備": "facilities",
+    "價格": "price_per_hour", "價位": "price_per_hour", "收費": "price_per_hour", "價格區間": "price_per_hour",
+    "開放時間": "opening_hours", "營業時間": "opening_hours",
+    "電話": "contact_phone", "聯絡電話": "contact_phone", "連絡電話": "contact_phone",
+    "網站": "website", "相關網頁": "website",
+    "描述": "description", "其他": "description",
+    "相片": "photos", "照片": "photos",
+    "特殊設施": "special_facilities",
+    "場館規模": "venue_scale",
+    "課程/教練": "coaching",
+    "備註": "notes",
+}
+
+# 以類別型別儲存的欄位
+CATEGORICAL_COLUMNS = ["district", "sport_type"]
+# 一律轉為數值的欄位
+NUMERIC_COLUMNS = ["price_per_hour", "rating", "latitude", "longitude"]
+
+# 產生座標時與行政區中心的最大偏移（度）
+COORDINATE_SPREAD_DEG = 0.01
+
+# 判斷戶外場地的關鍵字；同時符合室內關鍵字者（如「青年公園店」的健身房）視為室內
+OUTDOOR_PATTERN = r"戶外|公園|河濱|露天|田徑|網球場|棒球|壘球|足球場|自行車|單車|登山|步道|高爾夫|滑板|籃球場|溜冰"
+INDOOR_PATTERN = r"運動中心|健身|室內|溫水|館|gym|fitness|瑜珈|curves"
+# 用於判斷室內外的欄位
+VENUE_TYPE_COLUMNS = ["name", "sport_type", "facilities", "special_facilities", "venue_scale", "description"]
+
+
+def file_sha256(path: Path) -> str:
+    """計算檔案內容的 SHA-256"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_fingerprint(csv_path: Path, geocode_cache_path: Path = GEOCODE_CACHE_PATH) -> str:
+    """
+    來源 CSV 與地理編碼快取的合併雜湊
+
+    編譯結果會使用快取中的座標，因此兩者任一改變都應產生新的編譯結果；
+    沒有快取時即為 CSV 的雜湊。
+    """
+    source_hash = file_sha256(csv_path)
+    if Path(geocode_cache_path).exists():
+        combined = f"{source_hash}:{file_sha256(geocode_cache_path)}"
+        source_hash = hashlib.sha256(combined.encode("utf-8")).hexdigest()
+    return source_hash
+
+
+def _stable_hash(df: pd.DataFrame, columns: List[str], salt: str) -> np.ndarray:
+    """指定欄位內容的 64 位元固定金鑰雜湊（uint64）"""
+    cols = [c for c in columns if c in df.columns]
+    keys = df[cols].astype(str) if cols else pd.DataFrame({"row": np.arange(len(df)).astype(str)})
+    key = hashlib.md5(salt.encode("utf-8")).hexdigest()[:16]
+    return pd.util.hash_pandas_object(keys, index=False, hash_key=key).to_numpy(dtype=np.uint64)
+
+
+def stable_unit_hash(df: pd.DataFrame, columns: List[str], salt: str) -> np.ndarray:
+    """
+    由指定欄位內容產生穩定的 [0, 1) 亂數
+
+    使用 pandas 的固定金鑰雜湊（非 Python 內建 hash），不受行程或 PYTHONHASHSEED 影響；
+    不同 salt 產生互相獨立的數列。
+
+    Args:
+        df: 資料表
+        columns: 作為種子的欄位
+        salt: 區分用途的字串
+
+    Returns:
+        與 df 等長的 float64 陣列
+    """
+    h = _stable_hash(df, columns, salt)
+    # 取高 53 位元轉為雙精度浮點數
+    return (h >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def stable_venue_ids(df: pd.DataFrame) -> np.ndarray:
+    """
+    由場地名稱與地址產生穩定的場地ID（1 ~ 2^53 - 1）
+
+    來源 CSV 沒有 id 欄時使用：新增、刪除或調換其他列都不會改變既有場地的 ID，
+    資料庫中以場地ID保存的評論、預訂與使用行為因此不會移到其他場地。
+    名稱與地址完全相同的重複列依出現順序區分。
+
+    Returns:
+        int64 陣列
+    """
+    cols = [c for c in ("name", "address") if c in df.columns]
+    keys = df[cols].astype(str)
+    keys["occurrence"] = keys.groupby(cols, sort=False).cumcount().astype(str) if cols else np.arange(len(df)).astype(str)
+    h = _stable_hash(keys, list(keys.columns), "venue_id")
+    ids = (h % np.uint64((1 << 53) - 1)).astype(np.int64) + 1
+    if len(np.unique(ids)) != len(ids):
+        raise ValueError("場地ID雜湊碰撞，請在來源 CSV 提供 id 欄位")
+    return ids
+
+
+def synthesize_ratings(df: pd.DataFrame) -> pd.Series:
+    """
+    為缺少評分的場地產生評分（3.5 ~ 5.0，一位小數）
+
+    以場地名稱與地址作為種子，同一場地在任何 worker、任何重新編譯下都得到相同結果；
+    已有的評分保持不變。
+    """
+    synthetic = np.round(3.5 + 1.5 * stable_unit_hash(df, ["name", "address"], "rating"), 1)
+    if "rating" in df.columns:
+        existing = pd.to_numeric(df["rating"], errors="coerce")
+        return existing.fillna(pd.Series(synthetic, index=df.index)).astype("float64")
+    return pd.Series(synthetic, index=df.index, dtype="float64")
+
+
+def synthesize_coordinates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    為缺少座標的場地產生近似座標（所屬行政區中心 ±0.01 度內）
+
+    以場地名稱與地址作為種子，一次計算所有場地，同一場地在任何 worker、任何重新編譯下
+    都落在相同位置；已有座標的場地保持不變。
+
+    Returns:
+        latitude、longitude 兩欄（float64）的 DataFrame
+    """
+    from utils.map_utils import MapUtils
+
+    map_utils = MapUtils()
+    default = map_utils.district_centers["台北市中心"]
+    districts = df["district"] if "district" in df.columns else pd.Series(None, index=df.index, dtype=object)
+    # 每個行政區只查一次中心座標；代碼 -1（缺值）對應到表尾的預設中心
+    codes, uniques = pd.factorize(districts.astype(object))
+    table = np.array([map_utils.district_centers.get(d, default) for d in uniques] + [default], dtype=float)
+    center_lat, center_lon = table[codes, 0], table[codes, 1]
+
+    bounds = map_utils.taipei_bounds
+    spread = COORDINATE_SPREAD_DEG
+    lat = center_lat + spread * (2 * stable_unit_hash(df, ["name", "address"], "latitude") - 1)
+    lon = center_lon + spread * (2 * stable_unit_hash(df, ["name", "address"], "longitude") - 1)
+    lat = np.clip(lat, bounds["south"], bounds["north"])
+    lon = np.clip(lon, bounds["west"], bounds["east"])
+
+    coords = pd.DataFrame({"latitude": lat, "longitude": lon}, index=df.index)
+    if {"latitude", "longitude"} <= set(df.columns):
+        existing = df[["latitude", "longitude"]].apply(pd.to_numeric, errors="coerce")
+        # 經緯度都有的場地沿用來源座標
+        known = existing.notna().all(axis=1)
+        coords.loc[known] = existing.loc[known]
+    return coords.astype("float64")
+
+
+def classify_outdoor(df: pd.DataFrame) -> np.ndarray:
+    """
+    判斷各場地是否為戶外場地（受天氣影響）
+
+    Returns:
+        int8 陣列，1 為戶外、0 為室內或無法判斷
+    """
+    cols = [c for c in VENUE_TYPE_COLUMNS if c in df.columns]
+    if not cols or df.empty:
+        return np.zeros(len(df), dtype=np.int8)
+    text = df[cols].astype(object).where(df[cols].notna(), "").astype(str).agg(" ".join, axis=1)
+    outdoor = text.str.contains(OUTDOOR_PATTERN, case=False, regex=True)
+    indoor = text.str.contains(INDOOR_PATTERN, case=False, regex=True)
+    return (outdoor & ~indoor).to_numpy().astype(np.int8)
+
+
+def _normalize_header(col) -> str:
+    """取欄名第一行並去除 pandas 重複欄名的 .1 / .2 後綴"""
+    key = str(col).split("\n")[0].strip()
+    return re.sub(r"\.\d+$", "", key)
+
+
+def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """統一欄位名稱；對應到同一欄位者依序合併（前者優先）"""
+    merged: Dict[str, pd.Series] = {}
+    for col in df.columns:
+        key = _normalize_header(col)
+        target = COLUMN_MAP.get(key, key)
+        if target in merged:
+            merged[target] = merged[target].fillna(df[col])
+        else:
+            merged[target] = df[col]
+    return pd.DataFrame(merged)
+
+
+def _parse_price(series: pd.Series) -> pd.Series:
+    """
+    將價格欄位轉為數值
+
+    純數字直接轉換；「0-200/次」、「500以上/次」等區間文字取其中數字的平均。
+    """
+    numeric = pd.to_numeric(series, errors="coerce")
+    text = series[numeric.isna() & series.notna()].astype(str)
+    if not text.empty:
+        numbers = text.str.extractall(r"(\d+(?:\.\d+)?)")[0].astype(float)
+        numeric.loc[numbers.index.get_level_values(0).unique()] = numbers.groupby(level=0).mean()
+    return numeric.astype("float64")
+
+
+def read_source_csv(csv_path: Path) -> pd.DataFrame:
+    """
+    讀取來源 CSV 並正規化為場地資料表
+
+    Args:
+        csv_path: 來源 CSV 路徑
+
+    Returns:
+        欄位名稱、型別皆已正規化的 DataFrame
+    """
+    # 以 utf-8-sig 讀檔（避免中文亂碼）
+    df = _normalize_columns(pd.read_csv(csv_path, encoding="utf-8-sig"))
+
+    # 部分試算表匯出時第一列是說明、第二列才是欄名
+    if "name" not in df.columns:
+        alt = _normalize_columns(pd.read_csv(csv_path, encoding="utf-8-sig", header=1))
+        if "name" in alt.columns:
+            df = alt
+
+    if "name" in df.columns:
+        df = df[df["name"].notna()].reset_index(drop=True)
+
+    # 文字欄位去除前後空白
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype("object").where(df[col].notna(), None)
+            df[col] = df[col].map(lambda v: v.strip() if isinstance(v, str) else v)
+
+    # 補充必要欄位
+    if "id" not in df.columns:
+        # 不以列序編號：列序會隨來源檔增刪而改變，已保存的評論與預訂會對應到錯誤的場地
+        df["id"] = stable_venue_ids(df)
+    # 評分：保留來源資料，缺值以穩定種子補齊，並隨編譯結果一起保存
+    df["rating"] = synthesize_ratings(df)
+
+    if "price_per_hour" in df.columns:
+        df["price_per_hour"] = _parse_price(df["price_per_hour"])
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns and col != "price_per_hour":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+
+    # 座標：優先使用地理編碼快取（python -m utils.geocoder），其餘以穩定種子補齊，並隨編譯結果一起保存
+    if "address" in df.columns:
+        geocoded = cached_coordinates(df["address"])
+        for col in ("latitude", "longitude"):
+            df[col] = df[col].fillna(geocoded[col]) if col in df.columns else geocoded[col]
+    coords = synthesize_coordinates(df)
+    df["latitude"], df["longitude"] = coords["latitude"], coords["longitude"]
+
+    # 室內／戶外分類，供推薦引擎的天氣排序使用
+    df["is_outdoor"] = classify_outdoor(df)
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+def _safe_filename(index: int) -> str:
+    # 欄名可能含中文或斜線，檔名一律以欄位序號命名
+    return f"col{index:03d}"
+
+
+def write_store(df: pd.DataFrame, store_path: Path, source_hash: str, source_name: str) -> Path:
+    """
+    將 DataFrame 寫成欄式檔案組
+
+    先寫入暫存目錄再整批改名，其他 worker 不會讀到寫到一半的結果。
+
+    Args:
+        df: 已正規化的場地資料
+        store_path: 目標目錄
+        source_hash: 來源檔內容雜湊
+        source_name: 來源檔名（僅供記錄）
+
+    Returns:
+        實際的儲存目錄
+    """
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=store_path.name + ".", dir=store_path.parent))
+
+    columns: List[Dict] = []
+    try:
+        for i, col in enumerate(df.columns):
+            series = df[col]
+            fname = _safe_filename(i)
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes = series.cat.codes.to_numpy()
+                np.save(tmp_dir / f"{fname}.npy", codes)
+                columns.append({
+                    "name": col, "kind": "category", "file": f"{fname}.npy",
+                    "categories": [str(c) for c in series.cat.categories],
+                })
+            elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                np.save(tmp_dir / f"{fname}.npy", series.to_numpy())
+                columns.append({"name": col, "kind": "numeric", "file": f"{fname}.npy"})
+            else:
+                # 文字欄位以字典編碼儲存：代碼可 memory-map，字典另存 JSON
+                codes, uniques = pd.factorize(series, use_na_sentinel=True)
+                np.save(tmp_dir / f"{fname}.npy", codes.astype(np.int32))
+                with open(tmp_dir / f"{fname}.json", "w", encoding="utf-8") as f:
+                    json.dump([str(u) for u in uniques], f, ensure_ascii=False)
+                columns.append({
+                    "name": col, "kind": "text", "file": f"{fname}.npy", "values": f"{fname}.json",
+                })
+
+        manifest = {
+            "store_version": STORE_VERSION,
+            "source_sha256": source_hash,
+            "source_name": source_name,
+            "n_rows": int(len(df)),
+            "columns": columns,
+        }
+        with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        try:
+            os.rename(tmp_dir, store_path)
+        except OSError:
+            # 其他 worker 已先完成同一版本的編譯
+            if not (store_path / MANIFEST_NAME).exists():
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return store_path
+
+
+def read_store(store_path: Path) -> pd.DataFrame:
+    """
+    以 memory-map 開啟已編譯的欄式檔案組
+
+    數值欄與類別代碼直接對應到檔案頁面，不複製到行程記憶體；
+    文字欄僅解碼字典一次。所有欄位陣列皆為唯讀，可安全地在 session 之間共用。
+
+    Args:
+        store_path: 編譯結果目錄
+
+    Returns:
+        場地資料 DataFrame
+    """
+    with open(store_path / MANIFEST_NAME, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    data = {}
+    for col in manifest["columns"]:
+        arr = np.load(store_path / col["file"], mmap_mode="r")
+        if col["kind"] == "category":
+            data[col["name"]] = pd.Categorical.from_codes(arr, categories=col["categories"])
+        elif col["kind"] == "numeric":
+            data[col["name"]] = arr
+        else:
+            with open(store_path / col["values"], encoding="utf-8") as f:
+                uniques = json.load(f)
+            # 代碼 -1 代表缺值，對應到字典尾端的 None
+            lookup = np.array(uniques + [None], dtype=object)
+            values = lookup[arr]
+            # 與 memory-map 的數值欄一致設為唯讀
+            values.flags.writeable = False
+            data[col["name"]] = values
+
+    return pd.DataFrame(data, copy=False)
+
+
+def store_path_for(source_hash: str, store_dir: Path = DEFAULT_STORE_DIR) -> Path:
+    """依來源雜湊與格式版本決定編譯結果目錄"""
+    return Path(store_dir) / f"v{STORE_VERSION}-{source_hash[:16]}"
+
+
+def remove_stale_stores(store_dir: Path = DEFAULT_STORE_DIR, keep: Optional[Path] = None):
+    """
+    刪除不再使用的編譯結果
+
+    其他儲存格式版本的目錄一律刪除（格式版本變更後已不會再被讀取）；
+    指定 keep 時，目前格式版本中 keep 以外的舊內容版本也一併刪除。
+    已映射到記憶體的舊檔案在映射關閉前仍可讀取，使用舊快照的 session 不受影響。
+
+    Args:
+        store_dir: 編譯結果的根目錄
+        keep: 目前使用中的編譯結果目錄
+    """
+    store_dir = Path(store_dir)
+    if not store_dir.is_dir():
+        return
+    prefix = f"v{STORE_VERSION}-"
+    keep_name = Path(keep).name if keep is not None else None
+    for path in store_dir.iterdir():
+        if not path.is_dir() or not re.match(r"v\d+-", path.name) or path.name == keep_name:
+            continue
+        if keep_name is not None or not path.name.startswith(prefix):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def compile_venue_store(csv_path: Path = DEFAULT_CSV_PATH,
+                        store_dir: Path = DEFAULT_STORE_DIR,
+                        force: bool = False) -> Path:
+    """
+    編譯來源 CSV；同一內容雜湊已編譯過則直接回傳既有目錄
+
+    Args:
+        csv_path: 來源 CSV 路徑
+        store_dir: 編譯結果的根目錄
+        force: 是否忽略既有結果強制重建
+
+    Returns:
+        編譯結果目錄
+    """
+    csv_path = Path(csv_path)
+    source_hash = source_fingerprint(csv_path)
+    store_path = store_path_for(source_hash, store_dir)
+
+    if (store_path / MANIFEST_NAME).exists():
+        if not force:
+            return store_path
+        shutil.rmtree(store_path, ignore_errors=True)
+
+    df = read_source_csv(csv_path)
+    store_path = write_store(df, store_path, source_hash, csv_path.name)
+    remove_stale_stores(store_dir)
+    return store_path
+
+
+def open_venue_store(csv_path: Path = DEFAULT_CSV_PATH,
+                     store_dir: Path = DEFAULT_STORE_DIR) -> pd.DataFrame:
+    """
+    開啟來源 CSV 對應的編譯結果，必要時先編譯
+
+    Args:
+        csv_path: 來源 CSV 路徑
+        store_dir: 編譯結果的根目錄
+
+    Returns:
+        場地資料 DataFrame
+    """
+    return read_store(compile_venue_store(csv_path, store_dir))
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    src = Path(args[0]) if args else DEFAULT_CSV_PATH
+    out = compile_venue_store(src, force="--force" in sys.argv)
+    print(f"✅ 已編譯 {src.name} → {out}")
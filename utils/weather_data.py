@@ -0,0 +1,431 @@
+# utils/weather_data.py
+"""
+天氣預報資料的解析與精簡儲存
+
+中央氣象署的鄉鎮預報 JSON 約 1.5 MB，絕大部分是重複的鍵名與時間字串。
+解析時在 json 的 object_pairs_hook 中逐一處理每個天氣元素：
+元素物件一完成解碼，其時間序列就立即轉為 NumPy 陣列
+（epoch 秒 + float32 數值，文字值以類別代碼保存），原始的 dict/list 隨即釋放，
+臺北市以外的縣市整組丟棄，因此完整的原始樹狀結構從未同時存在於記憶體中。
+"""
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, IO, List, Optional, Tuple
+import json
+import re
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_WEATHER_JSON = BASE_DIR / "attached_assets" / "response_1757912291602_1757930584417.json"
+DEFAULT_CITY = "臺北市"
+
+# 數值欄位中的第一個數字（如 ">= 11" → 11）
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+# 以文字保存（類別代碼）的值欄位
+TEXT_VALUE_KEYS = {"Weather", "WeatherDescription", "WindDirection", "ComfortIndexDescription"}
+
+
+@lru_cache(maxsize=4096)
+def _to_epoch(text: Optional[str]) -> Optional[int]:
+    # 各元素、各行政區的時間字串大量重複，快取解析結果
+    if not text:
+        return None
+    return int(datetime.fromisoformat(text).timestamp())
+
+
+def _to_float(text) -> float:
+    if text is None:
+        return np.nan
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        pass
+    m = _NUMBER.search(str(text))
+    return float(m.group()) if m else np.nan
+
+
+class ElementSeries:
+    """
+    單一天氣元素的時間序列
+
+    Attributes:
+        name: 元素名稱（如「溫度」）
+        times: 各資料點的時間（epoch 秒，int64）；區間型元素為開始時間
+        end_times: 區間型元素的結束時間，時間點型元素為 None
+        values: {值欄位: float32 陣列}
+        texts: {值欄位: (int16 代碼陣列, 文字列表)}
+    """
+
+    __slots__ = ("name", "times", "end_times", "values", "texts", "_midpoints")
+
+    def __init__(self, name: str, times: np.ndarray, end_times: Optional[np.ndarray],
+                 values: Dict[str, np.ndarray], texts: Dict[str, Tuple[np.ndarray, List[str]]]):
+        self.name = name
+        self.times = times
+        self.end_times = end_times
+        self.values = values
+        self.texts = texts
+        # 相鄰資料點的中點；最接近時間的查詢即為對中點做二分搜尋
+        self._midpoints = (times[:-1] + times[1:]) // 2
+
+    @classmethod
+    def from_raw(cls, name: str, time_points: List[Dict[str, Any]]) -> "ElementSeries":
+        """
+        由 API 的 Time 列表建立
+
+        Args:
+            name: 元素名稱
+            time_points: [{"DataTime" 或 "StartTime"/"EndTime", "ElementValue": [{...}]}, ...]
+        """
+        n = len(time_points)
+        times = np.empty(n, dtype=np.int64)
+        has_end = n > 0 and "EndTime" in time_points[0]
+        end_times = np.empty(n, dtype=np.int64) if has_end else None
+
+        raw_values: Dict[str, List] = {}
+        for i, point in enumerate(time_points):
+            times[i] = _to_epoch(point.get("DataTime") or point.get("StartTime"))
+            if has_end:
+                end_times[i] = _to_epoch(point.get("EndTime"))
+            element_values = point.get("ElementValue") or [{}]
+            for key, value in element_values[0].items():
+                raw_values.setdefault(key, [None] * n)[i] = value
+
+        values: Dict[str, np.ndarray] = {}
+        texts: Dict[str, Tuple[np.ndarray, List[str]]] = {}
+        for key, column in raw_values.items():
+            if key in TEXT_VALUE_KEYS:
+                labels: Dict[str, int] = {}
+                codes = np.array(
+                    [-1 if v is None else labels.setdefault(v, len(labels)) for v in column],
+                    dtype=np.int16,
+                )
+                texts[key] = (codes, list(labels))
+            else:
+                values[key] = np.array([_to_float(v) for v in column], dtype=np.float32)
+
+        # API 依時間排序，但不依賴這一點
+        order = np.argsort(times, kind="stable")
+        if np.any(order != np.arange(n)):
+            times = times[order]
+            if end_times is not None:
+                end_times = end_times[order]
+            values = {k: v[order] for k, v in values.items()}
+            texts = {k: (c[order], labels) for k, (c, labels) in texts.items()}
+
+        return cls(name, times, end_times, values, texts)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def index_at(self, t):
+        """
+        指定時間所對應的資料點位置
+
+        時間點型元素取最接近的資料點（等距時取較早者）；
+        區間型元素取包含該時間的區間，超出範圍時取最近的第一個或最後一個區間。
+
+        Args:
+            t: 時間（epoch 秒），可為純量或陣列
+
+        Returns:
+            位置（與 t 相同形狀）
+        """
+        if self.end_times is not None:
+            i = np.searchsorted(self.times, t, side="right") - 1
+            return np.clip(i, 0, len(self.times) - 1)
+        return np.searchsorted(self._midpoints, t, side="left")
+
+    def value(self, key: str, i: int):
+        """第 i 個資料點的值（數值為 float，文字為 str，缺值為 None）"""
+        if key in self.values:
+            v = self.values[key][i]
+            return None if np.isnan(v) else float(v)
+        if key in self.texts:
+            codes, labels = self.texts[key]
+            code = codes[i]
+            return None if code < 0 else labels[code]
+        return None
+
+    def nbytes(self) -> int:
+        total = self.times.nbytes + (0 if self.end_times is None else self.end_times.nbytes)
+        total += sum(v.nbytes for v in self.values.values())
+        total += sum(c.nbytes for c, _ in self.texts.values())
+        return total
+
+
+class DistrictWeather:
+    """
+    單一行政區的預報資料
+    """
+
+    __slots__ = ("name", "geocode", "latitude", "longitude", "elements", "_grids")
+
+    def __init__(self, name: str, geocode: Optional[str], latitude: Optional[float],
+                 longitude: Optional[float], elements: Dict[str, ElementSeries]):
+        self.name = name
+        self.geocode = geocode
+        self.latitude = latitude
+        self.longitude = longitude
+        self.elements = elements
+
+        # 時間軸相同的元素共用一次二分搜尋（逐時與每 3 小時兩組）
+        grids: Dict[tuple, List[ElementSeries]] = {}
+        for series in elements.values():
+            if len(series):
+                key = (series.times.tobytes(), series.end_times is not None)
+                grids.setdefault(key, []).append(series)
+        self._grids: List[List[ElementSeries]] = list(grids.values())
+
+    def values_at(self, t) -> Dict[str, Any]:
+        """
+        一次取得所有天氣元素在指定時間的值
+
+        Args:
+            t: 時間（epoch 秒），可為純量或陣列
+
+        Returns:
+            {值欄位: 值}；t 為純量時值為 float/str/None，
+            t 為陣列時數值欄位為 float32 陣列（缺值為 NaN），文字欄位為 object 陣列（缺值為 None）
+        """
+        scalar = np.ndim(t) == 0
+        result: Dict[str, Any] = {}
+        for group in self._grids:
+            idx = group[0].index_at(t)
+            for series in group:
+                for key, arr in series.values.items():
+                    v = arr[idx]
+                    result[key] = (None if np.isnan(v) else float(v)) if scalar else v
+                for key, (codes, labels) in series.texts.items():
+                    code = codes[idx]
+                    if scalar:
+                        result[key] = None if code < 0 else labels[code]
+                    else:
+                        lookup = np.array(labels + [None], dtype=object)
+                        result[key] = lookup[code]
+        return result
+
+
+def _make_hook(city: str):
+    """
+    建立 object_pairs_hook
+
+    json 以由內而外的順序呼叫 hook：天氣元素 → 行政區 → 縣市，
+    每一層在完成時就轉成精簡結構，不需要保留下層的原始 dict。
+    """
+    def hook(pairs):
+        obj = dict(pairs)
+        if "ElementName" in obj and "Time" in obj:
+            return ElementSeries.from_raw(obj["ElementName"], obj["Time"])
+        if "LocationName" in obj and "WeatherElement" in obj:
+            return DistrictWeather(
+                name=obj["LocationName"],
+                geocode=obj.get("Geocode"),
+                latitude=_to_float(obj.get("Latitude")),
+                longitude=_to_float(obj.get("Longitude")),
+                elements={e.name: e for e in obj["WeatherElement"] if isinstance(e, ElementSeries)},
+            )
+        if "LocationsName" in obj and "Location" in obj:
+            if obj["LocationsName"] != city:
+                return None
+            return {"LocationsName": city, "Location": obj["Location"]}
+        if "resource_id" in obj and "fields" in obj:
+            # API 欄位說明，用不到
+            return None
+        return obj
+    return hook
+
+
+def parse_weather_payload(fp: IO, city: str = DEFAULT_CITY) -> Dict[str, DistrictWeather]:
+    """
+    解析預報 JSON
+
+    Args:
+        fp: 已開啟的 JSON 檔案（或任何有 read() 的物件）
+        city: 要保留的縣市
+
+    Returns:
+        {行政區名稱: DistrictWeather}
+    """
+    payload = json.load(fp, object_pairs_hook=_make_hook(city))
+    districts: Dict[str, DistrictWeather] = {}
+    for group in (payload.get("records") or {}).get("Locations") or []:
+        if not group:
+            continue
+        for district in group.get("Location", []):
+            if isinstance(district, DistrictWeather):
+                districts[district.name] = district
+    return districts
+
+
+def load_weather_file(path: Path = DEFAULT_WEATHER_JSON, city: str = DEFAULT_CITY) -> Dict[str, DistrictWeather]:
+    """
+    讀取預報 JSON 檔案
+
+    Args:
+        path: 檔案路徑
+        city: 要保留的縣市
+
+    Returns:
+        {行政區名稱: DistrictWeather}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_weather_payload(f, city)
+
+
+class ForecastMatrix:
+    """
+    各行政區逐時預報的密集矩陣
+
+    data[d, h, e] 為第 d 個行政區、第 h 個整點、第 e 個數值欄位的值（float32，缺值為 NaN）。
+    逐 3 小時的元素展開到逐時格點：時間點型元素取最接近的資料點，區間型元素取包含該時間的區間；
+    超出元素涵蓋範圍的格點為 NaN。
+    """
+
+    # 時間點型元素距離最近資料點超過此秒數即視為缺值
+    MAX_GAP = 90 * 60
+
+    def __init__(self, districts: List[str], times: np.ndarray, elements: List[str], data: np.ndarray):
+        """
+        Args:
+            districts: 行政區名稱（第 0 軸）
+            times: 整點時間（epoch 秒，第 1 軸）
+            elements: 數值欄位名稱（第 2 軸，如 Temperature）
+            data: 形狀為 (行政區, 時間, 欄位) 的 float32 陣列
+        """
+        self.districts = districts
+        self.times = times
+        self.elements = elements
+        self.data = data
+        self.district_index = {name: i for i, name in enumerate(districts)}
+        self.element_index = {name: i for i, name in enumerate(elements)}
+
+    @classmethod
+    def empty(cls) -> "ForecastMatrix":
+        return cls([], np.empty(0, dtype=np.int64), [], np.empty((0, 0, 0), dtype=np.float32))
+
+    @classmethod
+    def from_districts(cls, districts: Dict[str, DistrictWeather], step: int = 3600) -> "ForecastMatrix":
+        """
+        由解析好的行政區資料建立
+
+        Args:
+            districts: {行政區名稱: DistrictWeather}
+            step: 格點間隔秒數
+
+        Returns:
+            ForecastMatrix
+        """
+        names = list(districts)
+        all_series = [s for d in districts.values() for s in d.elements.values() if len(s)]
+        if not all_series:
+            return cls.empty()
+
+        start = min(int(s.times[0]) for s in all_series)
+        # 時間點型元素含最後一點，區間型元素不含最後區間的結束時間
+        stop = max(int(s.end_times[-1]) if s.end_times is not None else int(s.times[-1]) + 1 for s in all_series)
+        times = np.arange(start, stop, step, dtype=np.int64)
+
+        elements: List[str] = []
+        for s in all_series:
+            for key in s.values:
+                if key not in elements:
+                    elements.append(key)
+        element_index = {k: i for i, k in enumerate(elements)}
+
+        data = np.full((len(names), len(times), len(elements)), np.nan, dtype=np.float32)
+        for d, name in enumerate(names):
+            for series in districts[name].elements.values():
+                if not len(series) or not series.values:
+                    continue
+                idx = series.index_at(times)
+                if series.end_times is not None:
+                    valid = (times >= series.times[idx]) & (times < series.end_times[idx])
+                else:
+                    valid = np.abs(series.times[idx] - times) <= cls.MAX_GAP
+                for key, arr in series.values.items():
+                    data[d, :, element_index[key]] = np.where(valid, arr[idx], np.nan)
+
+        return cls(names, times, elements, data)
+
+    def _time_slice(self, start=None, end=None) -> slice:
+        lo = 0 if start is None else int(np.searchsorted(self.times, _epoch(start), side="left"))
+        hi = len(self.times) if end is None else int(np.searchsorted(self.times, _epoch(end), side="right"))
+        return slice(lo, hi)
+
+    def window(self, start=None, end=None, elements: Optional[List[str]] = None,
+               districts: Optional[List[str]] = None) -> "ForecastMatrix":
+        """
+        取出時間區間（含端點）與指定欄位、行政區的子矩陣
+
+        Args:
+            start: 開始時間（datetime 或 epoch 秒），None 表示不限
+            end: 結束時間，None 表示不限
+            elements: 欄位名稱，None 表示全部
+            districts: 行政區名稱，None 表示全部
+
+        Returns:
+            新的 ForecastMatrix（資料為切片檢視，不複製）
+        """
+        t = self._time_slice(start, end)
+        d_names = self.districts if districts is None else [n for n in districts if n in self.district_index]
+        e_names = self.elements if elements is None else [n for n in elements if n in self.element_index]
+        data = self.data[:, t, :]
+        if districts is not None:
+            data = data[[self.district_index[n] for n in d_names]]
+        if elements is not None:
+            data = data[:, :, [self.element_index[n] for n in e_names]]
+        return ForecastMatrix(d_names, self.times[t], e_names, data)
+
+    def element(self, name: str) -> np.ndarray:
+        """單一欄位的 (行政區, 時間) 矩陣；欄位不存在時全為 NaN"""
+        e = self.element_index.get(name)
+        if e is None:
+            return np.full(self.data.shape[:2], np.nan, dtype=np.float32)
+        return self.data[:, :, e]
+
+    def reduce(self, name: str, start=None, end=None, how: str = "max") -> np.ndarray:
+        """
+        各行政區在時間區間內的彙總值
+
+        Args:
+            name: 欄位名稱
+            start: 開始時間
+            end: 結束時間
+            how: max、min 或 mean（忽略缺值）
+
+        Returns:
+            依 districts 順序的 float 陣列；區間內沒有資料的行政區為 NaN
+        """
+        values = self.element(name)[:, self._time_slice(start, end)]
+        out = np.full(len(self.districts), np.nan)
+        has = ~np.all(np.isnan(values), axis=1) if values.size else np.zeros(len(self.districts), dtype=bool)
+        if has.any():
+            func = {"max": np.nanmax, "min": np.nanmin, "mean": np.nanmean}[how]
+            out[has] = func(values[has], axis=1)
+        return out
+
+    def to_frame(self) -> "pd.DataFrame":
+        """
+        轉為整齊格式的 DataFrame：每列為一個行政區的一個整點，每個欄位一欄
+
+        Returns:
+            欄位為 district、time（臺北時間）與各數值欄位的 DataFrame
+        """
+        import pandas as pd
+
+        n_d, n_t = len(self.districts), len(self.times)
+        frame = pd.DataFrame(self.data.reshape(n_d * n_t, len(self.elements)), columns=self.elements)
+        frame.insert(0, "time", pd.to_datetime(np.tile(self.times, n_d), unit="s", utc=True).tz_convert("Asia/Taipei"))
+        frame.insert(0, "district", pd.Categorical.from_codes(np.repeat(np.arange(n_d), n_t), self.districts))
+        return frame
+
+
+def _epoch(value) -> int:
+    """datetime 或 epoch 秒轉為 epoch 秒"""
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
@@ -1,92 +1,87 @@
-import json
 import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime
 from typing import Dict, Any, Optional, List
-import os
+import threading
+import time
+
+from utils.weather_data import DistrictWeather, ElementSeries, ForecastMatrix
+from utils.weather_repository import WeatherRepository, get_weather_repository
+
+# 目前天氣各欄位的來源：(欄位, 天氣元素, 值欄位)
+CURRENT_WEATHER_FIELDS = [
+    ('temperature', '溫度', 'Temperature'),
+    ('apparent_temperature', '體感溫度', 'ApparentTemperature'),
+    ('humidity', '相對濕度', 'RelativeHumidity'),
+    ('wind_direction', '風向', 'WindDirection'),
+    ('wind_speed', '風速', 'BeaufortScale'),
+    ('precipitation_probability', '3小時降雨機率', 'ProbabilityOfPrecipitation'),
+    ('weather_description', '天氣現象', 'Weather'),
+    ('comfort_index', '舒適度指數', 'ComfortIndexDescription'),
+]
 
 class WeatherManager:
     """
     天氣資料管理類別，負責處理台北市天氣API資料
     """
     
-    def __init__(self):
-        self.weather_data = None
-        self.districts_weather = {}
-        self._load_weather_data()
+    def __init__(self, repository: Optional[WeatherRepository] = None):
+        """
+        Args:
+            repository: 天氣資料快取，預設使用行程共用的實例
+        """
+        # 所有 session 共用同一份解析好的快照；實例本身不保存資料
+        self._repository = repository or get_weather_repository()
     
-    def _load_weather_data(self):
-        """載入天氣API JSON資料"""
-        try:
-            json_path = "attached_assets/response_1757912291602_1757930584417.json"
-            
-            if not os.path.exists(json_path):
-                print(f"天氣資料檔案不存在: {json_path}")
-                return
-            
-            with open(json_path, 'r', encoding='utf-8') as f:
-                self.weather_data = json.load(f)
-            
-            # 解析各區域天氣資料
-            self._parse_weather_data()
-            print("成功載入台北市天氣資料")
-            
-        except Exception as e:
-            print(f"載入天氣資料時發生錯誤: {e}")
+    @property
+    def districts_weather(self) -> Dict[str, DistrictWeather]:
+        """{行政區: DistrictWeather}（目前快照；過期時於背景更新）"""
+        return self._repository.current().districts
     
-    def _parse_weather_data(self):
-        """解析天氣資料"""
-        if not self.weather_data:
-            return
-        
-        try:
-            locations = self.weather_data.get('records', {}).get('Locations', [])
-            
-            for location_group in locations:
-                if location_group.get('LocationsName') == '臺北市':
-                    for location in location_group.get('Location', []):
-                        district_name = location.get('LocationName')
-                        
-                        # 解析各種天氣元素
-                        weather_elements = {}
-                        for element in location.get('WeatherElement', []):
-                            element_name = element.get('ElementName')
-                            element_data = element.get('Time', [])
-                            
-                            weather_elements[element_name] = element_data
-                        
-                        self.districts_weather[district_name] = {
-                            'location_name': district_name,
-                            'geocode': location.get('Geocode'),
-                            'latitude': location.get('Latitude'),
-                            'longitude': location.get('Longitude'),
-                            'weather_elements': weather_elements
-                        }
-            
-        except Exception as e:
-            print(f"解析天氣資料時發生錯誤: {e}")
+    def refresh(self, wait: bool = False):
+        """向資料來源重新取得天氣資料"""
+        return self._repository.refresh(wait=wait)
     
-    def _get_current_time_data(self, time_data: List[Dict], current_time: datetime) -> Optional[Dict]:
-        """獲取最接近當前時間的資料"""
-        if not time_data:
+    def _get_current_time_data(self, series: ElementSeries, current_time: float) -> Optional[int]:
+        """
+        獲取最接近指定時間的資料點位置（二分搜尋）
+
+        Args:
+            series: 天氣元素時間序列
+            current_time: 時間（epoch 秒）
+
+        Returns:
+            資料點位置；沒有資料時回傳 None
+        """
+        if series is None or len(series) == 0:
             return None
-        
-        closest_data = None
-        min_time_diff = float('inf')
-        
-        for data_point in time_data:
-            try:
-                data_time_str = data_point.get('DataTime', '')
-                data_time = datetime.fromisoformat(data_time_str.replace('+08:00', ''))
-                
-                time_diff = abs((current_time - data_time).total_seconds())
-                
-                if time_diff < min_time_diff:
-                    min_time_diff = time_diff
-                    closest_data = data_point
-            except:
-                continue
-        
-        return closest_data
+        return int(series.index_at(int(current_time)))
+    
+    def _resolve_district(self, district: str) -> Optional[str]:
+        """找不到指定地區時使用第一個可用的地區"""
+        if district in self.districts_weather:
+            return district
+        return next(iter(self.districts_weather), None)
+    
+    def get_weather_at(self, district: str = '中正區', when=None) -> Dict[str, Any]:
+        """
+        一次取得指定地區在某時間的所有天氣元素
+
+        Args:
+            district: 地區名稱
+            when: 時間（datetime、epoch 秒或其陣列），None 表示現在
+
+        Returns:
+            {值欄位（如 Temperature、Weather）: 值}；沒有資料時回傳空 dict
+        """
+        district = self._resolve_district(district)
+        if district is None:
+            return {}
+        if when is None:
+            when = time.time()
+        elif isinstance(when, datetime):
+            when = when.timestamp()
+        return self.districts_weather[district].values_at(np.asarray(when, dtype=np.int64))
     
     def get_current_weather(self, district: str = '中正區') -> Dict[str, Any]:
         """
@@ -98,101 +93,35 @@ class WeatherManager:
         Returns:
             包含天氣資訊的字典
         """
-        if district not in self.districts_weather:
-            # 如果找不到指定地區，使用第一個可用的地區
-            available_districts = list(self.districts_weather.keys())
-            if available_districts:
-                district = available_districts[0]
-            else:
-                return self._get_default_weather()
+        district = self._resolve_district(district)
+        if district is None:
+            return self._get_default_weather()
         
-        district_data = self.districts_weather[district]
-        weather_elements = district_data['weather_elements']
-        current_time = datetime.now()
-        
-        weather_info = {
-            'district': district,
-            'temperature': 25,
-            'apparent_temperature': 27,
-            'humidity': 65,
-            'wind_direction': '東北風',
-            'wind_speed': 3,
-            'precipitation_probability': 10,
-            'weather_description': '晴朗',
-            'comfort_index': '舒適',
-            'update_time': current_time.strftime('%H:%M')
-        }
+        weather_info = self._get_default_weather()
+        weather_info['district'] = district
         
         try:
-            # 獲取溫度
-            if '溫度' in weather_elements:
-                temp_data = self._get_current_time_data(weather_elements['溫度'], current_time)
-                if temp_data and temp_data.get('ElementValue'):
-                    temp_value = temp_data['ElementValue'][0].get('Temperature')
-                    if temp_value:
-                        weather_info['temperature'] = int(temp_value)
-            
-            # 獲取體感溫度
-            if '體感溫度' in weather_elements:
-                apparent_temp_data = self._get_current_time_data(weather_elements['體感溫度'], current_time)
-                if apparent_temp_data and apparent_temp_data.get('ElementValue'):
-                    apparent_temp_value = apparent_temp_data['ElementValue'][0].get('ApparentTemperature')
-                    if apparent_temp_value:
-                        weather_info['apparent_temperature'] = int(float(apparent_temp_value))
-            
-            # 獲取相對濕度
-            if '相對濕度' in weather_elements:
-                humidity_data = self._get_current_time_data(weather_elements['相對濕度'], current_time)
-                if humidity_data and humidity_data.get('ElementValue'):
-                    humidity_value = humidity_data['ElementValue'][0].get('RelativeHumidity')
-                    if humidity_value:
-                        weather_info['humidity'] = int(float(humidity_value))
-            
-            # 獲取風向
-            if '風向' in weather_elements:
-                wind_dir_data = self._get_current_time_data(weather_elements['風向'], current_time)
-                if wind_dir_data and wind_dir_data.get('ElementValue'):
-                    wind_dir_value = wind_dir_data['ElementValue'][0].get('WindDirection')
-                    if wind_dir_value:
-                        weather_info['wind_direction'] = self._convert_wind_direction(wind_dir_value)
-            
-            # 獲取風速
-            if '風速' in weather_elements:
-                wind_speed_data = self._get_current_time_data(weather_elements['風速'], current_time)
-                if wind_speed_data and wind_speed_data.get('ElementValue'):
-                    wind_speed_value = wind_speed_data['ElementValue'][0].get('BeaufortScale')
-                    if wind_speed_value:
-                        weather_info['wind_speed'] = int(float(wind_speed_value))
-            
-            # 獲取降雨機率
-            if '3小時降雨機率' in weather_elements:
-                precip_data = self._get_current_time_data(weather_elements['3小時降雨機率'], current_time)
-                if precip_data and precip_data.get('ElementValue'):
-                    precip_value = precip_data['ElementValue'][0].get('ProbabilityOfPrecipitation')
-                    if precip_value:
-                        weather_info['precipitation_probability'] = int(float(precip_value))
-            
-            # 獲取天氣現象
-            if '天氣現象' in weather_elements:
-                weather_data = self._get_current_time_data(weather_elements['天氣現象'], current_time)
-                if weather_data and weather_data.get('ElementValue'):
-                    weather_value = weather_data['ElementValue'][0].get('Weather')
-                    if weather_value:
-                        weather_info['weather_description'] = weather_value
-            
-            # 獲取舒適度指數
-            if '舒適度指數' in weather_elements:
-                comfort_data = self._get_current_time_data(weather_elements['舒適度指數'], current_time)
-                if comfort_data and comfort_data.get('ElementValue'):
-                    comfort_value = comfort_data['ElementValue'][0].get('ComfortIndexDescription')
-                    if comfort_value:
-                        weather_info['comfort_index'] = comfort_value
+            values = self.get_weather_at(district)
+            for field, _, value_key in CURRENT_WEATHER_FIELDS:
+                value = values.get(value_key)
+                if value is None:
+                    continue
+                if field == 'wind_direction':
+                    weather_info[field] = self._convert_wind_direction(value)
+                elif isinstance(value, float):
+                    weather_info[field] = int(value)
+                else:
+                    weather_info[field] = value
             
         except Exception as e:
             print(f"解析天氣資料時發生錯誤: {e}")
         
         return weather_info
     
+    def get_all_districts_weather(self) -> Dict[str, Dict[str, Any]]:
+        """獲取所有地區的當前天氣資訊"""
+        return {district: self.get_current_weather(district) for district in self.districts_weather}
+    
     def _convert_wind_direction(self, wind_direction: str) -> str:
         """轉換風向數值為中文描述"""
         try:
@@ -264,6 +193,70 @@ class WeatherManager:
         """獲取可用的地區列表"""
         return list(self.districts_weather.keys())
     
+    def get_forecast_matrix(self, start=None, end=None, elements: Optional[List[str]] = None,
+                            districts: Optional[List[str]] = None) -> ForecastMatrix:
+        """
+        獲取行政區 × 整點 × 欄位的預報矩陣
+        
+        Args:
+            start: 開始時間（datetime 或 epoch 秒），None 表示不限
+            end: 結束時間（含），None 表示不限
+            elements: 數值欄位（如 Temperature、ProbabilityOfPrecipitation），None 表示全部
+            districts: 地區名稱列表，None 表示全部
+            
+        Returns:
+            ForecastMatrix（.data 形狀為 (地區, 時間, 欄位)）
+        """
+        return self._repository.current().forecast.window(start, end, elements, districts)
+    
+    def get_forecast_frame(self, start=None, end=None, elements: Optional[List[str]] = None,
+                           districts: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        獲取整齊格式的預報表（每列為一個地區的一個整點）
+        
+        參數同 get_forecast_matrix。
+        """
+        return self.get_forecast_matrix(start, end, elements, districts).to_frame()
+    
+    def get_district_conditions(self, start, end) -> Dict[str, Any]:
+        """
+        各地區在時間區間內的最不利天氣條件（供排序使用）
+        
+        Args:
+            start: 開始時間
+            end: 結束時間（含）
+            
+        Returns:
+            {
+                'districts': 地區名稱列表,
+                'precipitation_probability': 各地區最大降雨機率（%，無資料為 NaN）,
+                'apparent_temperature': 各地區最高體感溫度（°C，無資料為 NaN）,
+            }
+        """
+        forecast = self._repository.current().forecast
+        return {
+            'districts': forecast.districts,
+            'precipitation_probability': forecast.reduce('ProbabilityOfPrecipitation', start, end, how='max'),
+            'apparent_temperature': forecast.reduce('ApparentTemperature', start, end, how='max'),
+        }
+    
+    def get_dry_districts(self, start, end, max_precipitation: float = 30) -> List[str]:
+        """
+        獲取時間區間內降雨機率都不超過門檻的地區
+        
+        Args:
+            start: 開始時間
+            end: 結束時間（含）
+            max_precipitation: 降雨機率上限（%）
+            
+        Returns:
+            地區名稱列表（依最大降雨機率由低到高）
+        """
+        forecast = self._repository.current().forecast
+        pop = forecast.reduce('ProbabilityOfPrecipitation', start, end, how='max')
+        order = np.argsort(pop, kind='stable')
+        return [forecast.districts[i] for i in order if pop[i] <= max_precipitation]
+    
     def get_hourly_forecast(self, district: str = '中正區', hours: int = 24) -> List[Dict[str, Any]]:
         """
         獲取指定地區的小時預報
@@ -275,35 +268,31 @@ class WeatherManager:
         Returns:
             小時預報列表
         """
-        if district not in self.districts_weather:
+        forecast = self._repository.current().forecast
+        if district not in forecast.district_index:
             return []
         
-        district_data = self.districts_weather[district]
-        weather_elements = district_data['weather_elements']
-        forecast_list = []
+        temps = forecast.element('Temperature')[forecast.district_index[district]]
+        keep = np.flatnonzero(~np.isnan(temps))[:hours]
+        local = pd.to_datetime(forecast.times[keep], unit='s', utc=True).tz_convert('Asia/Taipei')
         
-        try:
-            if '溫度' in weather_elements:
-                temp_data = weather_elements['溫度']
-                
-                for i, data_point in enumerate(temp_data[:hours]):
-                    time_str = data_point.get('DataTime', '')
-                    temp_value = data_point.get('ElementValue', [{}])[0].get('Temperature', '25')
-                    
-                    try:
-                        forecast_time = datetime.fromisoformat(time_str.replace('+08:00', ''))
-                        temp = int(temp_value)
-                        
-                        forecast_list.append({
-                            'time': forecast_time.strftime('%H:%M'),
-                            'date': forecast_time.strftime('%m/%d'),
-                            'temperature': temp,
-                            'hour': forecast_time.hour
-                        })
-                    except:
-                        continue
-            
-        except Exception as e:
-            print(f"獲取小時預報時發生錯誤: {e}")
-        
-        return forecast_list
\ No newline at end of file
+        return [
+            {'time': t, 'date': d, 'temperature': temp, 'hour': h}
+            for t, d, temp, h in zip(
+                local.strftime('%H:%M'), local.strftime('%m/%d'),
+                temps[keep].astype(int).tolist(), local.hour.tolist(),
+            )
+        ]
+
+
+_shared_manager = None
+_shared_lock = threading.Lock()
+
+def get_weather_manager() -> WeatherManager:
+    """取得行程共用的 WeatherManager（執行緒安全）"""
+    global _shared_manager
+    if _shared_manager is None:
+        with _shared_lock:
+            if _shared_manager is None:
+                _shared_manager = WeatherManager()
+    return _shared_manager
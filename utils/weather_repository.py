@@ -0,0 +1,289 @@
+# utils/weather_repository.py
+"""
+行程共用的天氣資料快取
+
+WeatherRepository 持有一份解析好的天氣快照，所有 session 共用。
+快照超過 TTL 後，下一次讀取仍立即回傳舊快照，同時在背景執行緒向資料來源更新
+（stale-while-revalidate），使用者的請求不會等待更新完成。
+
+資料來源可替換：本機檔案，或中央氣象署開放資料 API（測試時可指向 StubWeatherServer）。
+第一份快照一律由內附的本機檔案建立，使用者的第一個請求也不會等待網路。
+"""
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+import io
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from utils.weather_data import (
+    DEFAULT_CITY, DEFAULT_WEATHER_JSON, DistrictWeather, ForecastMatrix, parse_weather_payload,
+)
+
+# 快照有效秒數
+WEATHER_TTL = float(os.environ.get("WEATHER_TTL", "1800"))
+# 資料來源：file、http 或 stub
+WEATHER_PROVIDER = os.environ.get("WEATHER_PROVIDER", "file")
+# 中央氣象署臺北市鄉鎮預報（F-D0047-061）
+CWA_API_URL = os.environ.get(
+    "CWA_API_URL", "https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-D0047-061"
+)
+
+
+class WeatherProvider(ABC):
+    """
+    天氣資料來源
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def fetch(self) -> Dict[str, DistrictWeather]:
+        """
+        取得並解析最新的預報
+
+        Returns:
+            {行政區名稱: DistrictWeather}
+        """
+
+
+class FileWeatherProvider(WeatherProvider):
+    """
+    由本機 JSON 檔案讀取
+    """
+
+    name = "file"
+
+    def __init__(self, path: Path = DEFAULT_WEATHER_JSON, city: str = DEFAULT_CITY):
+        self.path = Path(path)
+        self.city = city
+
+    def fetch(self) -> Dict[str, DistrictWeather]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return parse_weather_payload(f, self.city)
+
+
+class HttpWeatherProvider(WeatherProvider):
+    """
+    由中央氣象署開放資料 API（或相同格式的端點）讀取
+    """
+
+    name = "http"
+
+    def __init__(self, url: str = CWA_API_URL, api_key: Optional[str] = None,
+                 city: str = DEFAULT_CITY, timeout: float = 10.0):
+        """
+        Args:
+            url: API 位址
+            api_key: 授權碼，預設讀取 CWA_API_KEY 環境變數
+            city: 要保留的縣市
+            timeout: 連線逾時秒數
+        """
+        self.url = url
+        self.api_key = api_key or os.environ.get("CWA_API_KEY", "")
+        self.city = city
+        self.timeout = timeout
+
+    def request_url(self) -> str:
+        params = {"format": "JSON"}
+        if self.api_key:
+            params["Authorization"] = self.api_key
+        sep = "&" if "?" in self.url else "?"
+        return f"{self.url}{sep}{urllib.parse.urlencode(params)}"
+
+    def fetch(self) -> Dict[str, DistrictWeather]:
+        with urllib.request.urlopen(self.request_url(), timeout=self.timeout) as resp:
+            text = io.TextIOWrapper(resp, encoding="utf-8")
+            return parse_weather_payload(text, self.city)
+
+
+class StubWeatherServer:
+    """
+    本機假氣象署 API，供不連外網時測試 HttpWeatherProvider 的請求與解析流程
+
+    用法：
+        with StubWeatherServer() as stub:
+            HttpWeatherProvider(stub.url).fetch()
+    """
+
+    def __init__(self, payload: Optional[dict] = None):
+        """
+        Args:
+            payload: API 格式的回應內容，None 表示回傳內附的範例檔
+        """
+        if payload is None:
+            self.body = Path(DEFAULT_WEATHER_JSON).read_bytes()
+        else:
+            self.body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(stub.body)))
+                self.end_headers()
+                self.wfile.write(stub.body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/rest/datastore/F-D0047-061"
+
+    def start(self) -> "StubWeatherServer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="weather-stub", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubWeatherServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def make_provider(name: str = WEATHER_PROVIDER) -> WeatherProvider:
+    """依名稱建立資料來源"""
+    if name == "http":
+        return HttpWeatherProvider()
+    if name == "stub":
+        # 在本機啟動假 API（與行程同生命週期），走與正式環境相同的 HTTP 請求與解析流程
+        return HttpWeatherProvider(StubWeatherServer().start().url)
+    return FileWeatherProvider()
+
+
+class WeatherSnapshot:
+    """
+    單一版本的天氣資料（建立後不再修改）
+    """
+
+    def __init__(self, districts: Dict[str, DistrictWeather], source: str = ""):
+        self.districts = districts
+        self.source = source
+        self.fetched_at = time.time()
+        # 行政區 × 整點 × 欄位的預報矩陣，於載入時（背景執行緒）預先建立
+        self.forecast = ForecastMatrix.from_districts(districts)
+
+    @classmethod
+    def empty(cls) -> "WeatherSnapshot":
+        return cls({}, source="")
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class WeatherRepository:
+    """
+    行程共用的天氣資料來源
+    """
+
+    def __init__(self, provider: Optional[WeatherProvider] = None, ttl: float = WEATHER_TTL):
+        """
+        Args:
+            provider: 資料來源，預設依 WEATHER_PROVIDER 環境變數建立
+            ttl: 快照有效秒數
+        """
+        self.provider = provider or make_provider()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # 下次需要更新的時間（monotonic 秒）
+        self._refresh_due = 0.0
+        # 第一份快照由內附的本機檔案建立（不連網）；資料來源的更新一律在背景進行
+        self._current = self._seed()
+        if isinstance(self.provider, FileWeatherProvider) and self.provider.path == Path(DEFAULT_WEATHER_JSON):
+            if self._current.districts:
+                self._refresh_due = time.monotonic() + self.ttl
+        else:
+            self.refresh()
+
+    def _seed(self) -> WeatherSnapshot:
+        """由內附檔案建立初始快照；讀取失敗時使用空快照"""
+        try:
+            districts = FileWeatherProvider().fetch()
+            return WeatherSnapshot(districts, source=FileWeatherProvider.name) if districts else WeatherSnapshot.empty()
+        except Exception as e:
+            print(f"❌ 讀取內附天氣資料發生錯誤: {e}")
+            return WeatherSnapshot.empty()
+
+    def current(self) -> WeatherSnapshot:
+        """
+        目前的快照
+
+        過期時仍立即回傳，並在背景啟動更新。
+        """
+        snapshot = self._current
+        if time.monotonic() >= self._refresh_due:
+            self.refresh()
+        return snapshot
+
+    def refresh(self, wait: bool = False) -> Optional[threading.Thread]:
+        """
+        向資料來源更新快照
+
+        若已有更新正在進行則直接略過；更新失敗時保留舊快照。
+
+        Args:
+            wait: 是否等待更新完成
+
+        Returns:
+            執行更新的執行緒；略過時回傳 None
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return None
+
+        def run():
+            try:
+                districts = self.provider.fetch()
+                if not districts:
+                    raise ValueError("資料中沒有任何行政區")
+                snapshot = WeatherSnapshot(districts, source=self.provider.name)
+                with self._lock:
+                    self._current = snapshot
+                    self._refresh_due = time.monotonic() + self.ttl
+                print(f"✅ 天氣資料已更新（{len(districts)} 個行政區，來源 {self.provider.name}）")
+            except Exception as e:
+                print(f"❌ 更新天氣資料發生錯誤: {e}")
+                # 保留舊快照，稍後再試，避免每次讀取都重新觸發
+                with self._lock:
+                    self._refresh_due = time.monotonic() + min(self.ttl, 60.0)
+            finally:
+                self._refresh_lock.release()
+
+        thread = threading.Thread(target=run, name="weather-refresh", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+
+_shared_repository = None
+_shared_repository_lock = threading.Lock()
+
+
+def get_weather_repository() -> WeatherRepository:
+    """取得行程共用的 WeatherRepository（執行緒安全）"""
+    global _shared_repository
+    if _shared_repository is None:
+        with _shared_repository_lock:
+            if _shared_repository is None:
+                _shared_repository = WeatherRepository()
+    return _shared_repository